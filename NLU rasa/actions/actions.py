@@ -5,11 +5,42 @@ from rasa_sdk import Action, Tracker
 from rasa_sdk.executor import CollectingDispatcher
 import json
 import os
+import sys
 
-# Load health data
+# The fuzzy disease index is shared with the Flask webhooks at the project root.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from disease_index import build_disease_index
+from knowledge_snapshot import DerivedStore
+
+def build_knowledge(health_data):
+    """Returns (health data, fuzzy disease index) for the actions."""
+    return health_data, build_disease_index(health_data.get("diseases", {}))
+
+# Load health data from the knowledge snapshot shared with the Flask apps, and
+# rebuild the disease index whenever the snapshot changes version. Fall back to
+# the local copy if the project files are not available.
 DATA_PATH = os.path.join(os.path.dirname(__file__), '../diseases.json')
-with open(DATA_PATH, 'r', encoding='utf-8') as f:
-    HEALTH_DATA = json.load(f)
+LOCAL_KNOWLEDGE = None
+try:
+    KNOWLEDGE = DerivedStore(lambda snapshot: build_knowledge(snapshot['health']), name='action knowledge')
+except (OSError, ValueError, KeyError, TypeError) as e:
+    print(f"Knowledge snapshot unavailable ({e}); using {DATA_PATH}")
+    KNOWLEDGE = None
+    with open(DATA_PATH, 'r', encoding='utf-8') as f:
+        LOCAL_KNOWLEDGE = build_knowledge(json.load(f))
+
+def current_knowledge():
+    """Returns (health data, disease index) for the latest knowledge version."""
+    return KNOWLEDGE.current() if KNOWLEDGE is not None else LOCAL_KNOWLEDGE
+
+def resolve_disease(disease, health_data, disease_index):
+    """Maps the extracted disease slot, possibly misspelled or transliterated, to a key in health_data."""
+    if not disease or disease in health_data.get("diseases", {}):
+        return disease
+    for key, _, _ in disease_index.lookup(disease):
+        if key in health_data.get("diseases", {}):
+            return key
+    return disease
 
 class ActionDiseaseSymptoms(Action):
     def name(self) -> Text:
@@ -18,9 +49,10 @@ class ActionDiseaseSymptoms(Action):
     def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
-        disease = tracker.get_slot("disease")
+        health_data, disease_index = current_knowledge()
+        disease = resolve_disease(tracker.get_slot("disease"), health_data, disease_index)
         language = tracker.get_slot("language") or "en"
-        symptoms = HEALTH_DATA.get("diseases", {}).get(disease, {}).get("symptoms", {}).get(language)
+        symptoms = health_data.get("diseases", {}).get(disease, {}).get("symptoms", {}).get(language)
         if symptoms:
             dispatcher.utter_message(text="\n".join(symptoms))
         else:
@@ -38,9 +70,10 @@ class ActionDiseasePrevention(Action):
     def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
-        disease = tracker.get_slot("disease")
+        health_data, disease_index = current_knowledge()
+        disease = resolve_disease(tracker.get_slot("disease"), health_data, disease_index)
         language = tracker.get_slot("language") or "en"
-        prevention = HEALTH_DATA.get("diseases", {}).get(disease, {}).get("preventions", {}).get(language)
+        prevention = health_data.get("diseases", {}).get(disease, {}).get("preventions", {}).get(language)
         if prevention:
             dispatcher.utter_message(text="\n".join(prevention))
         else:
@@ -60,7 +93,8 @@ class ActionGeneralInstruction(Action):
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         instruction_type = tracker.get_slot("instruction_type")  # hygiene, vaccination, doctor_consultation
         language = tracker.get_slot("language") or "en"
-        instruction = HEALTH_DATA.get("general_instructions", {}).get(instruction_type, {}).get(language)
+        health_data, _ = current_knowledge()
+        instruction = health_data.get("general_instructions", {}).get(instruction_type, {}).get(language)
         if instruction:
             dispatcher.utter_message(text=instruction)
         else:
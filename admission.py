@@ -0,0 +1,176 @@
+# admission.py
+#
+# Admission control in front of the /webhook of app.py and app1.py.
+#
+# Nothing used to stop one chatty or abusive number from triggering a model
+# call per message, or a traffic spike from piling up unbounded numbers of
+# handler threads. Every inbound message now passes two checks before it is
+# handled:
+#
+#   - a token bucket per sender (the From number): ADMISSION_SENDER_RATE
+#     messages per minute, with bursts of up to ADMISSION_SENDER_BURST. The
+#     buckets live in an LRU bounded to ADMISSION_MAX_SENDERS numbers, so a
+#     flood of distinct numbers cannot exhaust memory. A sender evicted from
+#     it simply starts again with a full bucket;
+#   - a limit of ADMISSION_MAX_CONCURRENCY messages handled at once per
+#     process. Up to ADMISSION_MAX_QUEUE more wait at most
+#     ADMISSION_QUEUE_TIMEOUT seconds for a slot.
+#
+# A message that fails either check is not handled. It gets a canned TwiML
+# reply built once at import. A throttled sender is told to slow down once,
+# and their further messages get an empty reply until a token is free again,
+# so an abusive number does not cost an outbound message per request. A shed
+# message gets a busy notice. These replies are raised as
+# message_dedup.Uncached, so the deduplicator does not replay them to
+# Twilio's retries of the message.
+#
+# The limits are per process. Under gunicorn, a sender's messages are spread
+# over the workers, so the effective per-sender rate is up to the number of
+# workers times the configured one.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from xml.sax.saxutils import escape
+
+from message_dedup import EMPTY_TWIML, Uncached
+from metrics import count
+
+ADMISSION_SENDER_RATE = float(os.getenv('ADMISSION_SENDER_RATE', '10'))
+ADMISSION_SENDER_BURST = float(os.getenv('ADMISSION_SENDER_BURST', '5'))
+ADMISSION_MAX_SENDERS = int(os.getenv('ADMISSION_MAX_SENDERS', '20000'))
+
+ADMISSION_MAX_CONCURRENCY = int(os.getenv('ADMISSION_MAX_CONCURRENCY', '16'))
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', '16'))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '2'))
+
+THROTTLED_MESSAGE = "You're sending messages faster than we can answer them. Please wait a minute and try again."
+SHED_MESSAGE = "We're receiving a lot of messages right now. Please try again in a minute."
+
+
+def _twiml(text):
+    return f'<?xml version="1.0" encoding="UTF-8"?><Response><Message><Body>{escape(text)}</Body></Message></Response>'
+
+
+THROTTLED_TWIML = _twiml(THROTTLED_MESSAGE)
+SHED_TWIML = _twiml(SHED_MESSAGE)
+
+
+class AdmissionController:
+    """Per-sender rate limits and a global concurrency limit for webhook handlers."""
+
+    def __init__(self, sender_rate=ADMISSION_SENDER_RATE, sender_burst=ADMISSION_SENDER_BURST,
+                 max_senders=ADMISSION_MAX_SENDERS, max_concurrency=ADMISSION_MAX_CONCURRENCY,
+                 max_queue=ADMISSION_MAX_QUEUE, queue_timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.rate = sender_rate / 60.0
+        self.burst = sender_burst
+        self.max_senders = max_senders
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        # sender -> [tokens, last update (monotonic), told to slow down]
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+        self._counters = {'admitted': 0, 'throttled': 0, 'throttle_notices': 0, 'shed_queue_full': 0,
+                          'shed_timeout': 0, 'evicted': 0}
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+        count('admission', result=counter)
+
+    # --- Per-sender buckets ---
+
+    def _take_token(self, sender):
+        """
+        Takes a token from sender's bucket. Returns 'ok', or 'notify' for the
+        first refusal since the sender last got a token, or 'drop' after that.
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(sender)
+            if bucket is None:
+                bucket = self._buckets[sender] = [self.burst, now, False]
+                if len(self._buckets) > self.max_senders:
+                    self._buckets.popitem(last=False)
+                    self._counters['evicted'] += 1
+            else:
+                self._buckets.move_to_end(sender)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                bucket[2] = False
+                return 'ok'
+            if bucket[2]:
+                return 'drop'
+            bucket[2] = True
+            return 'notify'
+
+    # --- Global limit ---
+
+    def _acquire(self):
+        """Takes a handler slot, waiting in the bounded queue if needed. Returns the shed reason or None."""
+        with self._condition:
+            if self._in_flight < self.max_concurrency:
+                self._in_flight += 1
+                return None
+            if self._waiting >= self.max_queue:
+                return 'shed_queue_full'
+            self._waiting += 1
+            try:
+                admitted = self._condition.wait_for(lambda: self._in_flight < self.max_concurrency,
+                                                    timeout=self.queue_timeout)
+            finally:
+                self._waiting -= 1
+            if not admitted:
+                return 'shed_timeout'
+            self._in_flight += 1
+            return None
+
+    def _release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+
+    # --- Public API ---
+
+    def handle(self, sender, handler):
+        """
+        Returns handler()'s TwiML if the message from sender is admitted. If
+        the sender is over its rate or the process is overloaded, raises
+        Uncached with a canned TwiML reply, which MessageDeduplicator.handle()
+        returns without recording it. Messages without a sender skip the
+        per-sender check.
+        """
+        if sender:
+            decision = self._take_token(sender)
+            if decision != 'ok':
+                self._count('throttled')
+                if decision == 'notify':
+                    self._count('throttle_notices')
+                    raise Uncached(THROTTLED_TWIML)
+                raise Uncached(EMPTY_TWIML)
+
+        shed = self._acquire()
+        if shed:
+            self._count(shed)
+            raise Uncached(SHED_TWIML)
+        try:
+            self._count('admitted')
+            return handler()
+        finally:
+            self._release()
+
+    def stats(self):
+        """Returns admission counters, the current load and the number of tracked senders."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['senders'] = len(self._buckets)
+        with self._condition:
+            stats.update({'in_flight': self._in_flight, 'waiting': self._waiting})
+        return stats
@@ -0,0 +1,260 @@
+# answer_cache.py
+#
+# Cache of model answers for app1.py, keyed on what a question asks rather
+# than how it is written.
+#
+# Most traffic is the same few questions ("dengue symptoms", "polio vaccine
+# schedule") in three languages, and each one used to cost a full model
+# round-trip. A question's fingerprint is its sorted set of content words:
+# lower-cased, split with the script-aware tokenizer, without stopwords or
+# language names, with transliteration variants folded (disease_index.normalize)
+# and plurals stripped. Given a DiseaseIndex, disease names are replaced by
+# their canonical key, which also folds misspellings ("dengu", "dengue fever").
+# "What are the symptoms of Dengue?" and "dengu symptom" therefore share one
+# entry. The language is part of the key, because the model answers in the
+# user's language.
+#
+# When no entry has the exact fingerprint, the closest entry in the same
+# language is used if the cosine similarity of their word sets reaches
+# CACHE_SIMILARITY. The default allows one extra word in a four-word
+# question, but never lets "hepatitis a" match "hepatitis b". Set it to 1 to
+# allow exact fingerprints only. Negations and modal words ("not", "never",
+# "should", "can", "safe", "avoid") are kept in the fingerprint and must be
+# the same in both questions, because they change what the question asks:
+# "should i take aspirin for dengue" is not "is it safe to take aspirin for
+# dengue", and "can diabetics not eat rice" is not "can diabetics eat rice".
+# Negations are folded to "not", so "don't" and "do not" still agree.
+#
+# Entries expire after CACHE_TTL seconds and the least recently used are
+# evicted beyond CACHE_MAX_ENTRIES. The whole cache is dropped when the
+# knowledge snapshot changes version, so answers never outlive the data they
+# were generated from. Turns that depend on the conversation ("what about
+# prevention?", "yes", "is it contagious?") bypass the cache; see
+# is_self_contained().
+
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from disease_index import normalize
+from matcher import tokenize
+from metrics import count
+from retrieval import LANGUAGE_WORDS, STOPWORDS
+
+CACHE_TTL = float(os.getenv('CACHE_TTL', '21600'))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '2000'))
+CACHE_SIMILARITY = float(os.getenv('CACHE_SIMILARITY', '0.85'))
+
+# Words that say nothing about what is being asked, on top of retrieval.STOPWORDS.
+# "a" is kept: it tells hepatitis A from hepatitis B.
+CACHE_STOPWORDS = (STOPWORDS - {'a'}) | frozenset(
+    'all any are details explain give information info know list some there want would '
+    'का की के को क्या है हैं में बताएं बताइए बताओ '
+    'କଣ ର ଅଛି କୁହ'.split()
+)
+
+# Negations, folded to one term. "t" is what is left of "n't" after tokenizing ("can't" -> "can", "t").
+NEGATION_WORDS = frozenset(
+    'not no never nor cannot t nahi nahin '
+    'नहीं नही न मत '
+    'ନାହିଁ ନାହି ନା'.split()
+)
+NEGATION_TERM = 'not'
+
+# Modal and safety words, which turn a question about a fact into one about what to do.
+MODAL_WORDS = frozenset(
+    'can could may might must shall should ought need safe unsafe avoid allowed harmful dangerous '
+    'चाहिए सकते सकता सकती सुरक्षित '
+    'ଉଚିତ ପାରିବ ପାରିବେ ସୁରକ୍ଷିତ'.split()
+)
+
+# Fingerprint terms a near-duplicate must share exactly.
+POLARITY_TERMS = MODAL_WORDS | {NEGATION_TERM}
+
+# Words that refer back to earlier turns. A question containing one depends on the conversation.
+REFERRING_WORDS = frozenset(
+    'it its this that these those them they he she him her his their above previous same else '
+    'यह वह इसके उसके इसका उसका इसे उसे '
+    'ଏହା ସେହି ଏହାର'.split()
+)
+
+# Openings that continue the previous turn ("and prevention?", "so what should I do").
+FOLLOW_UP_OPENERS = frozenset('and also so then but ok okay yes no what about'.split())
+
+
+def fingerprint_terms(text, disease_index=None):
+    """Returns the normalised content words of a question, as a sorted tuple."""
+    tokens = tokenize(text)
+    terms = set()
+    if disease_index is not None:
+        for match in disease_index.find(text):
+            # A fuzzy match may absorb a neighbouring word ("hepatitis a" -> "hepatitis"); keep those words.
+            if match.end - match.start != len(match.term.split()):
+                continue
+            terms.add(match.key)
+            tokens[match.start:match.end] = [''] * (match.end - match.start)
+    for token in tokens:
+        if token in NEGATION_WORDS:
+            terms.add(NEGATION_TERM)
+            continue
+        if token in MODAL_WORDS:
+            terms.add(token)
+            continue
+        if not token or token in CACHE_STOPWORDS or token in LANGUAGE_WORDS:
+            continue
+        term = normalize(token)
+        if term.isascii() and len(term) > 3 and term.endswith('s') and not term.endswith('ss'):
+            term = term[:-1]
+        terms.add(term)
+    return tuple(sorted(terms))
+
+
+def is_self_contained(text, chat_history, names_topic):
+    """
+    True if a question can be answered without the conversation before it.
+    With earlier turns, the question must also name its topic (names_topic),
+    so replies to clarifying questions ("3 days", "my son") are not cached.
+    """
+    tokens = tokenize(text)
+    if not tokens or any(token in REFERRING_WORDS for token in tokens):
+        return False
+    if chat_history:
+        return names_topic and tokens[0] not in FOLLOW_UP_OPENERS
+    return True
+
+
+class AnswerCache:
+    """An LRU and TTL-bounded cache of answers, keyed on (language, fingerprint) and one knowledge version."""
+
+    def __init__(self, disease_index=None, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES,
+                 similarity=CACHE_SIMILARITY):
+        self.disease_index = disease_index
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # language -> term -> keys of the entries containing it, for near-duplicate lookups
+        self._postings = defaultdict(lambda: defaultdict(set))
+        self._version = None
+        self._counters = {'hits': 0, 'near_hits': 0, 'misses': 0, 'bypassed': 0,
+                          'stored': 0, 'evicted': 0, 'invalidated': 0}
+        self._saved_seconds = 0.0
+
+    # --- Entries ---
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self._counters['invalidated'] += 1
+            self._entries.clear()
+            self._postings.clear()
+            self._version = version
+
+    def _remove(self, key):
+        language, terms = key
+        self._entries.pop(key, None)
+        postings = self._postings[language]
+        for term in terms:
+            keys = postings.get(term)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del postings[term]
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now > entry[0]:
+            self._remove(key)
+            return None
+        return entry
+
+    def _nearest(self, language, terms, now):
+        """
+        Returns the key of the most similar entry in language at or above the
+        threshold with the same negations and modal words, or None.
+        """
+        if self.similarity >= 1 or not terms:
+            return None
+        postings = self._postings.get(language)
+        if not postings:
+            return None
+        polarity = POLARITY_TERMS.intersection(terms)
+        shared = defaultdict(int)
+        for term in terms:
+            for key in postings.get(term, ()):
+                shared[key] += 1
+        best, best_score = None, self.similarity
+        for key, count in shared.items():
+            score = count / (len(terms) * len(key[1])) ** 0.5
+            if score < best_score or POLARITY_TERMS.intersection(key[1]) != polarity:
+                continue
+            if self._live(key, now) is not None:
+                best, best_score = key, score
+        return best
+
+    # --- Public API ---
+
+    def get(self, text, language, version, disease_index=None):
+        """
+        Returns the cached answer for a question, or None. disease_index, if
+        given, replaces the cache's own for this call, so that the index built
+        from the same knowledge version is used.
+        """
+        key = (language, fingerprint_terms(text, self.disease_index if disease_index is None else disease_index))
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+            counter = 'hits'
+            if self._live(key, now) is None:
+                key = self._nearest(language, key[1], now)
+                counter = 'near_hits'
+            if key is None:
+                self._counters['misses'] += 1
+                answer = None
+            else:
+                self._entries.move_to_end(key)
+                _, answer, latency = self._entries[key]
+                self._counters[counter] += 1
+                self._saved_seconds += latency
+        count('answer_cache', result='miss' if key is None else counter[:-1])
+        if answer is not None:
+            count('answer_cache_saved_seconds', latency)
+        return answer
+
+    def put(self, text, language, version, answer, latency, disease_index=None):
+        """Stores an answer that took latency seconds to generate; disease_index is as in get()."""
+        key = (language, fingerprint_terms(text, self.disease_index if disease_index is None else disease_index))
+        if not key[1]:
+            return
+        with self._lock:
+            self._check_version(version)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + self.ttl, answer, latency)
+            for term in key[1]:
+                self._postings[language][term].add(key)
+            self._counters['stored'] += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._counters['evicted'] += 1
+
+    def bypass(self):
+        """Counts a question that was not looked up because it depends on the conversation."""
+        with self._lock:
+            self._counters['bypassed'] += 1
+        count('answer_cache', result='bypass')
+
+    def stats(self):
+        """Returns hit, miss and bypass counters, the hit rate, and the model time saved by hits."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._entries)
+            saved = self._saved_seconds
+        lookups = stats['hits'] + stats['near_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['near_hits']) / lookups, 3) if lookups else 0.0
+        stats['saved_seconds'] = round(saved, 1)
+        return stats
@@ -1,9 +1,17 @@
-import json
 import os
 from flask import Flask, request, jsonify, render_template, flash, redirect, url_for
-from twilio.rest import Client
 from twilio.twiml.messaging_response import MessagingResponse
 from dotenv import load_dotenv
+from app_factory import finish_startup
+from admission import AdmissionController
+from conversation_log import ConversationLogger
+from delivery_status import DeliveryStatusRecorder, is_signed_callback
+from message_dedup import MessageDeduplicator
+from metrics import instrument, stage
+from responses import ResponseStore
+from subscribers import add_subscriber, count_subscribers
+from symptom_ranker import candidate_count
+from broadcast_engine import BroadcastEngine, LazyTwilioClient, twilio_sender
 
 # Load environment variables from .env file
 load_dotenv()
@@ -11,19 +19,26 @@ load_dotenv()
 # Initialize the Flask application
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.urandom(24)
+# Per-request stage timings, latency histograms and counters, served at /metrics.
+instrument(app)
 
 # --- Load Data and Configuration ---
 
-with open('diseases.json') as f:
-    diseases_data = json.load(f)
+# Canned replies are rendered once from diseases.json, basic-first-aid-emergency.json
+# and vaccination.json, and rebuilt in the background when those files change.
+RESPONSES = ResponseStore()
 
-with open('basic-first-aid-emergency.json') as f:
-    first_aid_data = json.load(f)
+# Inbound messages and replies are appended to logs/ by a background writer (conversation_log.py).
+CONVERSATION_LOG = ConversationLogger()
 
-with open('vaccination.json') as f:
-    vaccination_data = json.load(f)
+# Twilio retries slow webhooks with the same MessageSid; a retry gets the original reply.
+DEDUP = MessageDeduplicator()
 
-SUBSCRIBERS_FILE = 'broadcast_subscribers.json'
+# Per-sender rate limits and a cap on messages handled at once; excess gets a canned reply (admission.py).
+ADMISSION = AdmissionController()
+
+# Delivery-status callbacks for broadcasts are queued and written to SQLite in batches (delivery_status.py).
+DELIVERY_STATUS = DeliveryStatusRecorder()
 
 # Load Twilio credentials from environment variables
 ACCOUNT_SID = os.getenv("ACCOUNT_SID")
@@ -35,43 +50,10 @@ TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
 if not ACCOUNT_SID or not AUTH_TOKEN:
     print("ERROR: Twilio credentials ACCOUNT_SID and AUTH_TOKEN must be set in the environment.")
 else:
-    client = Client(ACCOUNT_SID, AUTH_TOKEN)
-
-# --- Helper Functions ---
-
-def get_subscribers():
-    """Reads the list of subscribers from the JSON file."""
-    if not os.path.exists(SUBSCRIBERS_FILE):
-        return []
-    try:
-        with open(SUBSCRIBERS_FILE, 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
-
-def add_subscriber(number):
-    """
-    Adds a new subscriber to the list, avoiding duplicates.
-    Returns True if the subscriber is new, False otherwise.
-    """
-    subscribers = get_subscribers()
-    if number not in subscribers:
-        subscribers.append(number)
-        with open(SUBSCRIBERS_FILE, 'w') as f:
-            json.dump(subscribers, f, indent=4)
-        return True  # This is a new subscriber
-    return False # This is an existing subscriber
-
-def get_welcome_message():
-    """Generates the welcome message text with the menu."""
-    response_text = "Welcome to the Health Chatbot!\n"
-    response_text += "You can ask me about:\n"
-    response_text += "- A specific disease (e.g., 'malaria')\n"
-    response_text += "- Vaccination information\n"
-    response_text += "- First aid for a condition\n"
-    response_text += "- Emergency contacts\n"
-    response_text += "- Nearby hospitals or clinics"
-    return response_text
+    # Built on first use in each process (see LazyTwilioClient), so startup does not import the SDK.
+    client = LazyTwilioClient(ACCOUNT_SID, AUTH_TOKEN)
+    # Broadcasts run as background jobs; progress is shared through SQLite so any worker can report it.
+    broadcast_engine = BroadcastEngine(twilio_sender(client, f"whatsapp:{TWILIO_PHONE_NUMBER}"))
 
 # --- Core Chatbot & API Routes ---
 
@@ -82,11 +64,26 @@ def hello():
 
 @app.route('/status')
 def status():
-    return jsonify({"status": "OK"})
+    return jsonify({
+        "status": "OK",
+        "dedup": DEDUP.stats(),
+        "admission": ADMISSION.stats(),
+        "conversation_log": CONVERSATION_LOG.stats(),
+        "delivery_status": DELIVERY_STATUS.stats(),
+    })
 
 @app.route('/webhook', methods=['POST'])
 def webhook():
-    """Handles incoming WhatsApp messages from Twilio."""
+    """Handles incoming WhatsApp messages from Twilio, once per MessageSid."""
+    with stage('webhook'):
+        return DEDUP.handle(request.values.get('MessageSid'), admit_message)
+
+def admit_message():
+    """Runs handle_message() unless the sender is over its rate limit or the bot is overloaded."""
+    return ADMISSION.handle(request.values.get('From', ''), handle_message)
+
+def handle_message():
+    """Builds the TwiML reply for the message in the current request."""
     resp = MessagingResponse()
     msg = resp.message()
     
@@ -95,117 +92,87 @@ def webhook():
     if from_number:
         is_new_user = add_subscriber(from_number)
 
+    table = RESPONSES.current()
+    incoming_msg = request.values.get('Body', '')
+    CONVERSATION_LOG.log('message', user=from_number, text=incoming_msg, sid=request.values.get('MessageSid'))
+
     # If it's a new user, send the welcome message regardless of their input
     if is_new_user:
-        msg.body(get_welcome_message())
+        reply, source = table.reply('greet'), 'welcome'
     else:
-        # For existing users, process their message as usual
-        incoming_msg = request.values.get('Body', '').lower()
-
-        if 'hi' in incoming_msg or 'hello' in incoming_msg:
-            msg.body(get_welcome_message())
-
-        elif 'hospital' in incoming_msg or 'clinic' in incoming_msg or 'health center' in incoming_msg:
-            response_text = "To find a hospital or health center near you, open this link on your phone:\n\n"
-            response_text += "https://www.google.com/maps/search/?api=1&query=hospital+near+me"
-            msg.body(response_text)
-        
-        elif 'vaccine' in incoming_msg or 'vaccination' in incoming_msg:
-            response_text = "Here is the vaccination information:\n\n"
-            for vaccine in vaccination_data['vaccination_schedule']:
-                response_text += f"*Vaccine:* {vaccine['vaccine_name']}\n"
-                response_text += f"*Prevents:* {vaccine['disease_prevented']}\n"
-                response_text += f"*Schedule:* {vaccine['schedule']}\n\n"
-            msg.body(response_text)
-
-        elif 'first aid' in incoming_msg:
-            found = False
-            for condition in first_aid_data['first_aid']:
-                if condition['condition'].lower() in incoming_msg:
-                    response_text = f"First aid for {condition['condition']}:\n"
-                    for step in condition['steps']:
-                        response_text += f"- {step}\n"
-                    if 'warning' in condition:
-                        response_text += f"\n*Warning:* {condition['warning']}"
-                    msg.body(response_text)
-                    found = True
-                    break
-            if not found:
-                response_text = "What first aid information do you need?\n"
-                for condition in first_aid_data['first_aid']:
-                    response_text += f"- {condition['condition']}\n"
-                msg.body(response_text)
-
-        elif 'emergency' in incoming_msg or 'emergency contacts' in incoming_msg:
-            response_text = "*Emergency Contacts:*\n"
-            for contact in first_aid_data['emergency_contacts']:
-                response_text += f"- {contact['service']}: {contact['number']}\n"
-            msg.body(response_text)
-
-        else:
-            found_disease = False
-            for disease in diseases_data['disease_symptoms']:
-                if disease['disease_name'].lower() in incoming_msg:
-                    response_text = f"*About {disease['disease_name']}:*\n"
-                    response_text += "\n*Common Symptoms:*\n"
-                    for symptom in disease['common_symptoms']:
-                        response_text += f"- {symptom}\n"
-                    response_text += "\n*Prevention Methods:*\n"
-                    for category in disease['prevention_methods']:
-                        response_text += f"  *{category['category']}:*\n"
-                        for method in category['methods']:
-                            response_text += f"  - {method}\n"
-                    msg.body(response_text)
-                    found_disease = True
-                    break
-            if not found_disease:
-                fallback_message = "I'm sorry, I don't understand. Say 'hi' for the main menu. You can also ask for 'nearby hospitals'."
-                msg.body(fallback_message)
-
-    return str(resp)
+        # For existing users, route their message to one of the precomputed replies
+        with stage('route'):
+            reply, source = table.respond(incoming_msg), 'keyword'
+    msg.body(reply)
+    CONVERSATION_LOG.log('reply', user=from_number, text=reply, source=source)
+
+    with stage('twiml'):
+        return str(resp)
+
+@app.route('/rank-symptoms', methods=['GET', 'POST'])
+def rank_symptoms():
+    """Ranks diseases for the symptoms in ?q= (or a JSON body's "message") and returns them as JSON."""
+    message = request.values.get('q') or (request.get_json(silent=True) or {}).get('message', '')
+    ranker = RESPONSES.current().symptoms
+    return jsonify({
+        "symptoms": ranker.symptoms(message),
+        "candidates": [c._asdict() for c in ranker.rank(message, k=candidate_count(request.values.get('k')))],
+    })
 
 # --- Web Broadcast Routes ---
 
 @app.route('/broadcast', methods=['GET'])
 def show_broadcast_form():
-    """Displays the HTML form for sending a broadcast.""" 
-    return render_template('broadcast.html')
+    """Displays the HTML form for sending a broadcast, plus the progress of a started job.""" 
+    return render_template('broadcast.html', job_id=request.args.get('job_id'))
 
 @app.route('/send-broadcast', methods=['POST'])
 def handle_send_broadcast():
-    """Handles the form submission and sends the broadcast message."""
+    """Handles the form submission and starts a background broadcast job."""
     broadcast_message = request.form.get('message')
     if not broadcast_message:
         flash('Message cannot be empty.', 'error')
         return redirect(url_for('show_broadcast_form'))
 
-    subscribers = get_subscribers()
-    if not subscribers:
+    if not count_subscribers():
         flash('There are no subscribers to send a message to.', 'error')
         return redirect(url_for('show_broadcast_form'))
 
-    sent_count = 0
-    failed_count = 0
-
     # Ensure the client is initialized before trying to use it
     if 'client' not in globals():
         flash('Twilio client is not configured. Check environment variables.', 'error')
         return redirect(url_for('show_broadcast_form'))
 
-    for number in subscribers:
-        try:
-            client.messages.create(
-                body=broadcast_message,
-                from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
-                to=number
-            )
-            sent_count += 1
-        except Exception as e:
-            print(f"Failed to send to {number}: {e}")
-            failed_count += 1
-
-    flash(f'Broadcast sent! Messages sent: {sent_count}. Failed: {failed_count}.', 'success')
-    return redirect(url_for('show_broadcast_form'))
+    job_id = broadcast_engine.start(broadcast_message)
+    flash(f'Broadcast started (job {job_id}). Progress is shown below.', 'success')
+    return redirect(url_for('show_broadcast_form', job_id=job_id))
+
+@app.route('/broadcast-status/<job_id>')
+def broadcast_status(job_id):
+    """Returns the live progress of a broadcast job as JSON."""
+    if 'client' not in globals():
+        return jsonify({"error": "Twilio client is not configured."}), 503
+    progress = broadcast_engine.progress(job_id)
+    if progress is None:
+        return jsonify({"error": "Unknown broadcast job."}), 404
+    return jsonify(progress)
+
+@app.route('/message-status', methods=['POST'])
+def message_status():
+    """Receives Twilio's delivery-status callbacks for broadcast messages; they are stored in the background."""
+    if not is_signed_callback(request.form, request.headers.get('X-Twilio-Signature', ''), AUTH_TOKEN):
+        return "", 403
+    if not DELIVERY_STATUS.record(request.form):
+        return "", 400
+    return "", 204
+
+def create_app():
+    """
+    Application factory for pre-forking servers: gunicorn -c gunicorn.conf.py 'app:create_app()'.
+    The app's state is built when the module is imported (in the master, with --preload); this
+    finishes startup and freezes that state so the workers share it (see app_factory.py).
+    """
+    return finish_startup(app)
 
 # --- Main Execution ---
 
@@ -1,36 +1,50 @@
 import os
-import json
-from flask import Flask, request, session, jsonify, render_template, flash, redirect, url_for
-from twilio.rest import Client
+import time
+from collections import namedtuple
+from contextlib import closing
+from flask import Flask, request, jsonify, render_template, flash, redirect, url_for
 from twilio.twiml.messaging_response import MessagingResponse
 from dotenv import load_dotenv
-from google import genai
+from answer_cache import AnswerCache, is_self_contained
+from admission import AdmissionController
+from app_factory import finish_startup
+from conversation_log import ConversationLogger
+from delivery_status import DeliveryStatusRecorder, is_signed_callback
+from conversations import ConversationStore
+from fast_path import FastPathResolver
+from intent_classifier import load_intent_classifier
+from knowledge_snapshot import DerivedStore
+from llm_gateway import LlmGateway, LlmUnavailable, create_genai_client
+from message_dedup import MessageDeduplicator
+from metrics import instrument, observe, stage
+from reply_chunker import ReplyChunker, split_message
+from reply_queue import KeyedReplyQueue
+from retrieval import Bm25Index, chunk_health_data, detect_language, render_context
+from subscribers import add_subscriber, count_subscribers
+from symptom_ranker import MIN_SYMPTOMS, SymptomRanker, candidate_count, load_symptom_profiles
+from broadcast_engine import BroadcastEngine, LazyTwilioClient, twilio_sender
 
 load_dotenv()
 
 app = Flask(__name__)
-# A secret key is required for Flask session management
+# A secret key is required for flashed messages on the broadcast page
 app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', os.urandom(24))
-
-# Load the health data from the JSON file
-try:
-    with open('finalData.json', 'r', encoding='utf-8') as f:
-        health_data = json.load(f)
-except FileNotFoundError:
-    print("ERROR: finalData.json not found. Please ensure the file exists.")
-    health_data = {}  # Default to empty dict to avoid crashing
+# Per-request stage timings, latency histograms and counters, served at /metrics.
+instrument(app)
 
 # Configure the Gemini API client
 api_key = os.getenv("GEMINI_API_KEY")
 if not api_key:
-    raise ValueError("GEMINI_API_KEY not found in .env file. Please set it.")
+    print("ERROR: GEMINI_API_KEY must be set in the environment. Until it is, answers come from the dataset.")
 
-client = genai.Client(api_key=api_key)
+# All model calls go through the gateway: one long-lived client per process,
+# built on first use, with a concurrency limit and a bounded wait queue,
+# per-call deadlines and a circuit breaker. When it cannot answer, the reply
+# falls back to the dataset.
+LLM = LlmGateway((lambda: create_genai_client(api_key)) if api_key else None)
 
 # --- Load Data and Configuration ---
 
-SUBSCRIBERS_FILE = 'broadcast_subscribers.json'
-
 # Load Twilio credentials from environment variables
 ACCOUNT_SID = os.getenv("ACCOUNT_SID")
 AUTH_TOKEN = os.getenv("AUTH_TOKEN")
@@ -41,15 +55,95 @@ TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
 if not ACCOUNT_SID or not AUTH_TOKEN:
     print("ERROR: Twilio credentials ACCOUNT_SID and AUTH_TOKEN must be set in the environment.")
 else:
-    twilio_client = Client(ACCOUNT_SID, AUTH_TOKEN)
-
-
-# Define the system prompt with the health data.
-SYSTEM_PROMPT = f"""
+    # Built on first use in each process (see LazyTwilioClient), so startup does not import the SDK.
+    twilio_client = LazyTwilioClient(ACCOUNT_SID, AUTH_TOKEN)
+    # Broadcasts run as background jobs; progress is shared through SQLite so any worker can report it.
+    broadcast_engine = BroadcastEngine(twilio_sender(twilio_client, f"whatsapp:{TWILIO_PHONE_NUMBER}"))
+
+
+# The intent classifier is trained from the Rasa NLU examples (see intent_classifier.py)
+# and recognises greetings that no keyword covers. The fast path only uses it to confirm
+# an aspect its keywords found, since it has no class for out-of-scope questions.
+INTENT_CLASSIFIER = load_intent_classifier()
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', '4'))
+
+# Everything built from the health data, for one knowledge snapshot version:
+#   health_index    the data split by disease, section and language, so each
+#                   prompt only carries the entries relevant to the question;
+#   fast_path       structured lookups ("symptoms of dengue in hindi") answered
+#                   straight from the data, so only open-ended conversation
+#                   goes to the model;
+#   symptom_ranker  symptom lists ("fever, joint pain and rash") ranked against
+#                   the knowledge base, so the model is handed the likely diseases.
+KnowledgeModels = namedtuple('KnowledgeModels',
+                             ['version', 'health_data', 'health_index', 'fast_path', 'symptom_ranker'])
+
+def build_knowledge_models(snapshot):
+    """Builds the retrieval index, fast path and symptom ranker for a knowledge snapshot."""
+    # The health data (finalData.json) is read from the shared, memory-mapped knowledge
+    # snapshot, so all workers use one page-cache copy instead of a parsed dict each.
+    health_data = snapshot['health']
+    return KnowledgeModels(
+        version=snapshot.version,
+        health_data=health_data,
+        health_index=Bm25Index(chunk_health_data(health_data)),
+        fast_path=FastPathResolver(health_data, classifier=INTENT_CLASSIFIER),
+        symptom_ranker=SymptomRanker(load_symptom_profiles(snapshot['diseases'], health_data)),
+    )
+
+# Rebuilt in the background when the knowledge files change, so edits reach
+# running workers without a restart.
+KNOWLEDGE = DerivedStore(build_knowledge_models, name='knowledge models')
+
+# Chat history lives on the server, keyed by the sender's WhatsApp number.
+CONVERSATIONS = ConversationStore()
+
+# With REPLY_MODE=async the webhook acknowledges Twilio immediately and model
+# answers are generated in the background and sent through the REST API.
+# REPLY_MODE=stream works the same way, but streams the model's answer and sends
+# it in WhatsApp-sized parts while it is still being generated (reply_chunker.py).
+REPLY_MODE = os.getenv('REPLY_MODE', 'sync')
+ASYNC_REPLIES = REPLY_MODE in ('async', 'stream')
+STREAM_REPLIES = REPLY_MODE == 'stream'
+REPLY_QUEUE = KeyedReplyQueue()
+BUSY_MESSAGE = "We're receiving a lot of messages right now. Please try again in a minute."
+
+# Used when the model cannot be reached: a note under a dataset answer, or the whole reply.
+FALLBACK_NOTE = ("(Our assistant is busy, so this answer comes straight from our health dataset. "
+                 "Please consult a qualified healthcare professional for a diagnosis.)")
+FALLBACK_MESSAGE = "I'm sorry, I can't answer that right now. Please try again in a few minutes."
+# Sent after the parts already delivered when a streamed answer breaks off.
+STREAM_INTERRUPTED_NOTE = "(Sorry, I couldn't finish this answer. Please ask again in a few minutes.)"
+
+# Every inbound message and reply is appended to logs/ by a background writer
+# (see conversation_log.py); logging never blocks the webhook.
+CONVERSATION_LOG = ConversationLogger()
+
+# Twilio retries slow webhooks with the same MessageSid. A retry waits for or
+# replays the original reply instead of calling the model again.
+DEDUP = MessageDeduplicator()
+
+# One number cannot trigger unlimited model calls, and a traffic spike cannot pile up
+# unbounded handler threads: each sender has a token bucket, and only so many messages
+# are handled at once. Messages over either limit get a canned reply (admission.py).
+ADMISSION = AdmissionController()
+
+# Twilio reports the delivery status of every broadcast message to /message-status.
+# The callbacks are acknowledged at once and written to SQLite in batches by a
+# background thread; numbers that keep failing are left out of later broadcasts.
+DELIVERY_STATUS = DeliveryStatusRecorder()
+
+# Self-contained questions ("dengue symptoms", "polio vaccine schedule") are
+# answered from a cache of earlier model answers, keyed on their content words
+# and language. It is dropped whenever the knowledge snapshot changes.
+ANSWER_CACHE = AnswerCache()
+
+# Define the system prompt. {context} is filled with the retrieved dataset entries.
+SYSTEM_PROMPT_TEMPLATE = """
 You are a compassionate and expert health assistant chatbot. Your goal is to help users understand their health concerns.
 
-You have access to a trusted dataset of health information:
-{json.dumps(health_data)}
+You have access to these entries from a trusted dataset of health information:
+{context}
 
 **Your Instructions:**
 
@@ -69,42 +163,144 @@ Add a clear disclaimer that the information is for informational purposes and co
 
 # --- Helper Functions ---
 
-def get_subscribers():
-    """Reads the list of subscribers from the JSON file."""
-    if not os.path.exists(SUBSCRIBERS_FILE):
-        return []
-    try:
-        with open(SUBSCRIBERS_FILE, 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
+def build_system_prompt(user_query, chat_history):
+    """Builds the system prompt with the top-k dataset entries for this turn."""
+    # Include the previous user turn so follow-ups like "and prevention?" keep their topic.
+    previous = [turn['parts'][0]['text'] for turn in chat_history if turn.get('role') == 'user'][-1:]
+    models = KNOWLEDGE.current()
+    # Add the canonical names of misspelled diseases so BM25 still finds their entries.
+    corrected = [m.key.replace('_', ' ') for m in models.fast_path.disease_index.find(user_query) if m.distance]
+    candidates = [c.name for c in models.symptom_ranker.rank(user_query, k=2, min_symptoms=MIN_SYMPTOMS)]
+    query = " ".join(previous + [user_query] + corrected + candidates)
+    results = models.health_index.search(query, k=RETRIEVAL_TOP_K, language=detect_language(user_query))
+    return SYSTEM_PROMPT_TEMPLATE.format(context=render_context(results))
+
+def names_topic(user_query):
+    """True if the message names a disease or lists enough symptoms to stand on its own."""
+    models = KNOWLEDGE.current()
+    return (bool(models.fast_path.disease_index.find(user_query))
+            or len(models.symptom_ranker.symptoms(user_query)) >= MIN_SYMPTOMS)
+
+def get_gemini_response(user_query, chat_history):
+    """Gets a response from the answer cache or the Gemini model, or a dataset answer if the model is unavailable."""
+    return answer_with_model(user_query, chat_history)[0]
 
-def add_subscriber(number):
+def send_parts(text, send):
+    """Sends a complete answer through send() in messages of at most 1600 characters."""
+    for part in split_message(text):
+        send(part)
+
+def answer_with_model(user_query, chat_history, send=None):
     """
-    Adds a new subscriber to the list, avoiding duplicates.
-    Returns True if the subscriber is new, False otherwise.
+    Returns (answer, source) for get_gemini_response(), where source is
+    'cache', 'llm' or 'fallback'. With send (stream reply mode), the answer is
+    also sent to the user through send(text): a model answer part by part as
+    it is generated, and source is 'partial' if the stream broke off.
     """
-    subscribers = get_subscribers()
-    if number not in subscribers:
-        subscribers.append(number)
-        with open(SUBSCRIBERS_FILE, 'w') as f:
-            json.dump(subscribers, f, indent=4)
-        return True  # This is a new subscriber
-    return False # This is an existing subscriber
+    language = detect_language(user_query)
+    # Only follow-up turns need the topic check, so first turns skip its cost.
+    cacheable = is_self_contained(user_query, chat_history, bool(chat_history) and names_topic(user_query))
+    models = KNOWLEDGE.current()
+    if cacheable:
+        with stage('answer_cache'):
+            cached = ANSWER_CACHE.get(user_query, language, models.version, models.fast_path.disease_index)
+        if cached is not None:
+            if send is not None:
+                send_parts(cached, send)
+            return cached, 'cache'
+    else:
+        ANSWER_CACHE.bypass()
 
-def get_gemini_response(user_query, chat_history):
-    """Gets a response from the Gemini model using a reconstructed chat session."""
+    with stage('prompt'):
+        system_prompt = build_system_prompt(user_query, chat_history)
+    start = time.monotonic()
     try:
-        chat_session = client.chats.create(
-            model='gemini-1.5-flash',
-            history=chat_history,
-            config={"system_instruction": SYSTEM_PROMPT}
-        )
-        response = chat_session.send_message(user_query)
-        return response.text
-    except Exception as e:
-        print(f"An error occurred while getting Gemini response: {e}")
-        return "I'm sorry, I encountered an error. Please try again later."
+        with stage('llm'):
+            if send is None:
+                answer, complete = LLM.generate(system_prompt, chat_history, user_query), True
+            else:
+                answer, complete = stream_model_answer(system_prompt, chat_history, user_query, send)
+    except LlmUnavailable as e:
+        print(f"Gemini unavailable ({e}), answering from the dataset")
+        answer = get_fallback_response(user_query)
+        if send is not None:
+            send_parts(answer, send)
+        return answer, 'fallback'
+    if not complete:
+        return answer, 'partial'
+    if cacheable:
+        ANSWER_CACHE.put(user_query, language, models.version, answer, time.monotonic() - start,
+                         models.fast_path.disease_index)
+    return answer, 'llm'
+
+def stream_model_answer(system_prompt, chat_history, user_query, send):
+    """
+    Streams the model's answer and sends it through send() in WhatsApp-sized
+    parts as they are completed. Returns (answer, complete). If the model
+    fails before the first part is sent, LlmUnavailable is raised so the
+    caller can fall back; after that, the user gets what was generated and a
+    note, and complete is False. The answer is only the model text the user
+    received, without the note, so it can go into the log and the history.
+    """
+    chunker = ReplyChunker()
+    pieces, sent = [], []
+    start = time.monotonic()
+
+    def deliver(messages):
+        for message in messages:
+            if not sent:
+                observe('stream_first_message_seconds', time.monotonic() - start)
+            send(message)
+            sent.append(message)
+
+    try:
+        with closing(LLM.stream(system_prompt, chat_history, user_query)) as stream:
+            for piece in stream:
+                pieces.append(piece)
+                deliver(chunker.feed(piece))
+    except LlmUnavailable as e:
+        if not sent:
+            raise
+        print(f"Gemini stream broke off ({e}) after {len(sent)} messages")
+        deliver(chunker.finish())
+        send(STREAM_INTERRUPTED_NOTE)
+        return "\n\n".join(sent), False
+    deliver(chunker.finish())
+    return ''.join(pieces), True
+
+def get_fallback_response(user_query):
+    """Answers from the best-matching dataset entry in the user's language, or with a canned reply."""
+    results = KNOWLEDGE.current().health_index.search(user_query, k=1, language=detect_language(user_query))
+    if not results:
+        return FALLBACK_MESSAGE
+    return f"{results[0][0].text}\n\n{FALLBACK_NOTE}"
+
+def log_reply(to_number, body, source):
+    """Records a reply in the conversation log; source says how it was produced."""
+    CONVERSATION_LOG.log('reply', user=to_number, text=body, source=source)
+
+def send_whatsapp_message(to_number, body):
+    """Sends a message to a user through the Twilio REST API."""
+    twilio_client.messages.create(body=body, from_=f"whatsapp:{TWILIO_PHONE_NUMBER}", to=to_number)
+
+def deliver_gemini_reply(from_number, incoming_msg):
+    """Generates a Gemini answer in the background and sends it to the user (async and stream reply modes)."""
+    history = CONVERSATIONS.get_history(from_number)
+    if STREAM_REPLIES:
+        send = lambda body: send_whatsapp_message(from_number, body)
+        response_text, source = answer_with_model(incoming_msg, history, send)
+    else:
+        response_text, source = answer_with_model(incoming_msg, history)
+        for part in split_message(response_text):
+            send_whatsapp_message(from_number, part)
+    log_reply(from_number, response_text, source)
+    CONVERSATIONS.append(from_number, incoming_msg, response_text)
+
+def deliver_local_reply(from_number, incoming_msg, response_text):
+    """Sends an already computed answer, queued behind the user's pending model replies."""
+    send_whatsapp_message(from_number, response_text)
+    log_reply(from_number, response_text, 'fast_path')
+    CONVERSATIONS.append(from_number, incoming_msg, response_text)
 
 @app.route('/')
 def hello():
@@ -112,24 +308,39 @@ def hello():
 
 @app.route('/webhook', methods=['POST'])
 def webhook():
-    """Handles incoming WhatsApp messages and manages the chat session."""
+    """Handles incoming WhatsApp messages, once per MessageSid."""
+    with stage('webhook'):
+        return DEDUP.handle(request.values.get('MessageSid'), admit_message)
+
+def admit_message():
+    """Runs handle_message() unless the sender is over its rate limit or the bot is overloaded."""
+    return ADMISSION.handle(request.values.get('From', ''), handle_message)
+
+def handle_message():
+    """Answers the message in the current request and manages the sender's conversation history."""
     incoming_msg = request.values.get('Body', '').strip()
     from_number = request.values.get('From', '')
     add_subscriber(from_number) # Add subscriber, ignore if they already exist
+    CONVERSATION_LOG.log('message', user=from_number, text=incoming_msg, sid=request.values.get('MessageSid'))
 
     resp = MessagingResponse()
     msg = resp.message()
 
-    chat_history = session.get('chat_history', [])
-    
     lower_incoming_msg = incoming_msg.lower()
 
     if lower_incoming_msg in ['clear', 'reset', 'start over']:
-        session.pop('chat_history', None)
+        CONVERSATIONS.clear(from_number)
         msg.body("Chat history cleared. How can I help you today?")
+        log_reply(from_number, "Chat history cleared. How can I help you today?", 'reset')
         return str(resp)
 
-    if lower_incoming_msg in ['hi', 'hello', 'menu', 'start']:
+    is_greeting = lower_incoming_msg in ['hi', 'hello', 'menu', 'start']
+    if not is_greeting and INTENT_CLASSIFIER is not None:
+        # Greetings in any language ("good morning", "नमस्ते") also get the menu.
+        with stage('intent'):
+            is_greeting = INTENT_CLASSIFIER.predict_one(incoming_msg, threshold=0.7).intent == 'greet'
+
+    if is_greeting:
         menu_text = (
             "Welcome to the Health Information Chatbot! How can I help you today?\n\n"
             "You can ask me about:\n"
@@ -140,64 +351,113 @@ def webhook():
             "Just type your question naturally, for example, 'What are the symptoms of tuberculosis?'"
         )
         msg.body(menu_text)
+        log_reply(from_number, menu_text, 'menu')
     else:
-        response_text = get_gemini_response(incoming_msg, chat_history)
+        with stage('fast_path'):
+            response_text = KNOWLEDGE.current().fast_path.answer(incoming_msg)
+
+        if ASYNC_REPLIES and 'twilio_client' in globals():
+            # Only queue when needed: model answers, or local answers that must not overtake pending ones.
+            if response_text is None:
+                queued = REPLY_QUEUE.submit(from_number, deliver_gemini_reply, from_number, incoming_msg)
+            elif REPLY_QUEUE.has_pending(from_number):
+                queued = REPLY_QUEUE.submit(from_number, deliver_local_reply, from_number, incoming_msg, response_text)
+            else:
+                queued = None
+            if queued:
+                return str(MessagingResponse())
+            if queued is False:
+                msg.body(BUSY_MESSAGE)
+                log_reply(from_number, BUSY_MESSAGE, 'busy')
+                return str(resp)
+
+        source = 'fast_path'
+        if response_text is None:
+            response_text, source = answer_with_model(incoming_msg, CONVERSATIONS.get_history(from_number))
         msg.body(response_text)
+        log_reply(from_number, response_text, source)
         
-        chat_history.append({'role': 'user', 'parts': [{'text': incoming_msg}]})
-        chat_history.append({'role': 'model', 'parts': [{'text': response_text}]})
-        
-        # Truncate history
-        if len(chat_history) > 20:
-            chat_history = chat_history[-20:]
-        
-        session['chat_history'] = chat_history
+        # Trimmed to a token budget by the store
+        CONVERSATIONS.append(from_number, incoming_msg, response_text)
 
-    return str(resp)
+    with stage('twiml'):
+        return str(resp)
 
 @app.route('/status')
 def status():
-    return jsonify({"status": "OK"})
+    return jsonify({
+        "status": "OK",
+        "fast_path": KNOWLEDGE.current().fast_path.stats(),
+        "async_replies": REPLY_QUEUE.stats(),
+        "dedup": DEDUP.stats(),
+        "admission": ADMISSION.stats(),
+        "llm": LLM.stats(),
+        "answer_cache": ANSWER_CACHE.stats(),
+        "conversation_log": CONVERSATION_LOG.stats(),
+        "delivery_status": DELIVERY_STATUS.stats(),
+    })
+
+@app.route('/rank-symptoms', methods=['GET', 'POST'])
+def rank_symptoms():
+    """Ranks diseases for the symptoms in ?q= (or a JSON body's "message") and returns them as JSON."""
+    message = request.values.get('q') or (request.get_json(silent=True) or {}).get('message', '')
+    ranker = KNOWLEDGE.current().symptom_ranker
+    return jsonify({
+        "symptoms": ranker.symptoms(message),
+        "candidates": [c._asdict() for c in ranker.rank(message, k=candidate_count(request.values.get('k')))],
+    })
 
 @app.route('/broadcast', methods=['GET'])
 def show_broadcast_form():
-    """Displays the HTML form for sending a broadcast.""" 
-    return render_template('broadcast.html')
+    """Displays the HTML form for sending a broadcast, plus the progress of a started job.""" 
+    return render_template('broadcast.html', job_id=request.args.get('job_id'))
 
 @app.route('/send-broadcast', methods=['POST'])
 def handle_send_broadcast():
-    """Handles the form submission and sends the broadcast message."""
+    """Handles the form submission and starts a background broadcast job."""
     broadcast_message = request.form.get('message')
     if not broadcast_message:
         flash('Message cannot be empty.', 'error')
         return redirect(url_for('show_broadcast_form'))
 
-    subscribers = get_subscribers()
-    if not subscribers:
+    if not count_subscribers():
         flash('There are no subscribers to send a message to.', 'error')
         return redirect(url_for('show_broadcast_form'))
 
-    sent_count = 0
-    failed_count = 0
-
     if 'twilio_client' not in globals():
         flash('Twilio client is not configured. Check environment variables.', 'error')
         return redirect(url_for('show_broadcast_form'))
 
-    for number in subscribers:
-        try:
-            twilio_client.messages.create(
-                body=broadcast_message,
-                from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
-                to=number
-            )
-            sent_count += 1
-        except Exception as e:
-            print(f"Failed to send to {number}: {e}")
-            failed_count += 1
-
-    flash(f'Broadcast sent! Messages sent: {sent_count}. Failed: {failed_count}.', 'success')
-    return redirect(url_for('show_broadcast_form'))
+    job_id = broadcast_engine.start(broadcast_message)
+    flash(f'Broadcast started (job {job_id}). Progress is shown below.', 'success')
+    return redirect(url_for('show_broadcast_form', job_id=job_id))
+
+@app.route('/broadcast-status/<job_id>')
+def broadcast_status(job_id):
+    """Returns the live progress of a broadcast job as JSON."""
+    if 'twilio_client' not in globals():
+        return jsonify({"error": "Twilio client is not configured."}), 503
+    progress = broadcast_engine.progress(job_id)
+    if progress is None:
+        return jsonify({"error": "Unknown broadcast job."}), 404
+    return jsonify(progress)
+
+@app.route('/message-status', methods=['POST'])
+def message_status():
+    """Receives Twilio's delivery-status callbacks for broadcast messages; they are stored in the background."""
+    if not is_signed_callback(request.form, request.headers.get('X-Twilio-Signature', ''), AUTH_TOKEN):
+        return "", 403
+    if not DELIVERY_STATUS.record(request.form):
+        return "", 400
+    return "", 204
+
+def create_app():
+    """
+    Application factory for pre-forking servers: gunicorn -c gunicorn.conf.py 'app1:create_app()'.
+    The app's state is built when the module is imported (in the master, with --preload); this
+    finishes startup and freezes that state so the workers share it (see app_factory.py).
+    """
+    return finish_startup(app)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8080, debug=True)
@@ -0,0 +1,34 @@
+# app_factory.py
+#
+# Startup shared by app.py and app1.py when they run under a pre-forking
+# server such as gunicorn (see gunicorn.conf.py).
+#
+# Importing either app builds all of its read-only state. That includes the
+# mapped knowledge snapshot, the retrieval and disease indexes, the intent
+# classifier, the symptom profiles and the reply tables. With --preload this
+# happens once in the master, and every worker is forked with that state
+# already in memory. The pages stay shared copy-on-write only while nobody
+# writes to them. CPython's cyclic garbage collector does write to them: it
+# updates every object it tracks. So a worker's first full collection would
+# give it a private copy of most of the master's heap.
+#
+# finish_startup() does the last one-off work, collects the garbage left
+# over from loading, and gc.freeze()s everything that survives. Frozen
+# objects are never examined by the collector again, so the pages stay
+# shared. The Twilio and Gemini SDK clients are not part of this. They are
+# built on first use in each worker (LazyTwilioClient, LlmGateway.client()),
+# since their HTTP connection pools cannot be shared across a fork.
+
+import gc
+
+
+def finish_startup(app):
+    """
+    Compiles the app's templates, then collects garbage and freezes what is
+    left so that forked workers keep sharing it. Returns app.
+    """
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    gc.collect()
+    gc.freeze()
+    return app
@@ -0,0 +1,94 @@
+# benchmarks/bench_answer_cache.py
+#
+# Hit rate and lookup cost of the answer cache in answer_cache.py.
+#
+# Replays synthetic traffic: questions about the diseases in finalData.json,
+# drawn with a Zipf-like skew so a few diseases dominate, as they do in real
+# traffic. Each question is asked through one of several phrasings, with a
+# share of misspelled disease names, in English and Hindi. Model latency is
+# not slept but accounted at MODEL_LATENCY seconds per miss. The benchmark
+# reports the hit rate for exact-only and near-duplicate matching, the model
+# time saved, and the cost of a lookup. Run from the project root:
+#
+#     python -m benchmarks.bench_answer_cache
+
+import json
+import random
+import time
+
+from answer_cache import AnswerCache
+from disease_index import build_disease_index
+from knowledge_snapshot import get_snapshot_store
+
+REQUESTS = 5000
+MODEL_LATENCY = 2.0
+SEED = 7
+
+PHRASINGS = {
+    'en': [
+        "Is {d} dangerous for children?",
+        "is {d} dangerous for children",
+        "Is {d} very dangerous for children?",
+        "How dangerous is {d} for children?",
+        "can {d} spread from person to person",
+        "Can {d} spread from one person to another person?",
+        "what should i eat during {d}",
+        "What food should I eat during {d}?",
+    ],
+    'hi': [
+        "क्या {d} बच्चों के लिए खतरनाक है",
+        "क्या {d} बच्चों के लिए खतरनाक है?",
+        "{d} में क्या खाना चाहिए",
+    ],
+}
+
+
+def misspell(word, rng):
+    if len(word) < 6:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    return word[:i] + word[i + 1:]
+
+
+def traffic(diseases, rng):
+    weights = [1 / (rank + 1) for rank in range(len(diseases))]
+    for _ in range(REQUESTS):
+        name = rng.choices(diseases, weights)[0].replace('_', ' ')
+        language = 'hi' if rng.random() < 0.3 else 'en'
+        if language == 'en' and rng.random() < 0.2:
+            name = misspell(name, rng)
+        yield rng.choice(PHRASINGS[language]).format(d=name), language
+
+
+def run(cache, queries):
+    misses = 0
+    start = time.perf_counter()
+    for query, language in queries:
+        if cache.get(query, language, 1) is None:
+            misses += 1
+            cache.put(query, language, 1, "answer", MODEL_LATENCY)
+    elapsed = time.perf_counter() - start
+    return misses, elapsed / len(queries) * 1e6
+
+
+def main():
+    health = get_snapshot_store().current()['health']
+    diseases = sorted(health['diseases'])
+    queries = list(traffic(diseases, random.Random(SEED)))
+    index = build_disease_index(diseases)
+    print(f"{REQUESTS} questions about {len(diseases)} diseases, {MODEL_LATENCY}s per model call")
+    print(f"{'mode':>16} {'hit rate':>9} {'model calls':>12} {'saved s':>9} {'us/lookup':>10}")
+    report = {}
+    for mode, cache in (('exact', AnswerCache(index, similarity=1.0)),
+                        ('near-duplicate', AnswerCache(index)),
+                        ('no disease index', AnswerCache())):
+        misses, cost_us = run(cache, queries)
+        stats = cache.stats()
+        print(f"{mode:>16} {stats['hit_rate']:>9.1%} {misses:>12} {stats['saved_seconds']:>9.0f} {cost_us:>10.0f}")
+        report[mode] = {'hit_rate': stats['hit_rate'], 'model_calls': misses,
+                        'saved_seconds': stats['saved_seconds'], 'lookup_us': cost_us}
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# benchmarks/bench_broadcast.py
+#
+# Runs the broadcast engine against the local fake Twilio API.
+#
+# Sends a broadcast to a synthetic subscriber list through the real twilio
+# client, kills the first run part-way through to simulate a crash, resumes
+# it, and checks that nobody received the message twice. Run from the
+# project root:
+#
+#     python -m benchmarks.bench_broadcast --subscribers 2000 --rate 500
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.fake_twilio import FakeTwilioServer
+from broadcast_engine import BroadcastEngine, create_twilio_client, twilio_sender
+
+
+class SimulatedCrash(BaseException):
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Broadcast engine benchmark against a fake Twilio API.")
+    parser.add_argument('--subscribers', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=500, help="messages per second")
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--error-rate', type=float, default=0.02)
+    parser.add_argument('--throttle-rate', type=float, default=0.02)
+    args = parser.parse_args()
+
+    server = FakeTwilioServer(latency=args.latency, error_rate=args.error_rate,
+                              throttle_rate=args.throttle_rate).start()
+    os.environ['TWILIO_API_BASE_URL'] = server.base_url
+    client = create_twilio_client('AC' + '0' * 32, 'token')
+    send = twilio_sender(client, 'whatsapp:+10000000000')
+
+    numbers = [f"whatsapp:+91{n:010d}" for n in range(args.subscribers)]
+    crash_after = args.subscribers // 3
+    calls = {'n': 0}
+
+    def crashing_send(number, body):
+        calls['n'] += 1
+        if calls['n'] == crash_after:
+            raise SimulatedCrash()
+        return send(number, body)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'broadcasts.db')
+        engine = BroadcastEngine(crashing_send, db_path=db_path, rate=args.rate,
+                                 workers=args.workers, subscriber_source=lambda: iter(numbers), skip_source=None)
+        job_id = engine.create_job("Benchmark broadcast")
+
+        start = time.perf_counter()
+        try:
+            engine.run(job_id)
+        except SimulatedCrash:
+            print(f"Simulated crash: {engine.progress(job_id)}")
+
+        engine.sender = send
+        engine.run(job_id)
+        elapsed = time.perf_counter() - start
+        progress = engine.progress(job_id)
+
+    duplicates = sum(1 for count in server.sent.values() if count > 1)
+    print(f"Final progress: {progress}")
+    print(f"Elapsed: {elapsed:.2f}s, throughput: {progress['sent'] / elapsed:.1f} msg/s, "
+          f"HTTP requests: {server.requests}, recipients: {len(server.sent)}, double sends: {duplicates}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# benchmarks/bench_fuzzy.py
+#
+# Micro-benchmark for the fuzzy disease index in disease_index.py.
+#
+# Pads the real disease names and aliases with synthetic ones and compares the
+# per-lookup time of the deletion-neighbourhood index against a linear scan
+# that computes the bounded edit distance to every alias. Run from the
+# project root:
+#
+#     python -m benchmarks.bench_fuzzy
+
+import json
+import random
+import string
+import time
+
+from disease_index import build_disease_index, edit_distance, max_distance_for, normalize
+from retrieval import load_topic_aliases
+
+SIZES = [100, 1000, 5000, 20000]
+ROUNDS = 50
+
+QUERIES = ["maleria", "dengu", "tubercolosis", "hypertention", "malariya", "टीबी", "xyzzyq"]
+
+
+def synthetic_aliases(base, size):
+    """Returns a copy of the alias table padded with random disease names."""
+    rng = random.Random(size)
+    aliases = {key: list(names) for key, names in base.items()}
+    count = sum(len(names) for names in aliases.values())
+    while count < size:
+        name = ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(6, 12)))
+        aliases[f"synthetic_{count}"] = [name]
+        count += 1
+    return aliases
+
+
+def linear_lookup(terms, word):
+    """Closest alias by scanning every term."""
+    query = normalize(word)
+    best = None
+    for term, key in terms:
+        limit = min(max_distance_for(query), max_distance_for(term))
+        distance = edit_distance(query, term, limit)
+        if distance <= limit and (best is None or distance < best[1]):
+            best = (key, distance)
+    return best
+
+
+def time_per_lookup(func):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for query in QUERIES:
+            func(query)
+    return (time.perf_counter() - start) / (ROUNDS * len(QUERIES)) * 1e6
+
+
+def main():
+    with open('finalData.json', encoding='utf-8') as f:
+        disease_keys = list(json.load(f)['diseases'])
+    base_aliases = load_topic_aliases()
+
+    print(f"{'aliases':>10} {'build ms':>10} {'index us/lookup':>16} {'linear us/lookup':>17}")
+    for size in SIZES:
+        aliases = synthetic_aliases(base_aliases, size)
+        start = time.perf_counter()
+        index = build_disease_index(disease_keys, aliases)
+        build_ms = (time.perf_counter() - start) * 1e3
+        terms = [(normalize(name), key) for key, names in aliases.items() for name in names]
+        index_us = time_per_lookup(index.best)
+        linear_us = time_per_lookup(lambda q: linear_lookup(terms, q))
+        print(f"{len(index):>10} {build_ms:>10.1f} {index_us:>16.2f} {linear_us:>17.2f}")
+
+
+if __name__ == "__main__":
+    main()
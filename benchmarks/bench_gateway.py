@@ -0,0 +1,115 @@
+# benchmarks/bench_gateway.py
+#
+# Behaviour of llm_gateway.py when the model is slow or failing.
+#
+# Starts a fake Gemini server (benchmarks/fake_gemini.py) and sends bursts of
+# concurrent requests in three scenarios: a healthy model, a model that is
+# much slower than the deadline, and a model that fails half its calls.
+# Each scenario runs twice:
+#
+#   - "direct" calls the genai client with no deadline or limits, as app1.py
+#     used to;
+#   - "gateway" calls through LlmGateway with small limits, so overload and
+#     fallbacks are visible in a short run.
+#
+# For each run the benchmark reports latency percentiles, the number of calls
+# that reached the model, the most calls in flight at the model at once, and
+# how many requests were answered by the fallback instead. The peak can exceed
+# the gateway's limit: a call that hit its deadline frees its slot while the
+# abandoned request is still running at the server. Run from the
+# project root:
+#
+#     python -m benchmarks.bench_gateway
+
+import json
+import statistics
+import threading
+import time
+
+from benchmarks.fake_gemini import FakeGeminiServer
+from llm_gateway import CircuitBreaker, LlmGateway, create_genai_client
+
+CLIENTS = 32
+ROUNDS = 3
+
+# Gateway settings for the run, in seconds where they are times.
+TIMEOUT = 1.0
+MAX_CONCURRENCY = 8
+MAX_QUEUE = 32
+QUEUE_TIMEOUT = 1.0
+COOLDOWN = 5.0
+
+SCENARIOS = [
+    ('healthy', {'latency': 0.1}),
+    ('slow', {'latency': 4.0}),
+    ('failing', {'latency': 0.1, 'error_rate': 0.5}),
+]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(server, call):
+    """Sends ROUNDS bursts of CLIENTS concurrent calls and returns per-call (latency, answered_by_model)."""
+    results = []
+    lock = threading.Lock()
+
+    def one():
+        start = time.perf_counter()
+        try:
+            call()
+            ok = True
+        except Exception:
+            ok = False
+        with lock:
+            results.append((time.perf_counter() - start, ok))
+
+    server.requests = server.max_in_flight = 0
+    for _ in range(ROUNDS):
+        threads = [threading.Thread(target=one) for _ in range(CLIENTS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    return results
+
+
+def report(name, mode, server, results, extra=''):
+    latencies = [latency * 1e3 for latency, _ in results]
+    fallbacks = sum(1 for _, ok in results if not ok)
+    print(f"{name:>8} {mode:>8} {statistics.median(latencies):>9.0f} {percentile(latencies, 0.99):>9.0f} "
+          f"{server.requests:>7} {server.max_in_flight:>7} {fallbacks:>9}  {extra}")
+    return {'p50_ms': statistics.median(latencies), 'p99_ms': percentile(latencies, 0.99),
+            'model_calls': server.requests, 'max_in_flight': server.max_in_flight, 'fallbacks': fallbacks}
+
+
+def main():
+    print(f"{CLIENTS} concurrent requests x {ROUNDS} rounds; gateway: timeout {TIMEOUT}s, "
+          f"concurrency {MAX_CONCURRENCY}, queue {MAX_QUEUE}")
+    print(f"{'model':>8} {'mode':>8} {'p50 ms':>9} {'p99 ms':>9} {'calls':>7} {'peak':>7} {'fallback':>9}")
+    summary = {}
+    for name, settings in SCENARIOS:
+        server = FakeGeminiServer(**settings).start()
+        direct = create_genai_client('benchmark', base_url=server.base_url, timeout=600)
+        direct_results = run(server, lambda: direct.models.generate_content(
+            model='gemini-1.5-flash', contents='hello', config={'system_instruction': 'benchmark'}))
+        summary[(name, 'direct')] = report(name, 'direct', server, direct_results)
+
+        gateway = LlmGateway(lambda: create_genai_client('benchmark', base_url=server.base_url, timeout=TIMEOUT),
+                             max_concurrency=MAX_CONCURRENCY, max_queue=MAX_QUEUE, queue_timeout=QUEUE_TIMEOUT,
+                             breaker=CircuitBreaker(cooldown=COOLDOWN))
+        gateway.client()
+        gateway_results = run(server, lambda: gateway.generate('benchmark', [], 'hello'))
+        stats = gateway.stats()
+        reasons = {key: stats[key] for key in ('timed_out', 'failed', 'queue_full', 'queue_timeout', 'circuit_open')
+                   if stats[key]}
+        summary[(name, 'gateway')] = report(name, 'gateway', server, gateway_results,
+                                            f"breaker opened {stats['breaker_opened']}x {reasons}")
+        server.shutdown()
+    print(json.dumps({f"{name}/{mode}": value for (name, mode), value in summary.items()}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# benchmarks/bench_intents.py
+#
+# Accuracy and latency harness for the intent classifier in intent_classifier.py.
+#
+# Holds out a quarter of every intent's examples from NLU rasa/data/nlu.yml
+# (over several random splits), trains on the rest, and compares held-out
+# accuracy against a keyword baseline built from the fast path's aspect
+# keywords. It then times model loading, single-message prediction and batch
+# prediction. Needs PyYAML for the training data. Run from the project root:
+#
+#     python -m benchmarks.bench_intents
+
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from fast_path import ASPECT_KEYWORDS, INTENT_ASPECTS
+from intent_classifier import IntentClassifier, load_domain_intents, load_nlu_examples, train
+from matcher import INTENT_KEYWORDS, KeywordMatcher
+
+SEEDS = [0, 1, 2, 3, 4]
+HELD_OUT = 0.25
+ROUNDS = 200
+BATCH_SIZE = 100
+
+
+def held_out_split(examples, seed):
+    """Splits examples into train and test sets, holding out a share of every intent."""
+    rng = np.random.default_rng(seed)
+    train_set, test_set = [], []
+    for intent in dict.fromkeys(e.intent for e in examples):
+        group = [e for e in examples if e.intent == intent]
+        order = rng.permutation(len(group))
+        cut = max(1, int(round(len(group) * HELD_OUT))) if len(group) > 2 else 0
+        test_set.extend(group[i] for i in order[:cut])
+        train_set.extend(group[i] for i in order[cut:])
+    return train_set, test_set
+
+
+def keyword_baseline():
+    """Maps the fast path's aspect keywords and the greeting words back to Rasa intents."""
+    matcher = KeywordMatcher()
+    intent_for_aspect = {aspect: intent for intent, aspect in INTENT_ASPECTS.items()}
+    for aspect, words in ASPECT_KEYWORDS.items():
+        for word in words:
+            matcher.add(word, intent_for_aspect[aspect])
+    for word in INTENT_KEYWORDS['greet'] + ['नमस्ते', 'ନମସ୍କାର']:
+        matcher.add(word, 'greet')
+    return lambda text: matcher.resolve(text)[0]
+
+
+def main():
+    intents = load_domain_intents()
+    examples = [e for e in load_nlu_examples() if e.intent in intents]
+    baseline = keyword_baseline()
+
+    print(f"{len(examples)} examples, {len(intents)} intents, {len(SEEDS)} splits holding out {HELD_OUT:.0%}")
+    print(f"{'seed':>6} {'test':>6} {'classifier':>11} {'keywords':>9}")
+    classifier_correct = baseline_correct = total = 0
+    for seed in SEEDS:
+        train_set, test_set = held_out_split(examples, seed)
+        model = train(train_set, intents)
+        predictions = model.predict([e.text for e in test_set], threshold=0.0)
+        model_hits = sum(p.intent == e.intent for p, e in zip(predictions, test_set))
+        baseline_hits = sum(baseline(e.text) == e.intent for e in test_set)
+        print(f"{seed:>6} {len(test_set):>6} {model_hits / len(test_set):>11.1%} {baseline_hits / len(test_set):>9.1%}")
+        classifier_correct += model_hits
+        baseline_correct += baseline_hits
+        total += len(test_set)
+    print(f"{'all':>6} {total:>6} {classifier_correct / total:>11.1%} {baseline_correct / total:>9.1%}")
+
+    model = train(examples, intents)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'intent_model.npz')
+        model.save(path)
+        size_kb = os.path.getsize(path) / 1024
+        start = time.perf_counter()
+        model = IntentClassifier.load(path)
+        load_ms = (time.perf_counter() - start) * 1e3
+
+    texts = [e.text for e in examples]
+    start = time.perf_counter()
+    for i in range(ROUNDS):
+        model.predict_one(texts[i % len(texts)])
+    single_us = (time.perf_counter() - start) / ROUNDS * 1e6
+
+    batch = (texts * (BATCH_SIZE // len(texts) + 1))[:BATCH_SIZE]
+    start = time.perf_counter()
+    for _ in range(ROUNDS // 10):
+        model.predict(batch)
+    batch_us = (time.perf_counter() - start) / (ROUNDS // 10 * BATCH_SIZE) * 1e6
+
+    print()
+    print(f"model size: {size_kb:.0f} KB, load: {load_ms:.1f} ms")
+    print(f"predict: {single_us:.1f} us/message single, {batch_us:.1f} us/message in batches of {BATCH_SIZE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+# benchmarks/bench_load.py
+#
+# Load test for the /webhook and /send-broadcast paths of app.py and app1.py.
+#
+# Each run starts a set of worker processes that all serve the real WSGI app
+# on one shared listening socket (a threaded werkzeug server per process, like
+# gunicorn's gthread workers), backed by the fake Twilio and Gemini servers
+# from this directory with configurable latency. Closed-loop clients then
+# POST Twilio-style form payloads to /webhook. A user's messages are always
+# sent by the same client, in order. The payloads are either synthetic
+# (greetings, disease lookups, symptom lists and open questions in English
+# and Hindi) or replayed from a conversation log (conversation_log.py).
+#
+# The webhook runs cover every combination of worker count, subscriber count
+# and knowledge-base size, each in a fresh temporary directory. Each run
+# reports throughput, p50/p95/p99 latency, errors and model calls. The
+# broadcast runs start a broadcast through /send-broadcast to 10k and 100k
+# subscribers and poll /broadcast-status until it completes. The results are
+# written as JSON (--output); --compare prints the change against an earlier
+# results file. Run from the project root:
+#
+#     python -m benchmarks.bench_load --app app1 --workers 1,2,4 --output load.json
+#     python -m benchmarks.bench_load --app app1 --replay logs --requests 5000
+#     python -m benchmarks.bench_load --compare load.json --output load-new.json
+
+import argparse
+import http.client
+import importlib
+import json
+import os
+import random
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import urlencode
+
+from benchmarks.bench_snapshot import write_sources
+from benchmarks.fake_gemini import FakeGeminiServer
+from benchmarks.fake_twilio import FakeTwilioServer
+
+ACCOUNT_SID = 'AC' + '0' * 32
+AUTH_TOKEN = 'benchmark'
+BOT_NUMBER = '+14155238886'
+STARTUP_TIMEOUT = 120
+
+DISEASES = ['dengue', 'malaria', 'tuberculosis', 'typhoid', 'cholera', 'covid', 'hepatitis', 'chikungunya']
+SYMPTOMS = ['fever', 'headache', 'rash', 'joint pain', 'cough', 'vomiting', 'diarrhea', 'chills', 'fatigue']
+GREETINGS = ['hi', 'hello', 'menu', 'namaste', 'good morning']
+LOOKUPS = ['symptoms of {d}', '{d} prevention', 'what are the symptoms of {d} in hindi', '{d} ke lakshan',
+           'how to prevent {d}', '{d} के लक्षण']
+OPEN_QUESTIONS = ['Is {d} dangerous for pregnant women?', 'my child has {d}, what should he eat?',
+                  'can {d} come back after treatment?', 'how long does {d} last in adults',
+                  'is {d} contagious at school?']
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+# --- Payloads ---
+
+def synthetic_messages(requests, users, rng):
+    """Returns [(user, body)] with a mix of greetings, lookups, symptom lists and open questions."""
+    numbers = [f"whatsapp:+9170{n:08d}" for n in range(users)]
+    messages = []
+    for _ in range(requests):
+        roll = rng.random()
+        disease = rng.choice(DISEASES)
+        if roll < 0.1:
+            body = rng.choice(GREETINGS)
+        elif roll < 0.5:
+            body = rng.choice(LOOKUPS).format(d=disease)
+        elif roll < 0.65:
+            body = "I have " + ", ".join(rng.sample(SYMPTOMS, rng.randint(2, 4)))
+        else:
+            body = rng.choice(OPEN_QUESTIONS).format(d=disease)
+        messages.append((rng.choice(numbers), body))
+    return messages
+
+
+def replayed_messages(directory, requests):
+    """Returns up to requests [(user, body)] from the 'message' events of a conversation log, oldest first."""
+    from conversation_log import read_events
+
+    messages = []
+    for event in read_events(directory, events=['message']):
+        messages.append((event.get('user') or 'whatsapp:+910000000000', event.get('text', '')))
+        if requests and len(messages) >= requests:
+            break
+    return messages
+
+
+def twilio_form(user, body):
+    """A form payload shaped like the ones Twilio posts for an inbound WhatsApp message."""
+    return urlencode({
+        'SmsMessageSid': (sid := 'SM' + uuid.uuid4().hex), 'MessageSid': sid, 'SmsSid': sid,
+        'AccountSid': ACCOUNT_SID, 'MessagingServiceSid': '', 'From': user, 'To': f"whatsapp:{BOT_NUMBER}",
+        'Body': body, 'NumMedia': '0', 'NumSegments': '1', 'SmsStatus': 'received', 'ApiVersion': '2010-04-01',
+        'ProfileName': 'Load Test', 'WaId': user.split('+')[-1],
+    })
+
+
+# --- Worker processes ---
+
+def serve(app_name, fd):
+    """Worker process: serves the app on the inherited listening socket."""
+    import logging
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app = importlib.import_module(app_name).app
+    server = make_server('127.0.0.1', 0, app, threaded=True, fd=fd)
+    print("ready", flush=True)
+    # The parent stops reading after "ready"; send the app's own output to stderr so it cannot fill the pipe.
+    os.dup2(2, 1)
+    server.serve_forever()
+
+
+class Workers:
+    """count worker processes serving app_name on one listening socket."""
+
+    def __init__(self, app_name, count, env):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(1024)
+        self.sock.set_inheritable(True)
+        self.port = self.sock.getsockname()[1]
+        fd = self.sock.fileno()
+        started = time.perf_counter()
+        self.processes = [
+            subprocess.Popen([sys.executable, '-m', 'benchmarks.bench_load', '--serve', app_name, '--fd', str(fd)],
+                             env=env, pass_fds=(fd,), stdout=subprocess.PIPE, text=True)
+            for _ in range(count)
+        ]
+        for p in self.processes:
+            if p.stdout.readline().strip() != 'ready':
+                self.stop()
+                raise RuntimeError(f"A {app_name} worker failed to start")
+        self.startup_seconds = time.perf_counter() - started
+
+    def stop(self):
+        for p in self.processes:
+            p.terminate()
+        for p in self.processes:
+            p.wait()
+        self.sock.close()
+
+
+# --- Load generation ---
+
+def run_load(port, messages, concurrency):
+    """Sends messages from concurrency closed-loop clients; each user's messages stay on one client, in order."""
+    shards = [[] for _ in range(concurrency)]
+    for user, body in messages:
+        shards[hash(user) % concurrency].append((user, body))
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def client(shard):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        local_latencies, local_errors = [], []
+        for user, body in shard:
+            payload = twilio_form(user, body)
+            start = time.perf_counter()
+            try:
+                conn.request('POST', '/webhook', payload, {'Content-Type': 'application/x-www-form-urlencoded'})
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    local_errors.append(response.status)
+            except (OSError, http.client.HTTPException) as e:
+                local_errors.append(type(e).__name__)
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            local_latencies.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors.extend(local_errors)
+
+    threads = [threading.Thread(target=client, args=(shard,)) for shard in shards if shard]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'error_kinds': {str(kind): errors.count(kind) for kind in set(errors)},
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1e3, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1e3, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1e3, 2),
+        'mean_ms': round(statistics.mean(latencies) * 1e3, 2) if latencies else 0.0,
+    }
+
+
+def outcome_counters(port, names=('llm', 'admission')):
+    """The counters of all workers with the given names (by default model calls and admission), by result, from /metrics."""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.request('GET', '/metrics')
+    text = conn.getresponse().read().decode()
+    conn.close()
+    outcomes = {name: {} for name in names}
+    for line in text.splitlines():
+        for name, counters in outcomes.items():
+            if line.startswith(f"healthbot_{name}_total{{"):
+                labels, value = line.rsplit(' ', 1)
+                counters[labels.split('result="', 1)[1].split('"', 1)[0]] = int(float(value))
+    return outcomes
+
+
+# --- Environment ---
+
+def add_subscribers(path, count):
+    """Creates a subscriber database with count synthetic numbers."""
+    from subscribers import SubscriberStore
+
+    SubscriberStore(path, legacy_file=None)
+    conn = sqlite3.connect(path)
+    now = time.time()
+    conn.executemany('INSERT OR IGNORE INTO subscribers (number, created_at) VALUES (?, ?)',
+                     ((f"whatsapp:+9180{n:08d}", now) for n in range(count)))
+    conn.commit()
+    conn.close()
+
+
+def prepare(directory, subscribers, kb_scale, gemini, twilio, args):
+    """Writes the knowledge files, subscriber database and snapshot for one run; returns the workers' env."""
+    from knowledge_snapshot import SOURCES, build_snapshot
+
+    knowledge = os.path.join(directory, 'knowledge')
+    os.makedirs(knowledge)
+    write_sources(knowledge, kb_scale)
+    sources = {name: os.path.join(knowledge, os.path.basename(path)) for name, path in SOURCES.items()}
+    build_snapshot(os.path.join(directory, 'snapshots'), sources)
+    add_subscribers(os.path.join(directory, 'subscribers.db'), subscribers)
+
+    env = dict(os.environ)
+    env.update({
+        'KNOWLEDGE_DIR': knowledge,
+        'SNAPSHOT_DIR': os.path.join(directory, 'snapshots'),
+        'SUBSCRIBERS_DB': os.path.join(directory, 'subscribers.db'),
+        'BROADCAST_DB': os.path.join(directory, 'broadcasts.db'),
+        'DELIVERY_DB': os.path.join(directory, 'delivery_status.db'),
+        'METRICS_DIR': os.path.join(directory, 'metrics'),
+        'METRICS_FLUSH_INTERVAL': '0.5',
+        'CONVERSATION_LOG_DIR': os.path.join(directory, 'logs'),
+        'GEMINI_API_KEY': 'benchmark',
+        'GEMINI_BASE_URL': gemini.base_url,
+        'ACCOUNT_SID': ACCOUNT_SID,
+        'AUTH_TOKEN': AUTH_TOKEN,
+        'TWILIO_PHONE_NUMBER': BOT_NUMBER,
+        'TWILIO_API_BASE_URL': twilio.base_url,
+        'BROADCAST_RATE': str(args.broadcast_rate),
+        'BROADCAST_WORKERS': str(args.broadcast_workers),
+        'PYTHONPATH': os.getcwd(),
+    })
+    # The synthetic users send far faster than people do; keep them under the per-sender limit unless it is set.
+    env.setdefault('ADMISSION_SENDER_RATE', '1000000')
+    env.setdefault('ADMISSION_SENDER_BURST', '1000000')
+    if args.llm_concurrency:
+        env['LLM_MAX_CONCURRENCY'] = str(args.llm_concurrency)
+    return env
+
+
+# --- Scenarios ---
+
+def webhook_runs(args, messages, gemini, twilio):
+    results = []
+    for workers in args.workers:
+        for subscribers in args.subscribers:
+            for kb_scale in args.kb_scale:
+                with tempfile.TemporaryDirectory() as directory:
+                    env = prepare(directory, subscribers, kb_scale, gemini, twilio, args)
+                    pool = Workers(args.app, workers, env)
+                    try:
+                        # A short warm-up so first-request costs (lazy clients, caches) are not measured.
+                        run_load(pool.port, messages[:workers * 4], workers)
+                        time.sleep(1)
+                        before = outcome_counters(pool.port)
+                        gemini.requests = 0
+                        result = run_load(pool.port, messages, args.concurrency)
+                        model_calls = gemini.requests
+                        # Wait for every worker's metrics flush.
+                        time.sleep(1)
+                        after = outcome_counters(pool.port)
+                    finally:
+                        pool.stop()
+                outcomes, admission = ({k: v - before[name].get(k, 0) for k, v in after[name].items()
+                                        if v != before[name].get(k, 0)} for name in ('llm', 'admission'))
+                result.update({'app': args.app, 'workers': workers, 'subscribers': subscribers,
+                               'kb_scale': kb_scale, 'model_calls': model_calls, 'llm_outcomes': outcomes,
+                               'admission_outcomes': admission, 'startup_s': round(pool.startup_seconds, 2)})
+                results.append(result)
+                print(f"{workers:>7} {subscribers:>11} {kb_scale:>8} {result['throughput_rps']:>9.1f} "
+                      f"{result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+                      f"{result['errors']:>7} {result['model_calls']:>7} "
+                      f"{sum(v for k, v in outcomes.items() if k not in ('calls', 'succeeded')):>8} "
+                      f"{admission.get('shed_queue_full', 0) + admission.get('shed_timeout', 0):>6}", flush=True)
+    return results
+
+
+def broadcast_runs(args, gemini, twilio):
+    results = []
+    for subscribers in args.broadcast:
+        with tempfile.TemporaryDirectory() as directory:
+            env = prepare(directory, subscribers, 1, gemini, twilio, args)
+            pool = Workers(args.app, 1, env)
+            twilio.sent.clear()
+            twilio.requests = 0
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', pool.port, timeout=60)
+                start = time.perf_counter()
+                conn.request('POST', '/send-broadcast', urlencode({'message': 'Load test broadcast'}),
+                             {'Content-Type': 'application/x-www-form-urlencoded'})
+                response = conn.getresponse()
+                response.read()
+                job_id = response.getheader('Location', '').split('job_id=')[-1]
+                accepted_ms = (time.perf_counter() - start) * 1e3
+                progress = {}
+                while progress.get('status') not in ('completed', 'failed'):
+                    time.sleep(0.5)
+                    conn.request('GET', f"/broadcast-status/{job_id}")
+                    progress = json.loads(conn.getresponse().read())
+                elapsed = time.perf_counter() - start
+            finally:
+                pool.stop()
+        result = {
+            'app': args.app, 'subscribers': subscribers, 'status': progress.get('status'),
+            'sent': progress.get('sent', 0), 'failed': progress.get('failed', 0),
+            'accepted_ms': round(accepted_ms, 1), 'elapsed_s': round(elapsed, 2),
+            'throughput_mps': round(progress.get('sent', 0) / elapsed, 1),
+            'double_sends': sum(1 for n in twilio.sent.values() if n > 1),
+        }
+        results.append(result)
+        print(f"{subscribers:>11} {result['status']:>10} {result['sent']:>8} {result['failed']:>7} "
+              f"{result['accepted_ms']:>9.1f} {result['elapsed_s']:>9.1f} {result['throughput_mps']:>9.1f} "
+              f"{result['double_sends']:>7}", flush=True)
+    return results
+
+
+def compare(baseline_path, report):
+    """Prints the change in throughput and latency for each run that also appears in the baseline."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    key = lambda r: (r['app'], r['workers'], r['subscribers'], r['kb_scale'])
+    before = {key(r): r for r in baseline.get('webhook', [])}
+    print(f"Compared with {baseline_path} ({baseline.get('commit', 'unknown')[:10]}):")
+    for run in report['webhook']:
+        old = before.get(key(run))
+        if old is None:
+            continue
+        changes = "  ".join(f"{metric} {(run[metric] - old[metric]) / old[metric]:+.1%}"
+                            for metric in ('throughput_rps', 'p50_ms', 'p99_ms') if old[metric])
+        print(f"  workers={run['workers']} subscribers={run['subscribers']} kb_scale={run['kb_scale']}: {changes}")
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def int_list(text):
+    return [int(part) for part in text.split(',') if part]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for /webhook and /send-broadcast.")
+    parser.add_argument('--app', default='app1', choices=['app', 'app1'])
+    parser.add_argument('--workers', type=int_list, default=[1, 2, 4], help="worker process counts, e.g. 1,2,4")
+    parser.add_argument('--subscribers', type=int_list, default=[1000, 100000],
+                        help="subscriber counts for the webhook runs")
+    parser.add_argument('--kb-scale', type=int_list, default=[1, 20],
+                        help="knowledge-base sizes, as multiples of finalData.json's diseases")
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--replay', metavar='LOG_DIR', help="replay the messages of a conversation log")
+    parser.add_argument('--llm-latency', type=float, default=0.8)
+    parser.add_argument('--llm-concurrency', type=int, help="LLM_MAX_CONCURRENCY for the workers (default: the app's)")
+    parser.add_argument('--twilio-latency', type=float, default=0.05)
+    parser.add_argument('--broadcast', type=int_list, default=[10000, 100000],
+                        help="subscriber counts for the broadcast runs (empty to skip)")
+    parser.add_argument('--broadcast-rate', type=float, default=2000, help="BROADCAST_RATE for the broadcast runs")
+    parser.add_argument('--broadcast-workers', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', metavar='BASELINE', help="an earlier results file to compare against")
+    args = parser.parse_args()
+
+    if args.replay:
+        messages = replayed_messages(args.replay, args.requests)
+    else:
+        messages = synthetic_messages(args.requests, args.users, random.Random(args.seed))
+    gemini = FakeGeminiServer(latency=args.llm_latency).start()
+    twilio = FakeTwilioServer(latency=args.twilio_latency).start()
+
+    source = f"replayed from {args.replay}" if args.replay else "synthetic"
+    print(f"{args.app}: {len(messages)} messages ({source}), {args.concurrency} clients, "
+          f"model latency {args.llm_latency}s, Twilio latency {args.twilio_latency}s")
+    print(f"{'workers':>7} {'subscribers':>11} {'kb scale':>8} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'errors':>7} {'llm':>7} {'fallback':>8} {'shed':>6}")
+    report = {
+        'commit': current_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'config': vars(args),
+        'webhook': webhook_runs(args, messages, gemini, twilio),
+    }
+    if args.broadcast:
+        print(f"{'subscribers':>11} {'status':>10} {'sent':>8} {'failed':>7} {'accept ms':>9} "
+              f"{'seconds':>9} {'msg/s':>9} {'doubles':>7}")
+        report['broadcast'] = broadcast_runs(args, gemini, twilio)
+
+    if args.compare:
+        compare(args.compare, report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    else:
+        print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == '--serve':
+        serve(sys.argv[2], int(sys.argv[4]))
+    else:
+        main()
@@ -0,0 +1,77 @@
+# benchmarks/bench_matcher.py
+#
+# Micro-benchmark for the compiled keyword matcher in matcher.py.
+#
+# Grows diseases.json with synthetic entries and compares the per-message
+# routing time of the token-trie matcher against the original linear scan
+# over every disease name. Run from the project root:
+#
+#     python -m benchmarks.bench_matcher
+
+import json
+import random
+import string
+import time
+
+from matcher import build_matcher
+
+SIZES = [4, 100, 1000, 5000, 20000]
+ROUNDS = 2000
+
+MESSAGES = [
+    "hi there",
+    "which clinic is open",
+    "first aid for minor burns",
+    "tell me about malaria symptoms please",
+    "what is this thing called life",
+]
+
+
+def synthetic_diseases(base, size):
+    """Returns a copy of the diseases data padded with random disease names."""
+    rng = random.Random(size)
+    data = dict(base)
+    diseases = list(base['disease_symptoms'])
+    while len(diseases) < size:
+        name = ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(6, 12)))
+        diseases.append({'disease_name': name.title(), 'common_symptoms': [], 'prevention_methods': []})
+    data['disease_symptoms'] = diseases
+    return data
+
+
+def linear_scan(diseases_data, incoming_msg):
+    """The original per-request lookup from app.py."""
+    incoming_msg = incoming_msg.lower()
+    for disease in diseases_data['disease_symptoms']:
+        if disease['disease_name'].lower() in incoming_msg:
+            return disease['disease_name']
+    return None
+
+
+def time_per_message(func):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for message in MESSAGES:
+            func(message)
+    return (time.perf_counter() - start) / (ROUNDS * len(MESSAGES)) * 1e6
+
+
+def main():
+    with open('diseases.json') as f:
+        diseases_base = json.load(f)
+    with open('basic-first-aid-emergency.json') as f:
+        first_aid_data = json.load(f)
+
+    print(f"{'diseases':>10} {'build ms':>10} {'trie us/msg':>12} {'linear us/msg':>14}")
+    for size in SIZES:
+        diseases_data = synthetic_diseases(diseases_base, size)
+        start = time.perf_counter()
+        matcher = build_matcher(diseases_data, first_aid_data)
+        build_ms = (time.perf_counter() - start) * 1e3
+        trie_us = time_per_message(matcher.resolve)
+        linear_us = time_per_message(lambda m: linear_scan(diseases_data, m))
+        print(f"{size:>10} {build_ms:>10.1f} {trie_us:>12.2f} {linear_us:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
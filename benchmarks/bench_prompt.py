@@ -0,0 +1,108 @@
+# benchmarks/bench_prompt.py
+#
+# Compares prompt size and model latency before and after retrieval-scoped
+# prompts in app1.py, using a stubbed Gemini client.
+#
+# "Before" embeds all of finalData.json in the system instruction, as app1.py
+# used to. "After" is the current build_system_prompt(), which embeds only the
+# top-k retrieved chunks. The stub charges a fixed overhead plus a prefill
+# cost per input token, so time-to-first-token tracks prompt size the way it
+# does against the real API. Token counts are estimated (about 4 ASCII
+# characters per token, one token per non-ASCII character). Run from the
+# project root:
+#
+#     python -m benchmarks.bench_prompt
+
+import json
+import math
+import os
+import statistics
+import time
+
+os.environ.setdefault('GEMINI_API_KEY', 'benchmark-stub')
+
+import app1
+from answer_cache import AnswerCache
+from knowledge_snapshot import to_python
+from llm_gateway import LlmGateway
+
+QUERIES = [
+    "What are the symptoms of tuberculosis?",
+    "symptoms of dengue in hindi",
+    "How can I prevent malaria?",
+    "polio vaccine schedule",
+    "first aid for minor burns",
+    "emergency ambulance number",
+    "I have fever, joint pain and a rash",
+    "डेंगू के लक्षण बताएं",
+    "ମଲେରିଆ ରୁ କିପରି ବଞ୍ଚିବି?",
+    "Is hypertension dangerous?",
+]
+
+# Stub model costs, in seconds.
+BASE_LATENCY = 0.05
+PREFILL_PER_TOKEN = 20e-6
+
+
+def estimate_tokens(text):
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+class StubClient:
+    """Implements the slice of google.genai.Client that llm_gateway.py uses."""
+
+    def __init__(self):
+        self.input_tokens = []
+        self.models = self
+
+    def generate_content(self, model, contents, config):
+        prompt = config['system_instruction'] + json.dumps(contents, ensure_ascii=False)
+        tokens = estimate_tokens(prompt)
+        self.input_tokens.append(tokens)
+        time.sleep(BASE_LATENCY + tokens * PREFILL_PER_TOKEN)
+        return type('Response', (), {'text': 'stub answer'})()
+
+
+def full_data_prompt(user_query, chat_history):
+    """The system prompt app1.py built before retrieval: every entry of finalData.json."""
+    return app1.SYSTEM_PROMPT_TEMPLATE.format(context=json.dumps(to_python(app1.KNOWLEDGE.current().health_data)))
+
+
+def measure(prompt_builder):
+    stub = StubClient()
+    app1.LLM = LlmGateway(lambda: stub)
+    original, original_cache = app1.build_system_prompt, app1.ANSWER_CACHE
+    app1.build_system_prompt = prompt_builder
+    # A fresh, disabled cache, so every query reaches the model and the passes do not share answers.
+    app1.ANSWER_CACHE = AnswerCache(ttl=-1)
+    latencies = []
+    try:
+        for query in QUERIES:
+            start = time.perf_counter()
+            app1.get_gemini_response(query, [])
+            latencies.append((time.perf_counter() - start) * 1e3)
+    finally:
+        app1.build_system_prompt, app1.ANSWER_CACHE = original, original_cache
+    return {
+        'mean_input_tokens': statistics.mean(stub.input_tokens),
+        'max_input_tokens': max(stub.input_tokens),
+        'mean_latency_ms': statistics.mean(latencies),
+        'max_latency_ms': max(latencies),
+    }
+
+
+def main():
+    before = measure(full_data_prompt)
+    after = measure(app1.build_system_prompt)
+    report = {'queries': len(QUERIES), 'top_k': app1.RETRIEVAL_TOP_K, 'before': before, 'after': after}
+
+    print(f"{'':>20} {'before':>12} {'after':>12}")
+    for key in before:
+        print(f"{key:>20} {before[key]:>12.1f} {after[key]:>12.1f}")
+    print(f"Input tokens reduced {before['mean_input_tokens'] / after['mean_input_tokens']:.1f}x")
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
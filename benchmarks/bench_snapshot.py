@@ -0,0 +1,113 @@
+# benchmarks/bench_snapshot.py
+#
+# Memory and load-time comparison for the knowledge snapshot in
+# knowledge_snapshot.py.
+#
+# Starts WORKERS processes that each load the knowledge files the old way
+# (json.load, a private dict tree per process), then WORKERS more that open
+# the compiled snapshot through mmap. All of them stay alive together, and
+# the parent reports each mode's load time and average memory per worker
+# from /proc/<pid>/smaps_rollup. Private_Dirty is memory that cannot be
+# shared; PSS charges shared pages to the processes in equal parts. The run
+# uses the real files and then a synthetic knowledge base about SCALE times
+# larger. Linux only. Run from the project root:
+#
+#     python -m benchmarks.bench_snapshot
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from knowledge_snapshot import SOURCES, build_snapshot
+
+WORKERS = 4
+SCALE = 200
+
+
+def memory_kb():
+    stats = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:', 'Private_Dirty:'):
+                stats[parts[0][:-1]] = int(parts[1])
+    return stats
+
+
+def worker(mode, directory):
+    """Loads the knowledge in one mode, reports, and waits so that all workers are measured together."""
+    baseline = memory_kb()
+    start = time.perf_counter()
+    if mode == 'json':
+        data = {}
+        for name in SOURCES:
+            with open(os.path.join(directory, os.path.basename(SOURCES[name])), encoding='utf-8') as f:
+                data[name] = json.load(f)
+        diseases = data['health']['diseases']
+    else:
+        from knowledge_snapshot import Snapshot, _read_pointer
+        data = Snapshot(os.path.join(directory, 'snapshots', _read_pointer(os.path.join(directory, 'snapshots'))))
+        diseases = data['health']['diseases']
+    load_ms = (time.perf_counter() - start) * 1e3
+
+    # Touch every disease's symptoms, as building the indexes does.
+    for key in diseases:
+        for items in diseases[key]['symptoms'].values():
+            len(items[0])
+    print(json.dumps({'load_ms': load_ms}), flush=True)
+    sys.stdin.readline()
+    stats = memory_kb()
+    print(json.dumps({key: stats[key] - baseline.get(key, 0) for key in stats}), flush=True)
+
+
+def write_sources(directory, scale):
+    """Copies the knowledge files into directory, with finalData.json's diseases repeated scale times."""
+    for name, path in SOURCES.items():
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if name == 'health' and scale > 1:
+            data['diseases'] = {f"{key}_{i}": value for i in range(scale) for key, value in data['diseases'].items()}
+        with open(os.path.join(directory, os.path.basename(path)), 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+
+def run(directory, mode):
+    processes = [subprocess.Popen([sys.executable, '-m', 'benchmarks.bench_snapshot', '--worker', mode, directory],
+                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                 for _ in range(WORKERS)]
+    load_ms = [json.loads(p.stdout.readline())['load_ms'] for p in processes]
+    for p in processes:
+        p.stdin.write("\n")
+        p.stdin.flush()
+    stats = [json.loads(p.stdout.readline()) for p in processes]
+    for p in processes:
+        p.wait()
+    average = {key: sum(s[key] for s in stats) / len(stats) for key in stats[0]}
+    return sum(load_ms) / len(load_ms), average
+
+
+def main():
+    print(f"{WORKERS} workers per mode; memory is the growth per worker after loading, in KB")
+    print(f"{'data':>10} {'mode':>9} {'load ms':>9} {'RSS':>8} {'PSS':>8} {'private':>8}")
+    for scale in (1, SCALE):
+        with tempfile.TemporaryDirectory() as directory:
+            write_sources(directory, scale)
+            sources = {name: os.path.join(directory, os.path.basename(path)) for name, path in SOURCES.items()}
+            snapshot_path = build_snapshot(os.path.join(directory, 'snapshots'), sources)
+            size = sum(os.path.getsize(path) for path in sources.values())
+            label = f"{size / 1024:.0f} KB"
+            for mode in ('json', 'snapshot'):
+                load_ms, memory = run(directory, mode)
+                print(f"{label:>10} {mode:>9} {load_ms:>9.2f} {memory['Rss']:>8.0f} {memory['Pss']:>8.0f} "
+                      f"{memory['Private_Dirty']:>8.0f}")
+            print(f"{'':>10} snapshot file: {os.path.getsize(snapshot_path) / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == '--worker':
+        worker(sys.argv[2], sys.argv[3])
+    else:
+        main()
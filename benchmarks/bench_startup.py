@@ -0,0 +1,266 @@
+# benchmarks/bench_startup.py
+#
+# Cold-start time and per-worker memory for app.py and app1.py.
+#
+# Cold start: each app is imported in fresh interpreters and the benchmark
+# reports the median time to import it, to answer its first webhook (a
+# greeting, so no model call), and to boot with no compiled snapshot. It
+# also times the SDK imports that are now deferred until first use
+# (twilio.rest, google.genai).
+#
+# Memory: the benchmark acts as a pre-forking server (like gunicorn's master)
+# and starts WORKERS workers on one listening socket in three modes:
+#
+#   import-after-fork  every worker imports the app itself (no --preload);
+#   preload            the master imports the app and forks the workers;
+#   preload+freeze     as gunicorn.conf.py does it: GC off while loading,
+#                      create_app() collects and freezes, and each worker
+#                      turns the GC back on.
+#
+# Each mode serves some synthetic webhook traffic against the fake Twilio and
+# Gemini servers. The benchmark then reads every worker's
+# /proc/<pid>/smaps_rollup. It reads it again after making each worker run a
+# full collection (SIGUSR1), as a long-running worker eventually does.
+# Private memory (USS) cannot be shared; PSS charges shared pages to the
+# processes in equal parts. The knowledge base is --kb-scale times the real one.
+# Linux only. Run from the project root:
+#
+#     python -m benchmarks.bench_startup --app app1 --output startup.json
+
+import argparse
+import gc
+import importlib
+import json
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_load import current_commit, prepare, run_load, synthetic_messages
+from benchmarks.fake_gemini import FakeGeminiServer
+from benchmarks.fake_twilio import FakeTwilioServer
+
+MODES = ('import-after-fork', 'preload', 'preload+freeze')
+
+COLD_START = """
+import sys, time
+start = time.perf_counter()
+import {app} as module
+imported = time.perf_counter()
+client = module.app.test_client()
+client.post('/webhook', data={{'From': 'whatsapp:+911', 'Body': 'hi', 'MessageSid': 'SM1'}})
+answered = time.perf_counter()
+print((imported - start) * 1e3, (answered - imported) * 1e3)
+"""
+
+
+def smaps(pid):
+    """Returns the memory of process pid in KB: Rss, Pss, and Uss (private clean + private dirty)."""
+    stats = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:', 'Private_Clean:', 'Private_Dirty:'):
+                stats[parts[0][:-1]] = int(parts[1])
+    return {'Rss': stats['Rss'], 'Pss': stats['Pss'], 'Uss': stats['Private_Clean'] + stats['Private_Dirty']}
+
+
+# --- Pre-forking server (runs in its own process) ---
+
+def serve_forked(app_name, fd, workers, mode):
+    """
+    Master process: loads the app before or after forking workers, depending
+    on mode, then waits until it is terminated.
+    """
+    import logging
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    if mode == 'preload+freeze':
+        gc.disable()
+    app = None
+    if mode != 'import-after-fork':
+        module = importlib.import_module(app_name)
+        app = module.create_app() if mode == 'preload+freeze' else module.app
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            gc.enable()
+            if app is None:
+                app = importlib.import_module(app_name).app
+            signal.signal(signal.SIGUSR1, lambda *_: gc.collect())
+            server = make_server('127.0.0.1', 0, app, threaded=True, fd=fd)
+            # One write() per line, so the workers' lines cannot interleave in the pipe.
+            os.write(1, f"ready {os.getpid()}\n".encode())
+            os.dup2(2, 1)
+            server.serve_forever()
+            os._exit(0)
+        children.append(pid)
+
+    def stop(*_):
+        for child in children:
+            os.kill(child, signal.SIGTERM)
+        for child in children:
+            os.waitpid(child, 0)
+        os._exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    while True:
+        signal.pause()
+
+
+class ForkingServer:
+    """Runs serve_forked() in a subprocess and collects the workers' pids."""
+
+    def __init__(self, app_name, workers, mode, env):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(1024)
+        self.sock.set_inheritable(True)
+        self.port = self.sock.getsockname()[1]
+        fd = self.sock.fileno()
+        started = time.perf_counter()
+        self.master = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.bench_startup', '--master', app_name, str(fd), str(workers), mode],
+            env=env, pass_fds=(fd,), stdout=subprocess.PIPE, text=True,
+        )
+        self.workers = []
+        for _ in range(workers):
+            line = self.master.stdout.readline().split()
+            if not line or line[0] != 'ready':
+                self.stop()
+                raise RuntimeError(f"A {app_name} worker failed to start ({mode})")
+            self.workers.append(int(line[1]))
+        self.ready_seconds = time.perf_counter() - started
+
+    def collect_garbage(self):
+        for pid in self.workers:
+            os.kill(pid, signal.SIGUSR1)
+        time.sleep(1)
+
+    def stop(self):
+        self.master.terminate()
+        self.master.wait()
+        self.sock.close()
+
+
+# --- Measurements ---
+
+def cold_start(app_name, env, runs):
+    """Median import and first-request times of app_name in fresh interpreters, in ms."""
+    imports, first_requests, processes = [], [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, '-c', COLD_START.format(app=app_name)], env=env,
+                             capture_output=True, text=True, check=True).stdout.split()
+        processes.append((time.perf_counter() - start) * 1e3)
+        imports.append(float(out[-2]))
+        first_requests.append(float(out[-1]))
+    return {
+        'process_ms': round(statistics.median(processes), 1),
+        'import_ms': round(statistics.median(imports), 1),
+        'first_request_ms': round(statistics.median(first_requests), 1),
+    }
+
+
+def import_cost(module, env, runs):
+    """Median time to import one module in a fresh interpreter, in ms."""
+    code = f"import time; start = time.perf_counter(); import {module}; print((time.perf_counter() - start) * 1e3)"
+    return round(statistics.median(
+        float(subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True,
+                             check=True).stdout) for _ in range(runs)
+    ), 1)
+
+
+def average(samples, field):
+    return round(statistics.mean(s[field] for s in samples) / 1024, 1)
+
+
+def memory_run(args, mode, env, messages):
+    server = ForkingServer(args.app, args.workers, mode, env)
+    try:
+        run_load(server.port, messages, args.concurrency)
+        loaded = [smaps(pid) for pid in server.workers]
+        server.collect_garbage()
+        collected = [smaps(pid) for pid in server.workers]
+        master = smaps(server.master.pid)
+    finally:
+        server.stop()
+    result = {'mode': mode, 'workers': args.workers, 'ready_s': round(server.ready_seconds, 2),
+              'master_rss_mb': round(master['Rss'] / 1024, 1)}
+    for label, samples in (('after_load', loaded), ('after_gc', collected)):
+        result[label] = {
+            'worker_rss_mb': average(samples, 'Rss'),
+            'worker_uss_mb': average(samples, 'Uss'),
+            'worker_pss_mb': average(samples, 'Pss'),
+            'total_pss_mb': round((sum(s['Pss'] for s in samples) + master['Pss']) / 1024, 1),
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start time and per-worker memory of the apps.")
+    parser.add_argument('--app', default='app1', choices=['app', 'app1'])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--kb-scale', type=int, default=20,
+                        help="knowledge-base size, as a multiple of finalData.json's diseases")
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--runs', type=int, default=5, help="fresh interpreters per cold-start measurement")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    args = parser.parse_args()
+    # prepare() reads the broadcast and model settings from the load test's options.
+    args.broadcast_rate, args.broadcast_workers, args.llm_concurrency = 100, 8, None
+
+    gemini = FakeGeminiServer(latency=0.05).start()
+    twilio = FakeTwilioServer().start()
+    messages = synthetic_messages(args.requests, 100, random.Random(1))
+    report = {'commit': current_commit(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'config': vars(args)}
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = prepare(directory, 1000, args.kb_scale, gemini, twilio, args)
+
+        print(f"{args.app}: cold start, median of {args.runs} fresh interpreters")
+        report['cold_start'] = cold_start(args.app, env, args.runs)
+        for name, value in report['cold_start'].items():
+            print(f"  {name:<24} {value:>8.1f}")
+        boot_env = dict(env, SNAPSHOT_DIR=os.path.join(directory, 'empty-snapshots'))
+        report['first_boot_ms'] = cold_start(args.app, boot_env, 1)['import_ms']
+        print(f"  {'import, no snapshot yet':<24} {report['first_boot_ms']:>8.1f}")
+        report['deferred_imports_ms'] = {module: import_cost(module, env, args.runs)
+                                         for module in ('twilio.rest', 'google.genai')}
+        for module, value in report['deferred_imports_ms'].items():
+            print(f"  {'deferred: ' + module:<24} {value:>8.1f}")
+
+        print(f"\n{args.workers} workers, knowledge base x{args.kb_scale}, {args.requests} requests (MB per worker)")
+        print(f"{'mode':<18} {'ready s':>8} {'':>10} {'RSS':>7} {'USS':>7} {'PSS':>7} {'total PSS':>10}")
+        report['memory'] = []
+        for mode in MODES:
+            result = memory_run(args, mode, env, messages)
+            report['memory'].append(result)
+            for label in ('after_load', 'after_gc'):
+                m = result[label]
+                print(f"{mode if label == 'after_load' else '':<18} "
+                      f"{result['ready_s'] if label == 'after_load' else '':>8} {label:>10} "
+                      f"{m['worker_rss_mb']:>7.1f} {m['worker_uss_mb']:>7.1f} {m['worker_pss_mb']:>7.1f} "
+                      f"{m['total_pss_mb']:>10.1f}", flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 6 and sys.argv[1] == '--master':
+        serve_forked(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]), sys.argv[5])
+    else:
+        main()
@@ -0,0 +1,239 @@
+# benchmarks/bench_status_callbacks.py
+#
+# Load test for /message-status, the endpoint Twilio posts delivery-status
+# callbacks to (delivery_status.py).
+#
+# The benchmark simulates --broadcasts broadcasts to --numbers subscribers.
+# Every message produces the callbacks Twilio would send: queued and sent,
+# then delivered (and sometimes read), or undelivered with error 63024 for
+# the --dead-rate fraction of numbers that cannot be reached. A
+# --duplicate-rate fraction of callbacks is posted twice, as Twilio does when
+# it retries. Each callback is signed for STATUS_CALLBACK_URL with the
+# workers' auth token, as Twilio signs them. Closed-loop clients post them to the app's workers (as in
+# bench_load.py), each message's callbacks in order, as fast as the workers
+# acknowledge them.
+#
+# It reports:
+#   - the acknowledgement throughput and its latency percentiles;
+#   - how long after the last acknowledgement every event was in SQLite;
+#   - whether exactly the dead numbers are now skipped by broadcasts;
+#   - the store's own capacity: the same callbacks recorded in-process,
+#     without HTTP, as fast as the batch writer stores them.
+#
+# Run from the project root:
+#
+#     python -m benchmarks.bench_status_callbacks --numbers 20000 --broadcasts 3 --output status.json
+
+import argparse
+import http.client
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import parse_qsl, urlencode
+
+from twilio.request_validator import RequestValidator
+
+from benchmarks.bench_load import (ACCOUNT_SID, AUTH_TOKEN, BOT_NUMBER, Workers, current_commit, outcome_counters,
+                                   percentile, prepare)
+from benchmarks.fake_gemini import FakeGeminiServer
+from benchmarks.fake_twilio import FakeTwilioServer
+
+UNREACHABLE_ERROR = '63024'
+CALLBACK_URL = 'https://bot.example.org/message-status'
+
+
+def status_form(sid, number, status, error_code=None):
+    """A form payload shaped like the ones Twilio posts to a StatusCallback URL."""
+    form = {
+        'SmsSid': sid, 'SmsStatus': status, 'MessageStatus': status, 'ChannelToAddress': number.split(':')[-1],
+        'To': number, 'ChannelPrefix': 'whatsapp', 'MessageSid': sid, 'AccountSid': ACCOUNT_SID,
+        'From': f"whatsapp:{BOT_NUMBER}", 'ApiVersion': '2010-04-01', 'ChannelInstallSid': 'XE' + '0' * 32,
+    }
+    if error_code:
+        form['ErrorCode'] = error_code
+    return form
+
+
+def callbacks(numbers, dead, broadcasts, duplicate_rate, rng):
+    """
+    Returns one [(payload, signature)] list per message, in the order Twilio
+    sends them, and the number of distinct events.
+    """
+    validator = RequestValidator(AUTH_TOKEN)
+    messages, distinct = [], 0
+    for _ in range(broadcasts):
+        for number in numbers:
+            sid = 'SM' + uuid.uuid4().hex
+            if number in dead:
+                statuses = [('queued', None), ('sent', None), ('undelivered', UNREACHABLE_ERROR)]
+            else:
+                statuses = [('queued', None), ('sent', None), ('delivered', None)]
+                if rng.random() < 0.3:
+                    statuses.append(('read', None))
+            distinct += len(statuses)
+            payloads = []
+            for status, error_code in statuses:
+                form = status_form(sid, number, status, error_code)
+                payload = (urlencode(form), validator.compute_signature(CALLBACK_URL, form))
+                payloads.append(payload)
+                if rng.random() < duplicate_rate:
+                    payloads.append(payload)
+            messages.append(payloads)
+    return messages, distinct
+
+
+def post_all(port, messages, concurrency):
+    """Posts every message's callbacks from concurrency closed-loop clients; returns latencies and errors."""
+    shards = [messages[i::concurrency] for i in range(concurrency)]
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def client(shard):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        local_latencies, local_errors = [], []
+        for payloads in shard:
+            for body, signature in payloads:
+                start = time.perf_counter()
+                try:
+                    conn.request('POST', '/message-status', body,
+                                 {'Content-Type': 'application/x-www-form-urlencoded', 'X-Twilio-Signature': signature})
+                    response = conn.getresponse()
+                    response.read()
+                    if response.status != 204:
+                        local_errors.append(response.status)
+                except (OSError, http.client.HTTPException) as e:
+                    local_errors.append(type(e).__name__)
+                    conn.close()
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                local_latencies.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors.extend(local_errors)
+
+    threads = [threading.Thread(target=client, args=(shard,)) for shard in shards if shard]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors
+
+
+def stored_events(path):
+    if not os.path.exists(path):
+        return 0
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM status_events').fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        conn.close()
+
+
+def writer_capacity(path, messages):
+    """Records every callback in-process and returns the events stored per second by the batch writer."""
+    from delivery_status import DeliveryStatusRecorder
+
+    forms = [dict(parse_qsl(body)) for payloads in messages for body, _ in payloads]
+    recorder = DeliveryStatusRecorder(path, max_queue=len(forms))
+    start = time.perf_counter()
+    for form in forms:
+        recorder.record(form)
+    while True:
+        stats = recorder.stats()
+        if stats['errors'] or stats['written'] + stats['duplicates'] >= len(forms):
+            break
+        time.sleep(0.01)
+    return round(len(forms) / (time.perf_counter() - start), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the delivery-status callback endpoint.")
+    parser.add_argument('--app', default='app1', choices=['app', 'app1'])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--numbers', type=int, default=20000, help="subscribers per broadcast")
+    parser.add_argument('--broadcasts', type=int, default=3)
+    parser.add_argument('--dead-rate', type=float, default=0.05, help="fraction of numbers that never get messages")
+    parser.add_argument('--duplicate-rate', type=float, default=0.02, help="fraction of callbacks posted twice")
+    parser.add_argument('--timeout', type=float, default=120, help="seconds to wait for the events to be stored")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    args = parser.parse_args()
+    # prepare() reads the broadcast and model settings from the load test's options.
+    args.broadcast_rate, args.broadcast_workers, args.llm_concurrency = 100, 8, None
+
+    rng = random.Random(1)
+    numbers = [f"whatsapp:+9181{n:08d}" for n in range(args.numbers)]
+    dead = set(rng.sample(numbers, int(len(numbers) * args.dead_rate)))
+    messages, distinct = callbacks(numbers, dead, args.broadcasts, args.duplicate_rate, rng)
+    posted = sum(len(payloads) for payloads in messages)
+    gemini = FakeGeminiServer().start()
+    twilio = FakeTwilioServer().start()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = prepare(directory, 10, 1, gemini, twilio, args)
+        env['STATUS_CALLBACK_URL'] = CALLBACK_URL
+        database = env['DELIVERY_DB']
+        workers = Workers(args.app, args.workers, env)
+        try:
+            print(f"Posting {posted} callbacks ({distinct} distinct) for {len(messages)} messages "
+                  f"from {args.concurrency} clients to {args.workers} workers...", flush=True)
+            start = time.perf_counter()
+            latencies, errors = post_all(workers.port, messages, args.concurrency)
+            acknowledged = time.perf_counter()
+            while stored_events(database) < distinct and time.perf_counter() - acknowledged < args.timeout:
+                time.sleep(0.05)
+            stored = time.perf_counter()
+            # Leave time for the workers' metrics files to be flushed.
+            time.sleep(1)
+            outcomes = outcome_counters(workers.port, names=('delivery_status',))['delivery_status']
+        finally:
+            workers.stop()
+
+        from delivery_status import undeliverable_numbers
+        skipped = undeliverable_numbers(database)
+        events = stored_events(database)
+        capacity = writer_capacity(os.path.join(directory, 'capacity.db'), messages)
+
+    ack_seconds = acknowledged - start
+    result = {
+        'callbacks': posted, 'distinct_events': distinct, 'errors': len(errors),
+        'error_kinds': {str(kind): errors.count(kind) for kind in set(errors)},
+        'ack_throughput_per_s': round(posted / ack_seconds, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1e3, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1e3, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1e3, 2),
+        'stored_events': events,
+        'store_lag_s': round(stored - acknowledged, 2),
+        'stored_per_s': round(events / (stored - start), 1),
+        'counters': outcomes,
+        'dead_numbers': len(dead),
+        'skipped_numbers': len(skipped),
+        'skipped_exactly_dead': skipped == dead,
+        'writer_capacity_per_s': capacity,
+    }
+    print(f"  acknowledged      {result['ack_throughput_per_s']:>10.1f} callbacks/s, {len(errors)} errors")
+    print(f"  latency           p50 {result['p50_ms']:.2f} ms, p95 {result['p95_ms']:.2f} ms, "
+          f"p99 {result['p99_ms']:.2f} ms")
+    print(f"  stored            {events} of {distinct} events, {result['store_lag_s']:.2f} s after the last "
+          f"acknowledgement ({result['stored_per_s']:.1f} events/s overall)")
+    print(f"  counters          {outcomes}")
+    print(f"  skipped numbers   {len(skipped)} (dead: {len(dead)}, same set: {skipped == dead})")
+    print(f"  store capacity    {capacity:>10.1f} callbacks/s (in-process, no HTTP)")
+
+    if args.output:
+        report = {'commit': current_commit(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                  'config': vars(args), 'result': result}
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+# benchmarks/bench_streaming.py
+#
+# Time to first message and to the complete answer for app1.py's reply modes.
+#
+# app1.py runs in worker processes (as in bench_load.py) against the fake
+# Twilio server, which records when each message arrives, and the fake Gemini
+# server. The fake model waits --first-token seconds and then generates a
+# multi-paragraph answer of --answer-chars characters at --tokens-per-second.
+# Every request is an open question from a different user, so each one needs
+# a model call, and the answer cache is disabled (CACHE_TTL=0). Each client
+# asks its next question once the previous answer has fully arrived, so every
+# mode runs at the same concurrency.
+#
+# For each mode the benchmark reports, in percentiles over all answers:
+#
+#   webhook   how long Twilio waits for the webhook's response;
+#   first     when the user gets the first message of the answer;
+#   complete  when the user has the whole answer;
+#   messages  how many WhatsApp messages the answer took.
+#
+# In sync mode the answer is the webhook's TwiML response, so all three
+# times are the same. In async mode it is sent in one go once generated. In
+# stream mode its first part is sent as soon as it has been generated.
+# Run from the project root:
+#
+#     python -m benchmarks.bench_streaming --requests 64 --concurrency 8 --output streaming.json
+
+import argparse
+import http.client
+import json
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks.bench_load import (OPEN_QUESTIONS, Workers, current_commit, outcome_counters, percentile, prepare,
+                                   twilio_form)
+from benchmarks.fake_gemini import FakeGeminiServer
+from benchmarks.fake_twilio import FakeTwilioServer
+
+MODES = ('sync', 'async', 'stream')
+
+SENTENCES = [
+    "Dengue is a viral infection spread by Aedes mosquitoes, which bite mostly during the day.",
+    "Typical symptoms are a sudden high fever, severe headache, pain behind the eyes, and joint and muscle pain.",
+    "Some people also get a rash, nausea or vomiting a few days after the fever starts.",
+    "Drink plenty of fluids such as water, oral rehydration solution, coconut water and soups.",
+    "Paracetamol can help with fever and pain, but avoid aspirin and ibuprofen, as they can increase bleeding.",
+    "Go to a hospital straight away if you notice severe stomach pain, repeated vomiting or bleeding gums.",
+    "To prevent dengue, empty standing water around your home and use mosquito nets and repellents.",
+    "Please consult a qualified healthcare professional for a diagnosis and treatment.",
+]
+DISEASES = ['dengue', 'malaria', 'typhoid', 'cholera', 'tuberculosis', 'hepatitis', 'chikungunya', 'covid']
+# The apps strip whitespace around each message, so answers are compared without it.
+COMPACT = str.maketrans('', '', ' \n\t')
+
+
+def long_answer(chars):
+    """A multi-paragraph answer of at most chars characters, three sentences per paragraph."""
+    sentences = []
+    while len(" ".join(sentences)) + len(SENTENCES[len(sentences) % len(SENTENCES)]) + 3 <= chars:
+        sentences.append(SENTENCES[len(sentences) % len(SENTENCES)])
+    return "\n\n".join(" ".join(sentences[i:i + 3]) for i in range(0, len(sentences), 3))
+
+
+def received(twilio, user):
+    """The [(arrived, body)] messages the fake Twilio server has accepted for user."""
+    with twilio.lock:
+        return [(arrived, body) for arrived, to, body in twilio.messages if to == user]
+
+
+def is_complete(messages, answer):
+    return "".join(body for _, body in messages).translate(COMPACT).startswith(answer.translate(COMPACT))
+
+
+def ask(port, requests, concurrency, twilio, answer, timeout, wait):
+    """
+    Sends one open question per user from concurrency closed-loop clients.
+    With wait (the background reply modes), a client waits until its user has
+    the whole answer, or timeout seconds, before asking the next question. Returns
+    {user: (sent, answered, [(arrived, body)])} in monotonic time.
+    """
+    users = [f"whatsapp:+9175{n:08d}" for n in range(requests)]
+    shards = [users[i::concurrency] for i in range(concurrency)]
+    results = {}
+    lock = threading.Lock()
+
+    def client(shard):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        for n, user in enumerate(shard):
+            body = OPEN_QUESTIONS[n % len(OPEN_QUESTIONS)].format(d=DISEASES[hash(user) % len(DISEASES)])
+            sent = time.monotonic()
+            conn.request('POST', '/webhook', twilio_form(user, body), {'Content-Type': 'application/x-www-form-urlencoded'})
+            conn.getresponse().read()
+            answered = time.monotonic()
+            messages = received(twilio, user) if wait else []
+            while wait and not is_complete(messages, answer) and time.monotonic() < sent + timeout:
+                time.sleep(0.01)
+                messages = received(twilio, user)
+            with lock:
+                results[user] = (sent, answered, messages)
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(shard,)) for shard in shards if shard]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def summarize(samples):
+    return {'p50_ms': round(percentile(samples, 0.50) * 1e3, 1), 'p95_ms': round(percentile(samples, 0.95) * 1e3, 1)}
+
+
+def mode_run(args, mode, gemini, twilio, answer):
+    with twilio.lock:
+        twilio.messages.clear()
+    with tempfile.TemporaryDirectory() as directory:
+        env = prepare(directory, 10, 1, gemini, twilio, args)
+        env.update({'REPLY_MODE': mode, 'CACHE_TTL': '0', 'REPLY_WORKERS': str(args.concurrency)})
+        workers = Workers('app1', args.workers, env)
+        try:
+            results = ask(workers.port, args.requests, args.concurrency, twilio, answer, args.timeout,
+                          wait=mode != 'sync')
+            outcomes = outcome_counters(workers.port)['llm']
+        finally:
+            workers.stop()
+
+    webhook, first, complete, messages, missing = [], [], [], [], 0
+    for user, (sent, answered, parts) in results.items():
+        webhook.append(answered - sent)
+        if mode == 'sync':
+            first.append(answered - sent)
+            complete.append(answered - sent)
+            messages.append(1)
+            continue
+        if not parts or not is_complete(parts, answer):
+            missing += 1
+            continue
+        first.append(parts[0][0] - sent)
+        complete.append(parts[-1][0] - sent)
+        messages.append(len(parts))
+    return {
+        'mode': mode, 'answers': len(complete), 'missing': missing,
+        'webhook': summarize(webhook), 'first_message': summarize(first), 'complete': summarize(complete),
+        'messages_per_answer': round(statistics.mean(messages), 2) if messages else 0.0,
+        'llm': outcomes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time to first message and to the full answer per reply mode.")
+    parser.add_argument('--modes', default=','.join(MODES), help="comma-separated reply modes")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--requests', type=int, default=64)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--first-token', type=float, default=0.5, help="seconds before the model's first token")
+    parser.add_argument('--tokens-per-second', type=float, default=100.0, help="the fake model's generation rate")
+    parser.add_argument('--answer-chars', type=int, default=1500,
+                        help="answer length (the sync reply must fit in one 1600-character message)")
+    parser.add_argument('--twilio-latency', type=float, default=0.05)
+    parser.add_argument('--timeout', type=float, default=60, help="seconds to wait for each background answer")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    args = parser.parse_args()
+    # prepare() reads the broadcast and model settings from the load test's options.
+    args.broadcast_rate, args.broadcast_workers, args.llm_concurrency = 100, 8, args.concurrency
+
+    answer = long_answer(args.answer_chars)
+    gemini = FakeGeminiServer(latency=args.first_token, reply=answer, tokens_per_second=args.tokens_per_second).start()
+    twilio = FakeTwilioServer(latency=args.twilio_latency, record=True).start()
+    report = {'commit': current_commit(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+              'config': vars(args), 'answer_chars': len(answer), 'runs': []}
+
+    print(f"{args.requests} questions, {len(answer)}-character answers, first token after {args.first_token}s, "
+          f"{args.tokens_per_second:g} tokens/s (ms)")
+    print(f"{'mode':<8} {'answers':>8} {'webhook p50':>12} {'first p50':>10} {'first p95':>10} "
+          f"{'full p50':>10} {'full p95':>10} {'msgs':>6} {'fallback':>9}")
+    for mode in args.modes.split(','):
+        result = mode_run(args, mode, gemini, twilio, answer)
+        report['runs'].append(result)
+        print(f"{mode:<8} {result['answers']:>8} {result['webhook']['p50_ms']:>12.1f} "
+              f"{result['first_message']['p50_ms']:>10.1f} {result['first_message']['p95_ms']:>10.1f} "
+              f"{result['complete']['p50_ms']:>10.1f} {result['complete']['p95_ms']:>10.1f} "
+              f"{result['messages_per_answer']:>6.2f} {sum(v for k, v in result['llm'].items() if k not in ('calls', 'succeeded')):>9}", flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
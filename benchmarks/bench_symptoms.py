@@ -0,0 +1,71 @@
+# benchmarks/bench_symptoms.py
+#
+# Micro-benchmark for the symptom ranker in symptom_ranker.py.
+#
+# Pads the real knowledge base with synthetic diseases, each listing a handful
+# of symptoms drawn from a synthetic vocabulary plus real symptom words, and
+# measures build time and per-message ranking latency. Run from the project
+# root:
+#
+#     python -m benchmarks.bench_symptoms
+
+import json
+import random
+import string
+import time
+
+from symptom_ranker import SymptomRanker, load_symptom_profiles
+
+SIZES = [16, 1000, 10000, 50000]
+ROUNDS = 500
+VOCABULARY_SIZE = 3000
+
+MESSAGES = [
+    "fever, joint pain and rash",
+    "I have a persistent cough, night sweats and weight loss",
+    "runny nose sneezing sore throat",
+    "headache vomiting and chills since yesterday",
+    "hello there",
+]
+
+REAL_WORDS = ["fever", "cough", "rash", "headache", "fatigue", "vomiting", "pain", "chills", "nausea", "sweats"]
+
+
+def synthetic_profiles(base, size):
+    """Returns a copy of the symptom profiles padded with random diseases."""
+    rng = random.Random(size)
+    vocabulary = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 10)))
+                  for _ in range(VOCABULARY_SIZE)] + REAL_WORDS
+    profiles = dict(base)
+    while len(profiles) < size:
+        symptoms = [" ".join(rng.sample(vocabulary, rng.randint(1, 3))) for _ in range(rng.randint(4, 10))]
+        profiles[f"synthetic_{len(profiles)}"] = (f"Synthetic {len(profiles)}", symptoms)
+    return profiles
+
+
+def time_per_message(ranker):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for message in MESSAGES:
+            ranker.rank(message)
+    return (time.perf_counter() - start) / (ROUNDS * len(MESSAGES)) * 1e6
+
+
+def main():
+    with open('diseases.json', encoding='utf-8') as f:
+        diseases_data = json.load(f)
+    with open('finalData.json', encoding='utf-8') as f:
+        health_data = json.load(f)
+    base = load_symptom_profiles(diseases_data, health_data)
+
+    print(f"{'diseases':>10} {'terms':>8} {'build ms':>10} {'rank us/msg':>12}")
+    for size in SIZES:
+        profiles = synthetic_profiles(base, size)
+        start = time.perf_counter()
+        ranker = SymptomRanker(profiles)
+        build_ms = (time.perf_counter() - start) * 1e3
+        print(f"{len(ranker):>10} {len(ranker.vocabulary):>8} {build_ms:>10.1f} {time_per_message(ranker):>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# benchmarks/fake_gemini.py
+#
+# A local stand-in for the Gemini generateContent API.
+#
+# Accepts the POST /<version>/models/<model>:generateContent and
+# :streamGenerateContent requests the google-genai client sends. It answers
+# after a configurable latency and injects 429 and 5xx errors at
+# configurable rates. Latency can be changed while the server runs, so a
+# benchmark can make the model slow down and recover. Point app1.py at it
+# with GEMINI_BASE_URL=http://127.0.0.1:<port>.
+#
+# With tokens_per_second set, the reply is also "generated" at that rate,
+# about four characters per token. generateContent returns the whole reply
+# once generation would be finished. streamGenerateContent sends it as
+# server-sent events as it is generated, one event every few tokens.
+#
+#     python -m benchmarks.fake_gemini --port 8098 --latency 1.5 --error-rate 0.1
+
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# How many tokens each streamed event carries.
+STREAM_TOKENS_PER_EVENT = 4
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    """A threaded HTTP server that answers generateContent requests with a canned reply."""
+
+    daemon_threads = True
+    # Bursts of concurrent clients overflow the default listen backlog of 5.
+    request_queue_size = 128
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0, error_rate=0.0, throttle_rate=0.0,
+                 reply="This is a reply from the fake model.", tokens_per_second=0.0):
+        super().__init__(address, FakeGeminiHandler)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.reply = reply
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serves requests in a background thread and returns self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def handle_error(self, request, client_address):
+        # Clients that hit their deadline hang up mid-reply; that is expected here.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _usage(self, request_body):
+        # Roughly four bytes per token, like the real tokenizer on English text.
+        return {'promptTokenCount': len(request_body) // 4, 'candidatesTokenCount': len(self.server.reply) // 4}
+
+    def _stream(self, request_body):
+        """Sends the reply as server-sent events, a few tokens at a time, at the server's generation rate."""
+        server = self.server
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        reply = server.reply
+        step = STREAM_TOKENS_PER_EVENT * 4
+        pieces = [reply[i:i + step] for i in range(0, len(reply), step)]
+        for n, piece in enumerate(pieces):
+            if server.tokens_per_second:
+                time.sleep(STREAM_TOKENS_PER_EVENT / server.tokens_per_second)
+            event = {'candidates': [{'content': {'role': 'model', 'parts': [{'text': piece}]}}]}
+            if n == len(pieces) - 1:
+                event['candidates'][0]['finishReason'] = 'STOP'
+                event['usageMetadata'] = self._usage(request_body)
+            data = f"data: {json.dumps(event)}\r\n\r\n".encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        request_body = self.rfile.read(length)
+        method = self.path.split('?')[0].rsplit(':', 1)[-1]
+        if method not in ('generateContent', 'streamGenerateContent'):
+            return self._reply(404, {'error': {'code': 404, 'message': 'Not found', 'status': 'NOT_FOUND'}})
+
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            if server.latency:
+                time.sleep(server.latency)
+            roll = random.random()
+            if roll < server.throttle_rate:
+                return self._reply(429, {'error': {'code': 429, 'message': 'Resource exhausted',
+                                                   'status': 'RESOURCE_EXHAUSTED'}})
+            if roll < server.throttle_rate + server.error_rate:
+                return self._reply(503, {'error': {'code': 503, 'message': 'The model is overloaded',
+                                                   'status': 'UNAVAILABLE'}})
+            if method == 'streamGenerateContent':
+                return self._stream(request_body)
+            if server.tokens_per_second:
+                time.sleep(math.ceil(len(server.reply) / 4) / server.tokens_per_second)
+            self._reply(200, {
+                'candidates': [{
+                    'content': {'role': 'model', 'parts': [{'text': server.reply}]},
+                    'finishReason': 'STOP',
+                }],
+                'usageMetadata': self._usage(request_body),
+            })
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake of the Gemini generateContent API.")
+    parser.add_argument('--port', type=int, default=8098)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument('--tokens-per-second', type=float, default=0.0, help="generation rate (0: instant)")
+    args = parser.parse_args()
+
+    server = FakeGeminiServer(('127.0.0.1', args.port), args.latency, args.error_rate, args.throttle_rate,
+                              tokens_per_second=args.tokens_per_second)
+    print(f"Fake Gemini API listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# benchmarks/fake_twilio.py
+#
+# A local stand-in for the Twilio messages API.
+#
+# Accepts the same POST /2010-04-01/Accounts/<sid>/Messages.json requests the
+# twilio client sends, answers after a configurable latency, and injects 429
+# and 5xx errors at configurable rates. Every accepted message is counted per
+# recipient so a run can be checked for double sends. With record=True the
+# server also keeps (arrival time, recipient, body) for every accepted message,
+# so a benchmark can see when each part of a reply arrived. Point the apps or
+# broadcast.py at it with TWILIO_API_BASE_URL=http://127.0.0.1:<port>.
+#
+#     python -m benchmarks.fake_twilio --port 8099 --latency 0.05 --error-rate 0.05
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class FakeTwilioServer(ThreadingHTTPServer):
+    """A threaded HTTP server that records the messages it accepts."""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0, error_rate=0.0, throttle_rate=0.0, record=False):
+        super().__init__(address, FakeTwilioHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.sent = Counter()
+        # (time.monotonic() on arrival, to, body) per accepted message, if record is set.
+        self.messages = [] if record else None
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serves requests in a background thread and returns self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class FakeTwilioHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        arrived = time.monotonic()
+        length = int(self.headers.get('Content-Length', 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        if server.latency:
+            time.sleep(server.latency)
+
+        with server.lock:
+            server.requests += 1
+        roll = random.random()
+        if roll < server.throttle_rate:
+            return self._reply(429, {'code': 20429, 'message': 'Too Many Requests', 'status': 429})
+        if roll < server.throttle_rate + server.error_rate:
+            return self._reply(503, {'code': 20503, 'message': 'Service Unavailable', 'status': 503})
+
+        to = form.get('To', [''])[0]
+        with server.lock:
+            server.sent[to] += 1
+            if server.messages is not None:
+                server.messages.append((arrived, to, form.get('Body', [''])[0]))
+        self._reply(201, {
+            'sid': 'SM' + uuid.uuid4().hex,
+            'to': to,
+            'from': form.get('From', [''])[0],
+            'body': form.get('Body', [''])[0],
+            'status': 'queued',
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake of the Twilio messages API.")
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="fraction of requests answered with 429")
+    args = parser.parse_args()
+
+    server = FakeTwilioServer(('127.0.0.1', args.port), args.latency, args.error_rate, args.throttle_rate)
+    print(f"Fake Twilio API listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,18 @@
 # broadcast.py
 #
 # A command-line tool to send WhatsApp broadcast messages to all subscribers.
+# Sends go through the same broadcast engine as the /send-broadcast page, so an
+# interrupted run can be resumed with:  python broadcast.py --resume <job_id>
 
-import json
 import os
-from twilio.rest import Client
+import sys
 from dotenv import load_dotenv
+from subscribers import count_subscribers
+from broadcast_engine import BroadcastEngine, create_twilio_client, twilio_sender
 
 # Initialize the environment variables
 load_dotenv()
 
-# Subscriber numbers file
-SUBSCRIBERS_FILE = 'broadcast_subscribers.json'
-
 # Twilio account credentials (replace with your own)
 # It is recommended to use environment variables for these
 ACCOUNT_SID = os.getenv("ACCOUNT_SID")
@@ -20,43 +20,50 @@ AUTH_TOKEN = os.getenv("AUTH_TOKEN")
 TWILIO_PHONE_NUMBER = f'whatsapp:{os.getenv("TWILIO_PHONE_NUMBER")}'  # WhatsApp sandbox number
 
 # Initialize the Twilio client
-client = Client(ACCOUNT_SID, AUTH_TOKEN)
+client = create_twilio_client(ACCOUNT_SID, AUTH_TOKEN)
 
-def get_subscribers():
-    """Reads the list of subscribers from the JSON file."""
-    try:
-        with open(SUBSCRIBERS_FILE, 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        print(f"Error: Could not find or read {SUBSCRIBERS_FILE}. Please ensure it exists and is a valid JSON file.")
-        return []
+# The 'from_' number needs to be a WhatsApp-enabled Twilio number
+# and subscribers' numbers should be in 'whatsapp:<E.164 format>'
+# Jobs are resumed explicitly with --resume; the web workers resume abandoned ones on their own.
+engine = BroadcastEngine(twilio_sender(client, TWILIO_PHONE_NUMBER), auto_resume=False)
+
+def print_progress(progress):
+    print(f"Progress: {progress['sent']} sent, {progress['failed']} failed, {progress['skipped']} skipped, "
+          f"{progress['pending']} pending of {progress['total']}")
 
 def send_broadcast(broadcast_message):
     """
     Sends a broadcast message to all subscribers.
     """
-    subscribers = get_subscribers()
-    if not subscribers:
+    total = count_subscribers()
+    if not total:
         print("There are no subscribers to send a broadcast to.")
         return
 
-    print(f"Sending broadcast to {len(subscribers)} subscribers...")
-    for number in subscribers:
-        try:
-            # The 'from_' number needs to be a WhatsApp-enabled Twilio number
-            # and subscribers' numbers should be in 'whatsapp:<E.164 format>'
-            message = client.messages.create(
-                body=broadcast_message,
-                from_=TWILIO_PHONE_NUMBER,
-                to=number
-            )
-            print(f"Message sent to {number}: {message.sid}")
-        except Exception as e:
-            print(f"Failed to send message to {number}: {e}")
+    job_id = engine.create_job(broadcast_message)
+    print(f"Sending broadcast to {total} subscribers (job {job_id})...")
+    engine.run(job_id, on_progress=print_progress)
+
+def resume_broadcast(job_id):
+    """
+    Resumes an interrupted broadcast job without re-sending to anyone it already reached.
+    """
+    if engine.progress(job_id) is None:
+        print(f"Unknown broadcast job: {job_id}")
+        return
+    print(f"Resuming broadcast job {job_id}...")
+    if not engine.run(job_id, on_progress=print_progress):
+        print(f"Broadcast job {job_id} is being sent by another process; not resuming it.")
+        return
+    print_progress(engine.progress(job_id))
 
 if __name__ == "__main__":
     print("WhatsApp Broadcast Tool")
     print("-----------------------")
+
+    if len(sys.argv) == 3 and sys.argv[1] == '--resume':
+        resume_broadcast(sys.argv[2])
+        sys.exit(0)
     
     # Use a raw string for multi-line input to avoid issues
     print("Enter your broadcast message. Press Ctrl+D (or Ctrl+Z on Windows) when you are finished.")
@@ -0,0 +1,457 @@
+# broadcast_engine.py
+#
+# Concurrent, rate-limited and resumable broadcast engine shared by the
+# /send-broadcast route in app.py/app1.py and the broadcast.py command-line tool.
+#
+# A broadcast is a job stored in SQLite. Creating a job snapshots the current
+# subscriber list into a deliveries table, so a resumed run targets the same
+# audience. The engine then claims pending numbers in batches, marks them as
+# 'sending', and fans the sends out over a bounded thread pool. A token bucket
+# keeps the send rate inside the sender's messages-per-second quota, and 429 /
+# 5xx responses are retried with jittered exponential backoff, as are sends
+# whose connection could not be opened.
+#
+# Delivery is at-most-once: a number is only sent to after it has been marked
+# 'sending', and a resumed job never retries rows left in that state by a
+# crashed run (they are reported as 'unknown' instead). For the same reason a
+# send that fails without an HTTP status after the connection was opened (a
+# reset or read timeout) is never retried: Twilio may already have accepted
+# it, so it is recorded as 'unknown'.
+#
+# Numbers that keep failing (see delivery_status.py) are recorded as 'skipped'
+# when the job is created and are never sent to.
+#
+# A running job holds a lease on its row: the process running it refreshes
+# heartbeat_at every BROADCAST_HEARTBEAT_INTERVAL seconds. If that process
+# dies (a recycled or killed gunicorn worker), the heartbeat stops, and once
+# it is BROADCAST_LEASE seconds old the next start() or progress() call in
+# any worker resumes the job in a background thread (unless the engine was
+# created with auto_resume=False, as broadcast.py does). run() takes the
+# lease atomically, so a job is never run by two processes at once.
+
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from delivery_status import STATUS_CALLBACK_URL, undeliverable_numbers
+from metrics import count, stage
+from subscribers import iter_subscribers
+
+BROADCAST_DB = os.getenv('BROADCAST_DB', 'broadcasts.db')
+
+# Messages per second allowed by the sender, and how many sends may be in flight.
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '10'))
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', '8'))
+BROADCAST_MAX_RETRIES = int(os.getenv('BROADCAST_MAX_RETRIES', '5'))
+
+# Rows claimed per checkpoint. Progress is committed once per batch.
+CLAIM_BATCH_SIZE = 200
+
+# Seconds without a heartbeat after which a running job is considered abandoned and resumed.
+BROADCAST_LEASE = float(os.getenv('BROADCAST_LEASE', '60'))
+BROADCAST_HEARTBEAT_INTERVAL = 5.0
+
+# Backoff (seconds) for retried sends: full jitter between 0 and base * 2**attempt, capped.
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+
+
+def create_twilio_client(account_sid, auth_token):
+    """
+    Creates a Twilio REST client. Setting TWILIO_API_BASE_URL points it at a
+    different API host, e.g. the fake server in benchmarks/fake_twilio.py.
+    """
+    from twilio.rest import Client
+
+    client = Client(account_sid, auth_token)
+    base_url = os.getenv('TWILIO_API_BASE_URL')
+    if base_url:
+        client.api.base_url = base_url
+    return client
+
+
+class LazyTwilioClient:
+    """
+    Stands in for a Twilio REST client and builds the real one on first use,
+    once per process. Importing twilio.rest and its HTTP stack is the slowest
+    part of starting the apps, and a worker that never sends a message never
+    needs it. A requests session does not survive a fork, so a worker forked
+    after first use builds its own.
+    """
+
+    def __init__(self, account_sid, auth_token):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    self._client = create_twilio_client(self.account_sid, self.auth_token)
+                    self._pid = os.getpid()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def twilio_sender(client, from_number, status_callback=STATUS_CALLBACK_URL):
+    """
+    Returns a send(number, body) callable that sends through the Twilio
+    messages API. With status_callback set, Twilio posts each message's
+    delivery status to that URL (the apps' /message-status).
+    """
+    options = {'status_callback': status_callback} if status_callback else {}
+
+    def send(number, body):
+        message = client.messages.create(body=body, from_=from_number, to=number, **options)
+        return message.sid
+    return send
+
+
+# Exceptions (requests, urllib3 and socket) raised when a connection could not be opened at all.
+CONNECT_ERRORS = frozenset(['ConnectTimeout', 'ConnectTimeoutError', 'NewConnectionError', 'ConnectionRefusedError',
+                            'gaierror'])
+
+
+def never_sent(error):
+    """True if error shows the request never reached the server: the connection could not be opened."""
+    for _ in range(8):
+        if error is None:
+            return False
+        if any(cls.__name__ in CONNECT_ERRORS for cls in type(error).__mro__):
+            return True
+        # requests wraps urllib3's MaxRetryError, which keeps the underlying error as reason.
+        cause = error.args[0] if error.args and isinstance(error.args[0], BaseException) else None
+        error = getattr(error, 'reason', None) or cause or error.__cause__ or error.__context__
+    return False
+
+
+def is_retryable(error):
+    """
+    True for rate limiting and server errors, and for sends whose connection
+    could not be opened. Other errors without an HTTP status may have
+    reached Twilio, so resending could deliver the message twice.
+    """
+    status = getattr(error, 'status', None)
+    if status is None:
+        return never_sent(error)
+    return status == 429 or status >= 500
+
+
+class TokenBucket:
+    """A thread-safe token bucket. acquire() blocks until a token is available."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class BroadcastEngine:
+    """Creates, runs and reports on broadcast jobs."""
+
+    def __init__(self, sender, db_path=BROADCAST_DB, rate=BROADCAST_RATE,
+                 workers=BROADCAST_WORKERS, max_retries=BROADCAST_MAX_RETRIES,
+                 subscriber_source=iter_subscribers, skip_source=undeliverable_numbers, lease=BROADCAST_LEASE,
+                 auto_resume=True):
+        self.sender = sender
+        self.db_path = db_path
+        self.rate = rate
+        self.workers = workers
+        self.max_retries = max_retries
+        self.subscriber_source = subscriber_source
+        self.skip_source = skip_source
+        self.lease = lease
+        self.auto_resume = auto_resume
+        self._bucket = TokenBucket(rate)
+        self._setup()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _setup(self):
+        conn = self._connect()
+        try:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' id TEXT PRIMARY KEY,'
+                ' message TEXT NOT NULL,'
+                ' status TEXT NOT NULL,'
+                ' total INTEGER NOT NULL,'
+                ' created_at REAL NOT NULL,'
+                ' updated_at REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS deliveries ('
+                ' job_id TEXT NOT NULL,'
+                ' number TEXT NOT NULL,'
+                ' status TEXT NOT NULL,'
+                ' sid TEXT,'
+                ' error TEXT,'
+                ' attempts INTEGER NOT NULL DEFAULT 0,'
+                ' PRIMARY KEY (job_id, number))'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS deliveries_status ON deliveries (job_id, status)')
+            # Lease columns, added in place to databases created before them.
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}
+            if 'heartbeat_at' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN heartbeat_at REAL')
+            if 'lease_owner' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN lease_owner TEXT')
+        finally:
+            conn.close()
+
+    # --- Jobs ---
+
+    def create_job(self, message):
+        """
+        Snapshots the current subscribers into a new job and returns its ID.
+        Undeliverable numbers are added as 'skipped'.
+        """
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        skip = self.skip_source() if self.skip_source else set()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(
+                "INSERT OR IGNORE INTO deliveries (job_id, number, status) VALUES (?, ?, ?)",
+                ((job_id, number, 'skipped' if number in skip else 'pending') for number in self.subscriber_source())
+            )
+            total = conn.execute('SELECT COUNT(*) FROM deliveries WHERE job_id = ?', (job_id,)).fetchone()[0]
+            conn.execute(
+                "INSERT INTO jobs (id, message, status, total, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, message, total, now, now)
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        return job_id
+
+    def start(self, message):
+        """
+        Creates a job and runs it in a background thread. Returns the job ID.
+        Jobs abandoned by a dead process are resumed as well.
+        """
+        job_id = self.create_job(message)
+        self._run_in_background(job_id)
+        if self.auto_resume:
+            self.resume_stale_jobs()
+        return job_id
+
+    def _run_in_background(self, job_id):
+        threading.Thread(target=self.run, args=(job_id,), name=f'broadcast-{job_id}', daemon=True).start()
+
+    def _stale_before(self):
+        return time.time() - self.lease
+
+    def resume_stale_jobs(self):
+        """Resumes, in background threads, the queued or running jobs whose lease has expired. Returns their IDs."""
+        conn = self._connect()
+        try:
+            job_ids = [row[0] for row in conn.execute(
+                "SELECT id FROM jobs WHERE status IN ('queued', 'running')"
+                " AND COALESCE(heartbeat_at, updated_at) < ?", (self._stale_before(),)
+            )]
+        finally:
+            conn.close()
+        for job_id in job_ids:
+            print(f"Resuming abandoned broadcast job {job_id}")
+            self._run_in_background(job_id)
+        return job_ids
+
+    def _take_lease(self, conn, job_id, owner):
+        """Marks the job as running under owner, unless another live process holds it. Returns True on success."""
+        now = time.time()
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'running', lease_owner = ?, heartbeat_at = ?, updated_at = ? WHERE id = ?"
+            " AND NOT (status = 'running' AND COALESCE(heartbeat_at, updated_at) >= ?)",
+            (owner, now, now, job_id, now - self.lease)
+        )
+        return cursor.rowcount == 1
+
+    def _heartbeat(self, job_id, owner, done, lost):
+        """Refreshes the job's lease until done is set. Sets lost if another process took it over."""
+        conn = self._connect()
+        try:
+            while not done.wait(BROADCAST_HEARTBEAT_INTERVAL):
+                try:
+                    cursor = conn.execute('UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND lease_owner = ?',
+                                          (time.time(), job_id, owner))
+                except sqlite3.Error as e:
+                    print(f"Could not refresh the lease of broadcast job {job_id}: {e}")
+                    continue
+                if cursor.rowcount != 1:
+                    lost.set()
+                    return
+        finally:
+            conn.close()
+
+    def run(self, job_id, on_progress=None):
+        """
+        Sends every pending delivery of a job, blocking until it is done.
+        Calling run() again on an interrupted job resumes it without re-sending.
+        Returns False, without sending anything, if another process is running the job.
+        """
+        conn = self._connect()
+        owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        done, lost = threading.Event(), threading.Event()
+        try:
+            row = conn.execute('SELECT message FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                raise KeyError(f"Unknown broadcast job: {job_id}")
+            message = row[0]
+            if not self._take_lease(conn, job_id, owner):
+                return False
+            threading.Thread(target=self._heartbeat, args=(job_id, owner, done, lost),
+                             name=f'broadcast-heartbeat-{job_id}', daemon=True).start()
+            # Anything still 'sending' was in flight when a previous run died.
+            conn.execute(
+                "UPDATE deliveries SET status = 'unknown' WHERE job_id = ? AND status = 'sending'",
+                (job_id,)
+            )
+
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                while True:
+                    if lost.is_set():
+                        print(f"Broadcast job {job_id} was taken over by another process; stopping here")
+                        return False
+                    numbers = self._claim_batch(conn, job_id)
+                    if not numbers:
+                        break
+                    with stage('broadcast_batch'):
+                        outcomes = list(pool.map(lambda number: self._deliver(number, message), numbers))
+                        self._record_outcomes(conn, job_id, outcomes)
+                    if on_progress:
+                        on_progress(self.progress(job_id))
+
+            self._set_status(conn, job_id, 'completed')
+            return True
+        except Exception as e:
+            print(f"Broadcast job {job_id} stopped: {e}")
+            self._set_status(conn, job_id, 'failed')
+            raise
+        finally:
+            done.set()
+            conn.close()
+
+    def _set_status(self, conn, job_id, status):
+        conn.execute('UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?', (status, time.time(), job_id))
+
+    def _claim_batch(self, conn, job_id):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            numbers = [row[0] for row in conn.execute(
+                "SELECT number FROM deliveries WHERE job_id = ? AND status = 'pending' LIMIT ?",
+                (job_id, CLAIM_BATCH_SIZE)
+            )]
+            conn.executemany(
+                "UPDATE deliveries SET status = 'sending' WHERE job_id = ? AND number = ?",
+                ((job_id, number) for number in numbers)
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return numbers
+
+    def _record_outcomes(self, conn, job_id, outcomes):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'UPDATE deliveries SET status = ?, sid = ?, error = ?, attempts = ? WHERE job_id = ? AND number = ?',
+                ((status, sid, error, attempts, job_id, number) for number, status, sid, error, attempts in outcomes)
+            )
+            conn.execute('UPDATE jobs SET updated_at = ? WHERE id = ?', (time.time(), job_id))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _deliver(self, number, message):
+        """Sends one message, retrying retryable errors. Returns (number, status, sid, error, attempts)."""
+        attempt = 0
+        while True:
+            attempt += 1
+            self._bucket.acquire()
+            try:
+                with stage('broadcast_send'):
+                    sid = self.sender(number, message)
+                count('broadcast_messages', status='sent')
+                return (number, 'sent', sid, None, attempt)
+            except Exception as e:
+                if attempt > self.max_retries or not is_retryable(e):
+                    # Without an HTTP status, only a connection that never opened proves nothing was sent.
+                    maybe_sent = getattr(e, 'status', None) is None and not never_sent(e)
+                    status = 'unknown' if maybe_sent else 'failed'
+                    print(f"Failed to send to {number} ({status}): {e}")
+                    count('broadcast_messages', status=status)
+                    return (number, status, None, str(e), attempt)
+                count('broadcast_messages', status='retried')
+                delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1))
+                time.sleep(random.uniform(0, delay))
+
+    # --- Progress ---
+
+    def progress(self, job_id):
+        """
+        Returns a job's status and per-state delivery counts, or None if it
+        does not exist. A job abandoned by a dead process is resumed here.
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT status, total, created_at, updated_at, COALESCE(heartbeat_at, updated_at)'
+                ' FROM jobs WHERE id = ?', (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            counts = dict(conn.execute(
+                'SELECT status, COUNT(*) FROM deliveries WHERE job_id = ? GROUP BY status', (job_id,)
+            ).fetchall())
+        finally:
+            conn.close()
+        status, total, created_at, updated_at, heartbeat_at = row
+        if self.auto_resume and status in ('queued', 'running') and heartbeat_at < self._stale_before():
+            print(f"Resuming abandoned broadcast job {job_id}")
+            self._run_in_background(job_id)
+        return {
+            'job_id': job_id,
+            'status': status,
+            'total': total,
+            'pending': counts.get('pending', 0) + counts.get('sending', 0),
+            'sent': counts.get('sent', 0),
+            'failed': counts.get('failed', 0),
+            'unknown': counts.get('unknown', 0),
+            'skipped': counts.get('skipped', 0),
+            'created_at': created_at,
+            'updated_at': updated_at,
+        }
@@ -0,0 +1,297 @@
+# conversation_log.py
+#
+# Structured conversation log for app.py and app1.py: every inbound message
+# and every reply is recorded as one JSON line, for analytics and for
+# replaying real traffic against the bots (benchmarks/bench_load.py).
+#
+# Logging must never slow a webhook down, so log() only puts the event on a
+# bounded in-memory queue. A background thread drains the queue and writes
+# events in batches. A batch is written when LOG_BATCH_SIZE events are
+# waiting or LOG_FLUSH_INTERVAL seconds have passed, with one write() per
+# batch and no fsync. When the queue is full the event is dropped and
+# counted; the request carries on.
+#
+# Each process writes its own file, so gunicorn workers never interleave
+# lines:
+#
+#     logs/conversations-<YYYYMMDD>-<pid>-<seq>.jsonl
+#
+# A file is rotated when it reaches LOG_MAX_BYTES or the date changes. The
+# rotated file is gzip-compressed in the writer thread, and only the newest
+# LOG_KEEP_FILES compressed files are kept. Files left uncompressed by a
+# worker that died are compressed by the next writer that starts.
+# read_events() streams every file back in timestamp order. Run
+# `python conversation_log.py` to print the log as JSON lines.
+
+import argparse
+import atexit
+import glob
+import gzip
+import heapq
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+
+from metrics import count
+
+CONVERSATION_LOG_DIR = os.getenv('CONVERSATION_LOG_DIR', 'logs')
+LOG_MAX_QUEUE = int(os.getenv('LOG_MAX_QUEUE', '10000'))
+LOG_BATCH_SIZE = int(os.getenv('LOG_BATCH_SIZE', '200'))
+LOG_FLUSH_INTERVAL = float(os.getenv('LOG_FLUSH_INTERVAL', '1'))
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(64 * 1024 * 1024)))
+LOG_KEEP_FILES = int(os.getenv('LOG_KEEP_FILES', '200'))
+
+FILE_PREFIX = 'conversations-'
+
+_STOP = object()
+
+
+def _file_pid(path):
+    """The pid in a log file name (conversations-<date>-<pid>-<seq>.jsonl)."""
+    try:
+        return int(os.path.basename(path).split('-')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def compress(path, target=None):
+    """Gzips a finished log file to <target>.gz (by default next to itself) and removes the original."""
+    target = target or path
+    with open(path, 'rb') as src, gzip.open(f"{target}.gz.tmp", 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(f"{target}.gz.tmp", f"{target}.gz")
+    os.remove(path)
+
+
+class ConversationLogger:
+    """A non-blocking JSONL event log, written in batches by a background thread."""
+
+    def __init__(self, directory=CONVERSATION_LOG_DIR, max_queue=LOG_MAX_QUEUE, batch_size=LOG_BATCH_SIZE,
+                 flush_interval=LOG_FLUSH_INTERVAL, max_bytes=LOG_MAX_BYTES, keep_files=LOG_KEEP_FILES):
+        self.directory = directory
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.keep_files = keep_files
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._writer = None
+        self._counters = {'logged': 0, 'dropped': 0, 'written': 0, 'batches': 0, 'rotations': 0, 'errors': 0}
+
+    def _start(self):
+        # Threads do not survive a fork, so each process starts its own writer and queue.
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(self.max_queue)
+            self._writer = threading.Thread(target=self._run, name='conversation-log', daemon=True)
+            self._writer.start()
+            if self._pid is None:
+                atexit.register(self.close)
+            self._pid = os.getpid()
+
+    # --- Request path ---
+
+    def log(self, event, **fields):
+        """Queues one event. Never blocks: if the queue is full, the event is dropped and counted."""
+        if self._pid != os.getpid():
+            self._start()
+        record = {'ts': round(time.time(), 3), 'event': event}
+        record.update(fields)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self._counters['dropped'] += 1
+            count('conversation_log', result='dropped')
+            return
+        with self._lock:
+            self._counters['logged'] += 1
+
+    def close(self, timeout=5):
+        """Writes out the queued events and stops the writer (called at exit)."""
+        if self._pid != os.getpid() or not self._writer.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._writer.join(timeout)
+
+    def stats(self):
+        """Returns event counters and the current queue depth for this process."""
+        with self._lock:
+            stats = dict(self._counters)
+        stats['queued'] = self._queue.qsize() if self._pid == os.getpid() else 0
+        return stats
+
+    # --- Writer thread ---
+
+    def _run(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._compress_orphans()
+        writer = _FileWriter(self)
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            if not batch:
+                continue
+            try:
+                writer.write(batch)
+            except (OSError, TypeError, ValueError) as e:
+                print(f"Could not write conversation log: {e}")
+                with self._lock:
+                    self._counters['errors'] += 1
+                continue
+            with self._lock:
+                self._counters['written'] += len(batch)
+                self._counters['batches'] += 1
+        writer.close()
+
+    def _compress_orphans(self):
+        """Compresses the uncompressed files of workers that are no longer running."""
+        for path in glob.glob(os.path.join(self.directory, f"{FILE_PREFIX}*.jsonl")):
+            pid = _file_pid(path)
+            if pid is None or pid == os.getpid() or _alive(pid):
+                continue
+            claimed = f"{path}.{os.getpid()}.claim"
+            try:
+                # Another starting worker may race for the same file; only the rename winner compresses it.
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            try:
+                compress(claimed, path)
+            except OSError as e:
+                print(f"Could not compress {path}: {e}")
+
+    def _prune(self):
+        archives = sorted(glob.glob(os.path.join(self.directory, f"{FILE_PREFIX}*.jsonl.gz")),
+                          key=os.path.getmtime)
+        for path in archives[:-self.keep_files] if self.keep_files else []:
+            os.remove(path)
+
+
+class _FileWriter:
+    """The writer thread's current file, rotated by size and date."""
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.file = None
+        self.path = None
+        self.date = None
+        self.seq = 0
+
+    def _open(self, date):
+        self.date = date
+        while True:
+            self.seq += 1
+            path = os.path.join(self.logger.directory, f"{FILE_PREFIX}{date}-{os.getpid()}-{self.seq:04d}.jsonl")
+            if not os.path.exists(path) and not os.path.exists(f"{path}.gz"):
+                break
+        self.path = path
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def _rotate(self):
+        self.file.close()
+        compress(self.path)
+        self.file = None
+        with self.logger._lock:
+            self.logger._counters['rotations'] += 1
+        self.logger._prune()
+
+    def write(self, batch):
+        date = time.strftime('%Y%m%d')
+        if self.file is not None and (date != self.date or self.file.tell() >= self.logger.max_bytes):
+            self._rotate()
+        if self.file is None:
+            self._open(date)
+        self.file.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch))
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+# --- Reading ---
+
+def _read_file(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # A worker killed mid-write can leave a partial last line.
+                continue
+
+
+def read_events(directory=CONVERSATION_LOG_DIR, since=None, until=None, events=None):
+    """
+    Streams logged events from every worker's files, compressed or not, in
+    timestamp order. since/until are Unix timestamps; events limits the
+    event types returned.
+    """
+    paths = glob.glob(os.path.join(directory, f"{FILE_PREFIX}*.jsonl")) + \
+        glob.glob(os.path.join(directory, f"{FILE_PREFIX}*.jsonl.gz"))
+    if since is not None:
+        # File names carry the day they were started, so whole earlier days can be skipped.
+        first_day = time.strftime('%Y%m%d', time.localtime(since))
+        paths = [p for p in paths if os.path.basename(p)[len(FILE_PREFIX):][:8] >= _previous_day(first_day)]
+    for record in heapq.merge(*(_read_file(path) for path in sorted(paths)), key=lambda r: r.get('ts', 0)):
+        ts = record.get('ts', 0)
+        if since is not None and ts < since:
+            continue
+        if until is not None and ts >= until:
+            break
+        if events and record.get('event') not in events:
+            continue
+        yield record
+
+
+def _previous_day(day):
+    # A file started just before midnight holds events from the next day too, until its next write.
+    return time.strftime('%Y%m%d', time.localtime(time.mktime(time.strptime(day, '%Y%m%d')) - 86400))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the conversation log as JSON lines, oldest first.")
+    parser.add_argument('--dir', default=CONVERSATION_LOG_DIR)
+    parser.add_argument('--since', type=float, help="Unix timestamp of the first event")
+    parser.add_argument('--until', type=float, help="Unix timestamp after the last event")
+    parser.add_argument('--event', action='append', help="event type to include (repeatable)")
+    args = parser.parse_args()
+    for record in read_events(args.dir, args.since, args.until, args.event):
+        sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# conversations.py
+#
+# Server-side conversation store for the Gemini chatbot in app1.py.
+#
+# Twilio webhooks never send cookies back, so chat history kept in the Flask
+# session was lost between messages (and would overflow the 4 KB cookie limit
+# anyway). History is now keyed by the sender's WhatsApp number and held in an
+# in-memory LRU with a memory cap and an idle TTL. Setting CONVERSATIONS_DB
+# also persists it to SQLite so every gunicorn worker sees the same history.
+#
+# History is trimmed to a token budget rather than a fixed number of turns.
+# With CONVERSATION_SUMMARY enabled, trimmed turns are folded into a short
+# summary that is replayed at the start of the history.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CONVERSATIONS_DB = os.getenv('CONVERSATIONS_DB')
+
+# Approximate memory allowed for cached conversations, and idle time before one expires.
+CONVERSATION_MAX_BYTES = int(os.getenv('CONVERSATION_MAX_BYTES', str(32 * 1024 * 1024)))
+CONVERSATION_IDLE_TTL = float(os.getenv('CONVERSATION_IDLE_TTL', str(24 * 3600)))
+
+# Estimated tokens of history sent with each model call.
+CONVERSATION_TOKEN_BUDGET = int(os.getenv('CONVERSATION_TOKEN_BUDGET', '2000'))
+
+CONVERSATION_SUMMARY = os.getenv('CONVERSATION_SUMMARY', '0') == '1'
+SUMMARY_MAX_CHARS = 600
+
+# Expired rows are purged from SQLite once every this many writes.
+PURGE_EVERY = 500
+
+
+def estimate_tokens(text):
+    """Rough token estimate: about 4 ASCII characters per token, one token per other character."""
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def _turn(role, text):
+    return {'role': role, 'parts': [{'text': text}]}
+
+
+def _turn_text(turn):
+    return turn['parts'][0]['text']
+
+
+class Conversation:
+    """One user's trimmed history plus an optional summary of older turns."""
+
+    __slots__ = ('turns', 'summary', 'updated_at', 'size')
+
+    def __init__(self, turns=None, summary='', updated_at=None):
+        self.turns = turns or []
+        self.summary = summary
+        self.updated_at = updated_at or time.time()
+        self.size = sum(len(_turn_text(t)) for t in self.turns) + len(summary)
+
+
+def summarize_turns(summary, dropped_turns):
+    """Folds dropped turns into the running summary by keeping the gist of each user question."""
+    questions = [_turn_text(t).strip().replace("\n", " ")[:120] for t in dropped_turns if t['role'] == 'user']
+    if not questions:
+        return summary
+    combined = "; ".join(filter(None, [summary] + questions))
+    # Keep the most recent part when the summary outgrows its cap.
+    return combined[-SUMMARY_MAX_CHARS:]
+
+
+class ConversationStore:
+    """Conversation histories keyed by WhatsApp number."""
+
+    def __init__(self, db_path=CONVERSATIONS_DB, max_bytes=CONVERSATION_MAX_BYTES,
+                 idle_ttl=CONVERSATION_IDLE_TTL, token_budget=CONVERSATION_TOKEN_BUDGET,
+                 summarize=CONVERSATION_SUMMARY):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.token_budget = token_budget
+        self.summarize = summarize
+        self._cache = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        if db_path:
+            conn = self._connect()
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS conversations ('
+                ' number TEXT PRIMARY KEY,'
+                ' turns TEXT NOT NULL,'
+                ' summary TEXT NOT NULL,'
+                ' updated_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated_at)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # --- Cache ---
+
+    def _cache_get(self, number):
+        conversation = self._cache.get(number)
+        if conversation is None:
+            return None
+        if time.time() - conversation.updated_at > self.idle_ttl:
+            self._cache_drop(number)
+            return None
+        self._cache.move_to_end(number)
+        return conversation
+
+    def _cache_put(self, number, conversation):
+        self._cache_drop(number)
+        self._cache[number] = conversation
+        self._bytes += conversation.size
+        while self._bytes > self.max_bytes and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._bytes -= evicted.size
+
+    def _cache_drop(self, number):
+        conversation = self._cache.pop(number, None)
+        if conversation is not None:
+            self._bytes -= conversation.size
+
+    # --- Persistence ---
+
+    def _load(self, number):
+        """Returns the conversation for number, reading SQLite only if another worker changed it."""
+        cached = self._cache_get(number)
+        if not self.db_path:
+            return cached
+        conn = self._connect()
+        row = conn.execute('SELECT updated_at FROM conversations WHERE number = ?', (number,)).fetchone()
+        if row is None or time.time() - row[0] > self.idle_ttl:
+            self._cache_drop(number)
+            return None
+        if cached is not None and cached.updated_at == row[0]:
+            return cached
+        turns, summary, updated_at = conn.execute(
+            'SELECT turns, summary, updated_at FROM conversations WHERE number = ?', (number,)
+        ).fetchone()
+        conversation = Conversation(json.loads(turns), summary, updated_at)
+        self._cache_put(number, conversation)
+        return conversation
+
+    def _save(self, number, conversation):
+        self._cache_put(number, conversation)
+        if not self.db_path:
+            return
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO conversations (number, turns, summary, updated_at) VALUES (?, ?, ?, ?)',
+            (number, json.dumps(conversation.turns, ensure_ascii=False), conversation.summary, conversation.updated_at)
+        )
+        self._writes += 1
+        if self._writes % PURGE_EVERY == 0:
+            conn.execute('DELETE FROM conversations WHERE updated_at < ?', (time.time() - self.idle_ttl,))
+
+    # --- Public API ---
+
+    def get_history(self, number):
+        """Returns the history to send to the model, with any summary replayed as the first exchange."""
+        with self._lock:
+            conversation = self._load(number)
+            if conversation is None:
+                return []
+            history = list(conversation.turns)
+            if conversation.summary:
+                history[:0] = [
+                    _turn('user', f"(Summary of our earlier conversation: {conversation.summary})"),
+                    _turn('model', "Understood, I will keep that in mind."),
+                ]
+            return history
+
+    def append(self, number, user_text, model_text):
+        """Records one exchange and trims the history to the token budget."""
+        with self._lock:
+            conversation = self._load(number) or Conversation()
+            turns = conversation.turns + [_turn('user', user_text), _turn('model', model_text)]
+            summary = conversation.summary
+
+            # Drop whole exchanges from the front until the rest fits the budget.
+            tokens = sum(estimate_tokens(_turn_text(t)) for t in turns)
+            cut = 0
+            while tokens > self.token_budget and len(turns) - cut > 2:
+                tokens -= estimate_tokens(_turn_text(turns[cut])) + estimate_tokens(_turn_text(turns[cut + 1]))
+                cut += 2
+            if cut:
+                if self.summarize:
+                    summary = summarize_turns(summary, turns[:cut])
+                turns = turns[cut:]
+
+            self._save(number, Conversation(turns, summary))
+
+    def clear(self, number):
+        """Forgets a user's history."""
+        with self._lock:
+            self._cache_drop(number)
+            if self.db_path:
+                self._connect().execute('DELETE FROM conversations WHERE number = ?', (number,))
@@ -0,0 +1,284 @@
+# delivery_status.py
+#
+# Twilio delivery-status callbacks for broadcasts, and per-number delivery
+# stats.
+#
+# Broadcast sends set a StatusCallback (STATUS_CALLBACK_URL, the public URL of
+# /message-status), so Twilio reports every message as it moves through
+# queued, sent, delivered or read, or failed or undelivered. A 100k-subscriber
+# broadcast produces several hundred thousand of these requests within
+# minutes. Callbacks whose X-Twilio-Signature does not match STATUS_CALLBACK_URL
+# and the account's auth token are rejected (is_signed_callback()), so nobody
+# else can mark numbers as undeliverable. The endpoint must not hold Twilio
+# up, so record() only puts the event on a bounded in-memory queue. As in
+# conversation_log.py, a background thread per process drains the queue and
+# writes events in batches of STATUS_BATCH_SIZE, or every
+# STATUS_FLUSH_INTERVAL seconds, in one SQLite transaction per batch. When
+# the queue is full, the event is dropped and counted.
+#
+# DELIVERY_DB holds two tables:
+#
+#   status_events  one row per (MessageSid, status), indexed by number, so
+#                  Twilio's retried callbacks are stored and counted once;
+#   recipients     per number: delivered and failed counts, consecutive
+#                  failures, and the last status and error code.
+#
+# A number whose last DELIVERY_MAX_FAILURES or more messages failed, the last
+# one within DELIVERY_SKIP_DAYS days, is undeliverable: broadcasts skip it
+# (broadcast_engine.py). Once the failure is older than that, the next
+# broadcast tries the number again, and a delivered message clears its streak.
+
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from twilio.request_validator import RequestValidator
+
+from metrics import count
+
+DELIVERY_DB = os.getenv('DELIVERY_DB', 'delivery_status.db')
+STATUS_CALLBACK_URL = os.getenv('STATUS_CALLBACK_URL')
+STATUS_MAX_QUEUE = int(os.getenv('STATUS_MAX_QUEUE', '50000'))
+STATUS_BATCH_SIZE = int(os.getenv('STATUS_BATCH_SIZE', '1000'))
+STATUS_FLUSH_INTERVAL = float(os.getenv('STATUS_FLUSH_INTERVAL', '0.5'))
+DELIVERY_MAX_FAILURES = int(os.getenv('DELIVERY_MAX_FAILURES', '3'))
+DELIVERY_SKIP_DAYS = float(os.getenv('DELIVERY_SKIP_DAYS', '30'))
+
+# Final statuses; the others (accepted, queued, sending, sent, read...) do not change the stats.
+DELIVERED_STATUSES = ('delivered',)
+FAILED_STATUSES = ('failed', 'undelivered')
+
+_STOP = object()
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def setup(path=DELIVERY_DB):
+    """Creates the tables and indexes if they do not exist."""
+    conn = _connect(path)
+    try:
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS status_events ('
+            ' sid TEXT NOT NULL,'
+            ' status TEXT NOT NULL,'
+            ' number TEXT NOT NULL,'
+            ' error_code TEXT,'
+            ' received_at REAL NOT NULL,'
+            ' PRIMARY KEY (sid, status))'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS status_events_number ON status_events (number, received_at)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS recipients ('
+            ' number TEXT PRIMARY KEY,'
+            ' delivered INTEGER NOT NULL DEFAULT 0,'
+            ' failed INTEGER NOT NULL DEFAULT 0,'
+            ' consecutive_failures INTEGER NOT NULL DEFAULT 0,'
+            ' last_status TEXT,'
+            ' last_error TEXT,'
+            ' updated_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS recipients_failures ON recipients (consecutive_failures, updated_at)')
+    finally:
+        conn.close()
+
+
+class DeliveryStatusRecorder:
+    """Buffers status callbacks and writes them to DELIVERY_DB in batches from a background thread."""
+
+    def __init__(self, path=DELIVERY_DB, max_queue=STATUS_MAX_QUEUE, batch_size=STATUS_BATCH_SIZE,
+                 flush_interval=STATUS_FLUSH_INTERVAL):
+        self.path = path
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._writer = None
+        self._counters = {'received': 0, 'dropped': 0, 'written': 0, 'duplicates': 0, 'batches': 0, 'errors': 0}
+
+    def _start(self):
+        # Threads do not survive a fork, so each process starts its own writer and queue.
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(self.max_queue)
+            self._writer = threading.Thread(target=self._run, name='delivery-status', daemon=True)
+            self._writer.start()
+            if self._pid is None:
+                atexit.register(self.close)
+            self._pid = os.getpid()
+
+    # --- Request path ---
+
+    def record(self, values):
+        """
+        Queues one status callback (Twilio's form fields). Never blocks: if the
+        queue is full, the event is dropped and counted. Returns False if the
+        callback lacks a MessageSid or MessageStatus.
+        """
+        sid, status = values.get('MessageSid'), values.get('MessageStatus')
+        if not sid or not status:
+            return False
+        if self._pid != os.getpid():
+            self._start()
+        event = (sid, status, values.get('To', ''), values.get('ErrorCode') or None, time.time())
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            with self._lock:
+                self._counters['dropped'] += 1
+            count('delivery_status', result='dropped')
+            return True
+        with self._lock:
+            self._counters['received'] += 1
+        return True
+
+    def close(self, timeout=5):
+        """Writes out the queued events and stops the writer (called at exit)."""
+        if self._pid != os.getpid() or not self._writer.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._writer.join(timeout)
+
+    def stats(self):
+        """Returns event counters and the current queue depth for this process."""
+        with self._lock:
+            stats = dict(self._counters)
+        stats['queued'] = self._queue.qsize() if self._pid == os.getpid() else 0
+        return stats
+
+    # --- Writer thread ---
+
+    def _run(self):
+        setup(self.path)
+        conn = _connect(self.path)
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            if not batch:
+                continue
+            try:
+                written = self._write(conn, batch)
+            except sqlite3.Error as e:
+                print(f"Could not write delivery status events: {e}")
+                with self._lock:
+                    self._counters['errors'] += 1
+                continue
+            with self._lock:
+                self._counters['written'] += written
+                self._counters['duplicates'] += len(batch) - written
+                self._counters['batches'] += 1
+            count('delivery_status', written, result='written')
+        conn.close()
+
+    def _write(self, conn, batch):
+        """Stores a batch of events and folds the new final statuses into the per-number stats."""
+        # number -> [delivered, failed, failures since the last delivery, last status, its error code, its time]
+        updates = {}
+        written = 0
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for sid, status, number, error_code, received_at in batch:
+                cursor = conn.execute(
+                    'INSERT OR IGNORE INTO status_events (sid, status, number, error_code, received_at)'
+                    ' VALUES (?, ?, ?, ?, ?)',
+                    (sid, status, number, error_code, received_at)
+                )
+                if cursor.rowcount != 1:
+                    continue
+                written += 1
+                if status not in DELIVERED_STATUSES and status not in FAILED_STATUSES:
+                    continue
+                update = updates.setdefault(number, [0, 0, 0, None, None, 0.0])
+                if status in DELIVERED_STATUSES:
+                    update[0] += 1
+                    update[2] = 0
+                else:
+                    update[1] += 1
+                    update[2] += 1
+                update[3:] = [status, error_code, received_at]
+            conn.executemany(
+                'INSERT INTO recipients (number, delivered, failed, consecutive_failures, last_status, last_error,'
+                ' updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)'
+                ' ON CONFLICT (number) DO UPDATE SET'
+                '  delivered = delivered + excluded.delivered,'
+                '  failed = failed + excluded.failed,'
+                '  consecutive_failures = CASE WHEN excluded.delivered > 0 THEN excluded.consecutive_failures'
+                '   ELSE consecutive_failures + excluded.consecutive_failures END,'
+                '  last_status = excluded.last_status,'
+                '  last_error = excluded.last_error,'
+                '  updated_at = excluded.updated_at',
+                ((number, *update) for number, update in updates.items())
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return written
+
+
+def is_signed_callback(values, signature, auth_token, url=STATUS_CALLBACK_URL):
+    """
+    True if signature (the X-Twilio-Signature header) is Twilio's signature of
+    a callback to url with these form values. Without an auth token or
+    STATUS_CALLBACK_URL no callback can be verified, so all are rejected.
+    """
+    if auth_token and url and signature and RequestValidator(auth_token).validate(url, values, signature):
+        return True
+    count('delivery_status', result='rejected')
+    return False
+
+
+# --- Reading ---
+
+def undeliverable_numbers(path=DELIVERY_DB, max_failures=DELIVERY_MAX_FAILURES, skip_days=DELIVERY_SKIP_DAYS):
+    """Returns the set of numbers broadcasts should skip: max_failures or more recent failures in a row."""
+    setup(path)
+    conn = _connect(path)
+    try:
+        rows = conn.execute(
+            'SELECT number FROM recipients WHERE consecutive_failures >= ? AND updated_at >= ?',
+            (max_failures, time.time() - skip_days * 86400)
+        ).fetchall()
+    finally:
+        conn.close()
+    return {row[0] for row in rows}
+
+
+def recipient_stats(number, path=DELIVERY_DB):
+    """Returns a number's delivery stats as a dict, or None if no final status was recorded for it."""
+    setup(path)
+    conn = _connect(path)
+    try:
+        row = conn.execute(
+            'SELECT delivered, failed, consecutive_failures, last_status, last_error, updated_at'
+            ' FROM recipients WHERE number = ?', (number,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    keys = ('delivered', 'failed', 'consecutive_failures', 'last_status', 'last_error', 'updated_at')
+    return dict(zip(keys, row))
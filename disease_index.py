@@ -0,0 +1,189 @@
+# disease_index.py
+#
+# Typo- and transliteration-tolerant disease lookup, shared by the Flask
+# webhooks (app.py, app1.py) and the Rasa action server.
+#
+# Every disease name and alias (English, romanised Hindi/Odia, and native
+# script from disease_aliases.json) is indexed SymSpell-style: at build time we
+# store each term under all of its deletion variants up to max_distance, so a
+# lookup only has to generate the deletions of the query word, intersect them
+# with the table and verify the few candidates with a bounded edit distance.
+# Lookup cost depends on the length of the query, not on how many aliases are
+# indexed, so "maleria", "dengu" or "malariya" resolve in bounded time even
+# with thousands of aliases.
+
+import os
+import re
+from collections import namedtuple
+
+from matcher import tokenize
+from retrieval import ALIASES_FILE, load_topic_aliases
+
+# Only the first PREFIX_LENGTH characters are used for deletion variants (SymSpell's prefix trick).
+PREFIX_LENGTH = 7
+
+# Longest alias, in words, tried against each position of a message.
+MAX_PHRASE_WORDS = 3
+
+Match = namedtuple('Match', ['key', 'term', 'distance', 'start', 'end'])
+
+_LATIN_RE = re.compile(r'^[a-z0-9 ]+$')
+
+# Spelling variants common in romanised Hindi/Odia, applied to Latin-script terms only.
+_TRANSLITERATION_RULES = [
+    (re.compile(r'(.)\1+'), r'\1'),     # doubled letters: "dengue" / "denggue"
+    (re.compile(r'ee'), 'i'),
+    (re.compile(r'oo'), 'u'),
+    (re.compile(r'ph'), 'f'),
+    (re.compile(r'w'), 'v'),
+    (re.compile(r'(?<=[kgcjtdpb])h'), ''),  # aspirated consonants: "bhukhar" / "bukar"
+    (re.compile(r'y(?=a)'), 'i'),        # "malariya" / "malaria"
+]
+
+
+def normalize(term):
+    """Lower-cases a term, joins its tokens and folds common transliteration variants."""
+    text = " ".join(tokenize(term))
+    if _LATIN_RE.match(text):
+        for pattern, replacement in _TRANSLITERATION_RULES:
+            text = pattern.sub(replacement, text)
+    return text
+
+
+def max_distance_for(term):
+    """Edit distance allowed for a term: none for short words, where typos collide with other words."""
+    if len(term) <= 4:
+        return 0
+    if len(term) <= 8:
+        return 1
+    return 2
+
+
+def _deletes(term, distance):
+    """All strings reachable from term by deleting up to distance characters."""
+    results = {term}
+    frontier = {term}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        results |= frontier
+    return results
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance between a and b, or limit + 1 once it exceeds limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = current[0]
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+            row_min = min(row_min, current[j])
+        if row_min > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class DiseaseIndex:
+    """A SymSpell-style fuzzy index from disease names and aliases to canonical disease keys."""
+
+    def __init__(self, max_distance=2):
+        self.max_distance = max_distance
+        self._exact = {}
+        self._deletes = {}
+
+    def add(self, term, key):
+        """Indexes one name or alias for a canonical key."""
+        term = normalize(term)
+        if not term:
+            return
+        self._exact.setdefault(term, set()).add(key)
+        prefix = term[:PREFIX_LENGTH]
+        for variant in _deletes(prefix, min(self.max_distance, max_distance_for(term))):
+            self._deletes.setdefault(variant, set()).add(term)
+
+    def __len__(self):
+        return len(self._exact)
+
+    def lookup(self, word):
+        """Returns (key, term, distance) candidates for a word or phrase, closest first."""
+        query = normalize(word)
+        if not query:
+            return []
+        if query in self._exact:
+            return [(key, query, 0) for key in sorted(self._exact[query])]
+
+        limit = min(self.max_distance, max_distance_for(query))
+        if limit == 0:
+            return []
+        candidates = set()
+        for variant in _deletes(query[:PREFIX_LENGTH], limit):
+            candidates |= self._deletes.get(variant, set())
+
+        results = []
+        for term in candidates:
+            distance = edit_distance(query, term, min(limit, max_distance_for(term)))
+            if distance <= limit and distance <= max_distance_for(term):
+                results.extend((key, term, distance) for key in self._exact[term])
+        results.sort(key=lambda r: (r[2], r[1]))
+        return results
+
+    def best(self, word):
+        """Returns the canonical key closest to word, or None."""
+        results = self.lookup(word)
+        return results[0][0] if results else None
+
+    def find(self, text):
+        """
+        Finds disease mentions anywhere in a message, trying phrases of up to
+        MAX_PHRASE_WORDS words. Returns non-overlapping Matches, best first.
+        """
+        tokens = tokenize(text)
+        found = []
+        for start in range(len(tokens)):
+            for length in range(min(MAX_PHRASE_WORDS, len(tokens) - start), 0, -1):
+                results = self.lookup(" ".join(tokens[start:start + length]))
+                if results:
+                    key, term, distance = results[0]
+                    found.append(Match(key, term, distance, start, start + length))
+                    break
+
+        # Prefer exact and longer matches, then drop any that overlap a better one.
+        found.sort(key=lambda m: (m.distance, m.start - m.end, m.start))
+        taken = set()
+        matches = []
+        for match in found:
+            span = set(range(match.start, match.end))
+            if not span & taken:
+                taken |= span
+                matches.append(match)
+        return matches
+
+
+def disease_key(name):
+    """Canonical key for a display name, matching finalData.json ('Dengue Fever' -> 'dengue_fever')."""
+    return "_".join(tokenize(name))
+
+
+def build_disease_index(disease_names=(), aliases=None):
+    """
+    Builds a DiseaseIndex from canonical keys or display names plus
+    disease_aliases.json. Names are mapped to keys with disease_key().
+    """
+    index = DiseaseIndex()
+    aliases = load_topic_aliases(ALIASES_FILE) if aliases is None else aliases
+    for name in disease_names:
+        key = disease_key(name)
+        index.add(name, key)
+        index.add(key.replace('_', ' '), key)
+    for key, names in aliases.items():
+        index.add(key.replace('_', ' '), key)
+        for name in names:
+            index.add(name, key)
+    return index
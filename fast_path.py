@@ -0,0 +1,210 @@
+# fast_path.py
+#
+# Deterministic fast path for the Gemini chatbot in app1.py.
+#
+# Questions like "symptoms of dengue in hindi" map straight onto
+# health_data['diseases'][disease]['symptoms'][language], so there is no need
+# to spend a model call on them. The resolver finds the disease, the aspect
+# asked about (symptoms, prevention, vaccination, or a general instruction) and
+# the language, and answers from finalData.json when it is confident the
+# message is a plain lookup. Anything conversational falls through to the LLM.
+#
+# When an aspect keyword was found but too few of the message's words are
+# explained by keywords, the optional intent classifier (intent_classifier.py)
+# can confirm the aspect, so lookups phrased in ways the filler lists do not
+# cover are still answered locally. It never supplies an aspect on its own:
+# it has no out-of-scope class, so "what causes dengue" would come out as a
+# symptoms lookup.
+
+import threading
+from collections import namedtuple
+
+from disease_index import build_disease_index
+from matcher import KeywordMatcher, tokenize
+from metrics import count
+from retrieval import LANGUAGE_WORDS, STOPWORDS, detect_language, load_topic_aliases
+
+# Minimum share of the message's tokens that must be explained by known keywords.
+MIN_CONFIDENCE = 0.6
+
+# Longer messages are treated as conversation, whatever they contain.
+MAX_TOKENS = 12
+
+# Minimum classifier confidence for confirming a keyword aspect.
+MIN_INTENT_CONFIDENCE = 0.7
+
+# Aspect answered for each Rasa intent in NLU rasa/domain.yml.
+INTENT_ASPECTS = {
+    'ask_disease_symptoms': 'symptoms',
+    'ask_disease_prevention': 'preventions',
+    'ask_vaccination': 'vaccination',
+    'ask_hygiene': 'hygiene',
+    'ask_doctor_consultation': 'doctor_consultation',
+}
+
+ASPECT_KEYWORDS = {
+    'symptoms': ['symptom', 'symptoms', 'signs', 'sign', 'lakshan', 'लक्षण', 'ଲକ୍ଷଣ'],
+    'preventions': ['prevent', 'prevention', 'preventions', 'avoid', 'protect', 'precautions', 'bachav', 'bachao',
+                    'बचाव', 'बचें', 'रोकथाम', 'ବଚାଉ', 'ବଞ୍ଚିବି', 'ପ୍ରତିରୋଧ'],
+    'vaccination': ['vaccine', 'vaccines', 'vaccination', 'vaccinations', 'immunization',
+                    'immunisation', 'schedule', 'टीका', 'टीके', 'टीकाकरण', 'ଟୀକା', 'ଟୀକାକରଣ'],
+    'hygiene': ['hygiene', 'hygienic', 'cleanliness', 'handwashing', 'स्वच्छता', 'सफाई', 'ସ୍ୱଚ୍ଛତା'],
+    'doctor_consultation': ['doctor', 'consult', 'consultation', 'डॉक्टर', 'ଡାକ୍ତର'],
+}
+
+# Words and word pairs that mark a message as being about the user's own situation.
+PERSONAL_WORDS = frozenset(['im', 'my', 'me', 'our', 'mine', 'मुझे', 'मेरे', 'मेरा', 'मेरी', 'ମୋତେ', 'ମୋର'])
+PERSONAL_PAIRS = frozenset([('i', 'have'), ('i', 'am'), ('i', 'feel'), ('i', 'got'), ('i', 'think'),
+                            ('we', 'have'), ('we', 'are')])
+
+# Filler words that may appear in a lookup question without lowering confidence.
+FILLER_WORDS = frozenset(['give', 'list', 'show', 'know', 'want', 'need', 'get', 'tips', 'ways', 'info',
+                          'information', 'methods', 'details', 'language', 'है', 'क्या', 'के', 'की', 'का',
+                          'से', 'में', 'बताएं', 'बताओ', 'कैसे', 'କଣ', 'କ', 'ଣ', 'ର', 'ରୁ', 'କିପରି', 'ଜଣାନ୍ତୁ'])
+
+SECTION_TITLES = {
+    'symptoms': {'en': 'Common Symptoms', 'hi': 'सामान्य लक्षण', 'or': 'ସାଧାରଣ ଲକ୍ଷଣ'},
+    'preventions': {'en': 'Prevention Methods', 'hi': 'बचाव के तरीके', 'or': 'ପ୍ରତିରୋଧ ଉପାୟ'},
+    'vaccination': {'en': 'Vaccination Schedule', 'hi': 'टीकाकरण कार्यक्रम', 'or': 'ଟୀକାକରଣ କାର୍ଯ୍ୟସୂଚୀ'},
+}
+
+Resolution = namedtuple('Resolution', ['answer', 'disease', 'aspect', 'language', 'confidence'])
+
+
+class FastPathResolver:
+    """Answers structured lookups from finalData.json without calling the LLM."""
+
+    def __init__(self, health_data, topic_aliases=None, classifier=None):
+        self.health_data = health_data
+        self.classifier = classifier
+        self.matcher = KeywordMatcher()
+        topic_aliases = load_topic_aliases() if topic_aliases is None else topic_aliases
+
+        for key in health_data.get('diseases', {}):
+            self.matcher.add(key.replace('_', ' '), 'disease', key)
+            for alias in topic_aliases.get(key, ()):
+                self.matcher.add(alias, 'disease', key)
+        self.disease_index = build_disease_index(health_data.get('diseases', {}), topic_aliases)
+
+        self.vaccines = health_data.get('vaccinations', {}).get('schedule', [])
+        for index, vaccine in enumerate(self.vaccines):
+            for field in ('vaccine_name', 'disease_prevented'):
+                for name in vaccine[field].values():
+                    self.matcher.add(name, 'vaccine', index)
+
+        for aspect, words in ASPECT_KEYWORDS.items():
+            for word in words:
+                self.matcher.add(word, 'aspect', aspect)
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # --- Resolution ---
+
+    def resolve(self, message):
+        """Returns a Resolution if the message can be answered locally with confidence, else None."""
+        tokens = tokenize(message)
+        if not tokens or len(tokens) > MAX_TOKENS or PERSONAL_WORDS.intersection(tokens):
+            return None
+        if PERSONAL_PAIRS.intersection(zip(tokens, tokens[1:])):
+            return None
+
+        hits = self.matcher.match(message)
+        found = {}
+        covered = set()
+        for hit in sorted(hits, key=lambda h: h.start):
+            found.setdefault(hit.intent, []).append(hit.entity)
+            covered.update(range(hit.start, hit.end))
+        if 'disease' not in found:
+            # No exact name: accept misspelled or transliterated ones ("maleria", "dengu").
+            for match in self.disease_index.find(message):
+                if match.key in self.health_data.get('diseases', {}) and not covered.intersection(range(match.start, match.end)):
+                    found.setdefault('disease', []).append(match.key)
+                    covered.update(range(match.start, match.end))
+        for position, token in enumerate(tokens):
+            if token in STOPWORDS or token in FILLER_WORDS or token in LANGUAGE_WORDS:
+                covered.add(position)
+        if 'aspect' not in found:
+            return None
+        aspect = found['aspect'][0]
+        confidence = len(covered) / len(tokens)
+        if confidence < MIN_CONFIDENCE:
+            if self.classifier is None:
+                return None
+            prediction = self.classifier.predict_one(message, threshold=MIN_INTENT_CONFIDENCE)
+            if INTENT_ASPECTS.get(prediction.intent) != aspect:
+                return None
+            confidence = prediction.confidence
+
+        language = detect_language(message)
+        diseases = found.get('disease', [])
+        disease = diseases[0] if diseases else None
+
+        if aspect in ('symptoms', 'preventions'):
+            if disease is None or len(set(diseases)) > 1:
+                return None
+            answer = self._disease_answer(disease, aspect, language)
+        elif aspect == 'vaccination':
+            if disease is not None and 'vaccine' not in found:
+                # A disease the schedule has no vaccine for ("covid vaccine"): the whole schedule is not an answer.
+                return None
+            answer = self._vaccination_answer(found.get('vaccine', []), language)
+        else:
+            answer = self._instruction_answer(aspect, language)
+
+        if answer is None:
+            return None
+        return Resolution(answer, disease, aspect, language, confidence)
+
+    def answer(self, message):
+        """Returns the local answer text for message, or None to fall through to the LLM. Counts hits and misses."""
+        resolution = self.resolve(message)
+        with self._lock:
+            if resolution is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        count('fast_path', result='miss' if resolution is None else 'hit')
+        return resolution.answer if resolution else None
+
+    def stats(self):
+        """Returns hit/miss counters and the hit rate for this process."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            }
+
+    # --- Answers ---
+
+    def _disclaimer(self, language):
+        return self.health_data.get('general_instructions', {}).get('doctor_consultation', {}).get(language, '')
+
+    def _disease_answer(self, disease, aspect, language):
+        items = self.health_data['diseases'][disease].get(aspect, {}).get(language)
+        if not items:
+            return None
+        title = disease.replace('_', ' ').title()
+        lines = [f"*{title} - {SECTION_TITLES[aspect][language]}:*"]
+        lines.extend(f"- {item}" for item in items)
+        disclaimer = self._disclaimer(language)
+        if disclaimer:
+            lines.extend(["", disclaimer])
+        return "\n".join(lines)
+
+    def _vaccination_answer(self, vaccine_indexes, language):
+        vaccines = [self.vaccines[i] for i in dict.fromkeys(vaccine_indexes)] or self.vaccines
+        if not vaccines:
+            return None
+        lines = [f"*{SECTION_TITLES['vaccination'][language]}:*", ""]
+        for vaccine in vaccines:
+            lines.append(f"*{vaccine['vaccine_name'].get(language)}* ({vaccine['disease_prevented'].get(language)})")
+            lines.append(vaccine['schedule'].get(language, ''))
+            lines.append("")
+        return "\n".join(lines).strip()
+
+    def _instruction_answer(self, instruction, language):
+        return self.health_data.get('general_instructions', {}).get(instruction, {}).get(language)
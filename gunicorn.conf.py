@@ -0,0 +1,34 @@
+# gunicorn.conf.py
+#
+# Production server settings for either bot:
+#
+#     gunicorn -c gunicorn.conf.py 'app1:create_app()'
+#     gunicorn -c gunicorn.conf.py 'app:create_app()'
+#
+# The app is loaded once in the master (preload_app) and the workers are
+# forked from it, so they share its knowledge data and indexes copy-on-write
+# (see app_factory.py). This follows the advice in the CPython gc docs:
+#   - the collector is off in the master while the app loads, so freed objects
+#     do not leave holes in pages that could otherwise be shared;
+#   - create_app() freezes what was loaded;
+#   - each worker turns the collector back on.
+
+import gc
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:8080')
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+worker_class = 'gthread'
+# More threads than ADMISSION_MAX_CONCURRENCY + ADMISSION_MAX_QUEUE (admission.py), so that in a spike the
+# spare threads answer excess requests with the canned busy reply instead of leaving them in gunicorn's queue.
+threads = int(os.getenv('GUNICORN_THREADS', '40'))
+# Longer than LLM_TIMEOUT, so a slow model call is cut off by the gateway rather than by a worker restart.
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+preload_app = True
+
+# The master reads this file before it imports the app.
+gc.disable()
+
+
+def post_fork(server, worker):
+    gc.enable()
@@ -0,0 +1,252 @@
+# intent_classifier.py
+#
+# In-process intent classifier trained from the Rasa NLU examples.
+#
+# Routing by intent used to mean either keyword rules or a network hop to a
+# separate Rasa server. This module trains a small model from the same
+# training data (NLU rasa/data/nlu.yml) with the intent names declared in
+# NLU rasa/domain.yml: character n-gram TF-IDF features, which cope with
+# Hindi and Odia inflections and with misspellings, feeding a multinomial
+# logistic regression fitted with NumPy.
+#
+# Entity annotations such as "[malaria](disease)" are used to augment the
+# training set: each annotated example is repeated with the other disease
+# names in the same script, so the model learns the sentence pattern rather
+# than the particular disease.
+#
+# The trained model is saved as a compressed .npz (vocabulary, IDF and
+# weights) that loads in a few milliseconds and needs only NumPy. Building it
+# also needs PyYAML to read the training data:
+#
+#     python intent_classifier.py
+#
+# benchmarks/bench_intents.py reports held-out accuracy and latency.
+
+import argparse
+import os
+import re
+import time
+from collections import Counter, namedtuple
+
+import numpy as np
+
+from matcher import tokenize
+from retrieval import detect_language
+
+NLU_FILE = os.path.join('NLU rasa', 'data', 'nlu.yml')
+DOMAIN_FILE = os.path.join('NLU rasa', 'domain.yml')
+INTENT_MODEL = os.getenv('INTENT_MODEL', 'intent_model.npz')
+
+# Predictions less confident than this are reported as no intent.
+INTENT_THRESHOLD = float(os.getenv('INTENT_THRESHOLD', '0.5'))
+
+NGRAM_RANGE = (2, 4)
+EPOCHS = 300
+LEARNING_RATE = 2.0
+L2_PENALTY = 1e-4
+
+ENTITY_RE = re.compile(r'\[([^\]]+)\]\((\w+)\)')
+
+Example = namedtuple('Example', ['text', 'intent', 'entities'])
+Prediction = namedtuple('Prediction', ['intent', 'confidence'])
+
+
+# --- Training data ---
+
+def load_domain_intents(path=DOMAIN_FILE):
+    """Returns the intent names declared in domain.yml, in order."""
+    import yaml
+    with open(path, encoding='utf-8') as f:
+        return list(yaml.safe_load(f).get('intents', []))
+
+
+def load_nlu_examples(path=NLU_FILE):
+    """Reads nlu.yml into Examples with the entity markup removed and the entities listed separately."""
+    import yaml
+    with open(path, encoding='utf-8') as f:
+        data = yaml.safe_load(f)
+    examples = []
+    for block in data.get('nlu', []):
+        if 'intent' not in block:
+            continue
+        for line in block.get('examples', '').splitlines():
+            line = line.strip()
+            if not line.startswith('- '):
+                continue
+            annotated = line[2:].strip()
+            entities = [(value, entity) for value, entity in ENTITY_RE.findall(annotated)]
+            examples.append(Example(ENTITY_RE.sub(r'\1', annotated), block['intent'], entities))
+    return examples
+
+
+def augment_examples(examples):
+    """
+    Adds a copy of every entity-annotated example for each other value of the
+    same entity written in the same language.
+    """
+    values = {}
+    for example in examples:
+        for value, entity in example.entities:
+            values.setdefault((entity, detect_language(value)), set()).add(value)
+
+    augmented = list(examples)
+    for example in examples:
+        for value, entity in example.entities:
+            for other in sorted(values[(entity, detect_language(value))] - {value}):
+                augmented.append(Example(example.text.replace(value, other), example.intent,
+                                         [(other, entity)]))
+    return augmented
+
+
+# --- Features ---
+
+def features(text):
+    """Word tokens plus the character n-grams of each word padded with spaces."""
+    grams = []
+    for word in tokenize(text):
+        grams.append(f"w:{word}")
+        padded = f" {word} "
+        for n in range(NGRAM_RANGE[0], NGRAM_RANGE[1] + 1):
+            grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return grams
+
+
+class IntentClassifier:
+    """Character n-gram TF-IDF features and a linear softmax layer."""
+
+    def __init__(self, intents, vocabulary, idf, weights, bias):
+        self.intents = list(intents)
+        self.vocabulary = {gram: i for i, gram in enumerate(vocabulary)}
+        self.idf = idf
+        self.weights = weights
+        self.bias = bias
+
+    # --- Vectorising ---
+
+    def _rows(self, texts):
+        """Returns the texts as a CSR matrix (indptr, indices, values) of L2-normalised TF-IDF rows."""
+        indptr = [0]
+        indices = []
+        values = []
+        for text in texts:
+            counts = Counter(self.vocabulary[g] for g in features(text) if g in self.vocabulary)
+            if counts:
+                ids = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+                tf = 1 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+                row = tf * self.idf[ids]
+                indices.append(ids)
+                values.append(row / np.linalg.norm(row))
+            indptr.append(indptr[-1] + len(counts))
+        if not indices:
+            return np.array(indptr), np.zeros(0, np.int64), np.zeros(0, np.float32)
+        return np.array(indptr), np.concatenate(indices), np.concatenate(values)
+
+    def _dense(self, texts):
+        indptr, indices, values = self._rows(texts)
+        matrix = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float32)
+        rows = np.repeat(np.arange(len(texts)), np.diff(indptr))
+        matrix[rows, indices] = values
+        return matrix
+
+    # --- Prediction ---
+
+    def probabilities(self, texts):
+        """Returns an (n_texts, n_intents) array of intent probabilities."""
+        indptr, indices, values = self._rows(texts)
+        logits = np.tile(self.bias, (len(texts), 1))
+        rows = np.repeat(np.arange(len(texts)), np.diff(indptr))
+        np.add.at(logits, rows, self.weights[indices] * values[:, None])
+        logits -= logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def predict(self, texts, threshold=INTENT_THRESHOLD):
+        """Classifies a batch of messages. Intents below threshold confidence are returned as None."""
+        probabilities = self.probabilities(texts)
+        best = probabilities.argmax(axis=1)
+        results = []
+        for i, intent_id in enumerate(best):
+            confidence = float(probabilities[i, intent_id])
+            intent = self.intents[intent_id] if confidence >= threshold else None
+            results.append(Prediction(intent, round(confidence, 4)))
+        return results
+
+    def predict_one(self, text, threshold=INTENT_THRESHOLD):
+        return self.predict([text], threshold)[0]
+
+    # --- Training and storage ---
+
+    @classmethod
+    def fit(cls, texts, labels, intents, epochs=EPOCHS, learning_rate=LEARNING_RATE, l2=L2_PENALTY):
+        """Trains a classifier on texts labelled with names from intents."""
+        document_frequency = Counter()
+        for text in texts:
+            document_frequency.update(set(features(text)))
+        vocabulary = sorted(document_frequency)
+        idf = np.array([np.log((1 + len(texts)) / (1 + document_frequency[g])) + 1 for g in vocabulary],
+                       dtype=np.float32)
+
+        model = cls(intents, vocabulary, idf,
+                    np.zeros((len(vocabulary), len(intents)), dtype=np.float32),
+                    np.zeros(len(intents), dtype=np.float32))
+        x = model._dense(texts)
+        y = np.array([intents.index(label) for label in labels])
+        targets = np.eye(len(intents), dtype=np.float32)[y]
+
+        # Weight examples so that augmented intents do not drown out the others.
+        class_counts = np.bincount(y, minlength=len(intents)).astype(np.float32)
+        sample_weights = (len(y) / (len(intents) * np.maximum(class_counts, 1)))[y][:, None]
+
+        for _ in range(epochs):
+            logits = x @ model.weights + model.bias
+            logits -= logits.max(axis=1, keepdims=True)
+            probabilities = np.exp(logits)
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+            gradient = (probabilities - targets) * sample_weights / len(y)
+            model.weights -= learning_rate * (x.T @ gradient + l2 * model.weights)
+            model.bias -= learning_rate * gradient.sum(axis=0)
+        return model
+
+    def save(self, path=INTENT_MODEL):
+        vocabulary = sorted(self.vocabulary, key=self.vocabulary.get)
+        np.savez_compressed(path, intents=np.array(self.intents), vocabulary=np.array(vocabulary),
+                            idf=self.idf, weights=self.weights.astype(np.float16), bias=self.bias)
+
+    @classmethod
+    def load(cls, path=INTENT_MODEL):
+        with np.load(path) as data:
+            return cls(data['intents'].tolist(), data['vocabulary'].tolist(), data['idf'],
+                       data['weights'].astype(np.float32), data['bias'])
+
+
+def load_intent_classifier(path=INTENT_MODEL):
+    """Loads the trained classifier, or returns None (with a warning) if it has not been built."""
+    try:
+        return IntentClassifier.load(path)
+    except FileNotFoundError:
+        print(f"WARNING: {path} not found; run 'python intent_classifier.py' to build the intent classifier.")
+        return None
+
+
+def train(examples, intents):
+    augmented = augment_examples(examples)
+    return IntentClassifier.fit([e.text for e in augmented], [e.intent for e in augmented], intents)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the in-process intent classifier from the Rasa NLU data.")
+    parser.add_argument('--output', default=INTENT_MODEL, help="where to write the model")
+    args = parser.parse_args()
+
+    intents = load_domain_intents()
+    examples = [e for e in load_nlu_examples() if e.intent in intents]
+
+    start = time.perf_counter()
+    model = train(examples, intents)
+    model.save(args.output)
+    print(f"Trained on {len(examples)} examples ({len(model.vocabulary)} features) in "
+          f"{time.perf_counter() - start:.1f}s; wrote {args.output} ({os.path.getsize(args.output) / 1024:.0f} KB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,537 @@
+# knowledge_snapshot.py
+#
+# Compiled, memory-mapped snapshot of the health knowledge files.
+#
+# app.py, app1.py and the Rasa action server each used to parse their own JSON
+# files at import time, so every gunicorn worker and action-server process
+# held a private, pointer-heavy copy of the same dict tree, and the copies
+# drifted apart. A build step now validates diseases.json,
+# basic-first-aid-emergency.json, vaccination.json and finalData.json and
+# compiles them into one versioned binary file:
+#
+#   header    magic, version, SHA-256 of the sources, table offsets, metadata
+#   strings   every distinct string once (interned), sorted, as an offset
+#             table into a UTF-8 blob
+#   nodes     one fixed-size record per JSON value: type, item count, and a
+#             payload (an integer, a float, a string id, or an offset into
+#             the children table)
+#   children  uint32 node ids for lists; for objects, key string ids, value
+#             node ids, and the entries' positions sorted by key
+#
+# Readers mmap the file, so all processes share one page-cache copy, and wrap
+# it in lazy Mapping/Sequence views that decode only what they touch. Object
+# lookups binary-search the sorted key positions.
+#
+# Snapshots are written as snapshots/knowledge-<version>.snap, and the
+# snapshots/CURRENT pointer file is swapped atomically with os.replace.
+# SnapshotStore re-reads the pointer every few seconds and opens the new
+# version; requests holding the old one keep a consistent view until they
+# drop it. When a source file changes, the first process to notice rebuilds
+# the snapshot under a file lock. Objects built from the data, such as search
+# indexes, are held in a DerivedStore, which rebuilds them for each new
+# version. To rebuild by hand:
+#
+#     python knowledge_snapshot.py
+
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from collections.abc import Mapping, Sequence
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join(BASE_DIR, 'snapshots'))
+
+# Directory holding the JSON knowledge files (the project root unless overridden).
+KNOWLEDGE_DIR = os.getenv('KNOWLEDGE_DIR', BASE_DIR)
+
+# Snapshot section -> source file.
+SOURCES = {
+    'diseases': os.path.join(KNOWLEDGE_DIR, 'diseases.json'),
+    'first_aid': os.path.join(KNOWLEDGE_DIR, 'basic-first-aid-emergency.json'),
+    'vaccination': os.path.join(KNOWLEDGE_DIR, 'vaccination.json'),
+    'health': os.path.join(KNOWLEDGE_DIR, 'finalData.json'),
+}
+
+# How often (in seconds) a process checks for a new version or changed sources.
+SNAPSHOT_CHECK_INTERVAL = float(os.getenv('SNAPSHOT_CHECK_INTERVAL', '2'))
+
+# Older snapshot files kept on disk for processes that still have them mapped.
+KEEP_SNAPSHOTS = 3
+
+MAGIC = b'HKSNAP01'
+POINTER_FILE = 'CURRENT'
+
+# magic, version, sources digest, string count, string offsets, string blob,
+# node count, nodes, children, root node, metadata offset, metadata length
+HEADER = struct.Struct('<8sQ32sIIIIIIIII')
+NODE = struct.Struct('<BxxxIq')
+FLOAT = struct.Struct('<d')
+
+NULL, FALSE, TRUE, INT, FLOAT_TYPE, STRING, LIST, OBJECT = range(8)
+
+
+# --- Validation ---
+
+def _require(errors, condition, message):
+    if not condition:
+        errors.append(message)
+    return condition
+
+
+def _is_text_list(value):
+    return isinstance(value, list) and all(isinstance(v, str) for v in value)
+
+
+def validate_sources(sources):
+    """Returns a list of problems with the loaded source files; empty if they are usable."""
+    errors = []
+
+    diseases = sources.get('diseases', {})
+    for i, disease in enumerate(diseases.get('disease_symptoms', [])):
+        where = f"diseases.json disease_symptoms[{i}]"
+        _require(errors, isinstance(disease.get('disease_name'), str), f"{where}: missing disease_name")
+        _require(errors, _is_text_list(disease.get('common_symptoms')), f"{where}: common_symptoms must be a list of text")
+        for category in disease.get('prevention_methods', []):
+            _require(errors, 'category' in category and _is_text_list(category.get('methods')),
+                     f"{where}: prevention_methods entries need a category and a list of methods")
+
+    first_aid = sources.get('first_aid', {})
+    for i, condition in enumerate(first_aid.get('first_aid', [])):
+        _require(errors, isinstance(condition.get('condition'), str) and _is_text_list(condition.get('steps')),
+                 f"basic-first-aid-emergency.json first_aid[{i}]: needs a condition and a list of steps")
+    for i, contact in enumerate(first_aid.get('emergency_contacts', [])):
+        _require(errors, 'service' in contact and 'number' in contact,
+                 f"basic-first-aid-emergency.json emergency_contacts[{i}]: needs a service and a number")
+
+    vaccination = sources.get('vaccination', {})
+    for i, vaccine in enumerate(vaccination.get('vaccination_schedule', [])):
+        _require(errors, all(k in vaccine for k in ('vaccine_name', 'disease_prevented', 'schedule')),
+                 f"vaccination.json vaccination_schedule[{i}]: needs vaccine_name, disease_prevented and schedule")
+
+    health = sources.get('health', {})
+    for key, sections in health.get('diseases', {}).items():
+        for section, by_language in sections.items():
+            _require(errors, isinstance(by_language, dict) and all(_is_text_list(v) for v in by_language.values()),
+                     f"finalData.json diseases.{key}.{section}: must map languages to lists of text")
+    for key, by_language in health.get('general_instructions', {}).items():
+        _require(errors, isinstance(by_language, dict) and all(isinstance(v, str) for v in by_language.values()),
+                 f"finalData.json general_instructions.{key}: must map languages to text")
+
+    return errors
+
+
+# --- Compiling ---
+
+def compile_snapshot(data, version, digest=b'', meta=None):
+    """Encodes a JSON-compatible object as snapshot bytes."""
+    strings = set()
+
+    def collect(value):
+        if isinstance(value, str):
+            strings.add(value)
+        elif isinstance(value, dict):
+            strings.update(value)
+            for item in value.values():
+                collect(item)
+        elif isinstance(value, list):
+            for item in value:
+                collect(item)
+    collect(data)
+
+    encoded = sorted(s.encode('utf-8') for s in strings)
+    string_ids = {s.decode('utf-8'): i for i, s in enumerate(encoded)}
+    string_offsets = [0]
+    for s in encoded:
+        string_offsets.append(string_offsets[-1] + len(s))
+
+    nodes = []
+    children = []
+
+    def add(value):
+        node_id = len(nodes)
+        nodes.append(None)
+        if value is None:
+            nodes[node_id] = (NULL, 0, 0)
+        elif value is True or value is False:
+            nodes[node_id] = (TRUE if value else FALSE, 0, 0)
+        elif isinstance(value, int):
+            nodes[node_id] = (INT, 0, value)
+        elif isinstance(value, float):
+            nodes[node_id] = (FLOAT_TYPE, 0, struct.unpack('<q', FLOAT.pack(value))[0])
+        elif isinstance(value, str):
+            nodes[node_id] = (STRING, 0, string_ids[value])
+        elif isinstance(value, list):
+            item_ids = [add(item) for item in value]
+            nodes[node_id] = (LIST, len(item_ids), len(children))
+            children.extend(item_ids)
+        elif isinstance(value, dict):
+            keys = [string_ids[k] for k in value]
+            value_ids = [add(item) for item in value.values()]
+            by_key = sorted(range(len(keys)), key=keys.__getitem__)
+            nodes[node_id] = (OBJECT, len(keys), len(children))
+            children.extend(keys + value_ids + by_key)
+        else:
+            raise TypeError(f"Cannot store {type(value).__name__} in a snapshot")
+        return node_id
+
+    root = add(data)
+
+    meta_bytes = json.dumps(meta or {}).encode('utf-8')
+    offsets = struct.pack(f'<{len(string_offsets)}I', *string_offsets)
+    blob = b''.join(encoded)
+    node_bytes = b''.join(NODE.pack(*node) for node in nodes)
+    child_bytes = struct.pack(f'<{len(children)}I', *children)
+
+    def aligned(position):
+        return (position + 7) & ~7
+
+    strings_at = HEADER.size
+    blob_at = strings_at + len(offsets)
+    nodes_at = aligned(blob_at + len(blob))
+    children_at = nodes_at + len(node_bytes)
+    meta_at = children_at + len(child_bytes)
+
+    header = HEADER.pack(MAGIC, version, digest.ljust(32, b'\0'), len(encoded), strings_at, blob_at,
+                         len(nodes), nodes_at, children_at, root, meta_at, len(meta_bytes))
+    return b''.join([header, offsets, blob, b'\0' * (nodes_at - blob_at - len(blob)),
+                     node_bytes, child_bytes, meta_bytes])
+
+
+# --- Reading ---
+
+class Snapshot:
+    """A memory-mapped snapshot. Sections are read with snapshot['health'] and behave like read-only JSON."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.version, self.digest, self._string_count, strings_at, self._blob_at,
+         node_count, self._nodes_at, children_at, self._root, meta_at, meta_length) = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a knowledge snapshot")
+        view = memoryview(self._mmap)
+        self._string_offsets = view[strings_at:strings_at + 4 * (self._string_count + 1)].cast('I')
+        self._children = view[children_at:meta_at].cast('I')
+        self.meta = json.loads(bytes(self._mmap[meta_at:meta_at + meta_length]) or b'{}')
+
+    def _string_bytes(self, string_id):
+        start = self._blob_at + self._string_offsets[string_id]
+        return self._mmap[start:self._blob_at + self._string_offsets[string_id + 1]]
+
+    def _string(self, string_id):
+        return self._string_bytes(string_id).decode('utf-8')
+
+    def _value(self, node_id):
+        kind, count, payload = NODE.unpack_from(self._mmap, self._nodes_at + NODE.size * node_id)
+        if kind == STRING:
+            return self._string(payload)
+        if kind == OBJECT:
+            return SnapshotObject(self, count, payload)
+        if kind == LIST:
+            return SnapshotList(self, count, payload)
+        if kind == INT:
+            return payload
+        if kind == FLOAT_TYPE:
+            return FLOAT.unpack(struct.pack('<q', payload))[0]
+        return {NULL: None, FALSE: False, TRUE: True}[kind]
+
+    @property
+    def root(self):
+        return self._value(self._root)
+
+    def __getitem__(self, section):
+        return self.root[section]
+
+    def get(self, section, default=None):
+        return self.root.get(section, default)
+
+
+class SnapshotList(Sequence):
+    """A lazy, read-only view of a JSON array in a snapshot."""
+
+    __slots__ = ('_snapshot', '_count', '_start')
+
+    def __init__(self, snapshot, count, start):
+        self._snapshot = snapshot
+        self._count = count
+        self._start = start
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return self._snapshot._value(self._snapshot._children[self._start + index])
+
+
+class SnapshotObject(Mapping):
+    """A lazy, read-only view of a JSON object in a snapshot. Iteration keeps the source order."""
+
+    __slots__ = ('_snapshot', '_count', '_start')
+
+    def __init__(self, snapshot, count, start):
+        self._snapshot = snapshot
+        self._count = count
+        self._start = start
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        children = self._snapshot._children
+        for i in range(self._count):
+            yield self._snapshot._string(children[self._start + i])
+
+    def _find(self, key):
+        """Returns the entry position for key by binary search over the sorted positions, or -1."""
+        if not isinstance(key, str):
+            return -1
+        target = key.encode('utf-8')
+        snapshot = self._snapshot
+        children = snapshot._children
+        by_key = self._start + 2 * self._count
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            position = children[by_key + middle]
+            candidate = snapshot._string_bytes(children[self._start + position])
+            if candidate < target:
+                low = middle + 1
+            elif candidate > target:
+                high = middle
+            else:
+                return position
+        return -1
+
+    def __getitem__(self, key):
+        position = self._find(key)
+        if position < 0:
+            raise KeyError(key)
+        return self._snapshot._value(self._snapshot._children[self._start + self._count + position])
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+
+def to_python(value):
+    """Copies a snapshot view into plain dicts and lists."""
+    if isinstance(value, Mapping):
+        return {k: to_python(v) for k, v in value.items()}
+    if isinstance(value, Sequence) and not isinstance(value, str):
+        return [to_python(v) for v in value]
+    return value
+
+
+# --- Building and versioning ---
+
+def _source_signatures(sources):
+    signatures = {}
+    for name, path in sources.items():
+        try:
+            st = os.stat(path)
+            signatures[name] = [st.st_mtime_ns, st.st_size]
+        except OSError:
+            signatures[name] = None
+    return signatures
+
+
+def _read_pointer(directory):
+    try:
+        with open(os.path.join(directory, POINTER_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def build_snapshot(directory=SNAPSHOT_DIR, sources=SOURCES):
+    """
+    Validates the sources and writes a new snapshot version, then points
+    CURRENT at it. Returns the new file's path, or the current one if the
+    sources have not changed. Raises ValueError if validation fails.
+    """
+    os.makedirs(directory, exist_ok=True)
+    signatures = _source_signatures(sources)
+    data = {}
+    for name, path in sources.items():
+        with open(path, encoding='utf-8') as f:
+            data[name] = json.load(f)
+    errors = validate_sources(data)
+    if errors:
+        raise ValueError("Invalid knowledge files:\n" + "\n".join(errors))
+
+    digest = hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).digest()
+    current_name = _read_pointer(directory)
+    version = 1
+    if current_name:
+        try:
+            current = Snapshot(os.path.join(directory, current_name))
+            if current.digest == digest and current.meta.get('sources') == signatures:
+                return current.path
+            version = current.version + 1
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable snapshot {current_name}: {e}")
+
+    name = f"knowledge-{version:06d}.snap"
+    payload = compile_snapshot(data, version, digest, {'sources': signatures, 'built_at': time.time()})
+    temporary = os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+    with open(temporary, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, os.path.join(directory, name))
+
+    pointer = os.path.join(directory, f".{POINTER_FILE}.{os.getpid()}.tmp")
+    with open(pointer, 'w') as f:
+        f.write(name + "\n")
+    os.replace(pointer, os.path.join(directory, POINTER_FILE))
+
+    old = sorted(f for f in os.listdir(directory) if f.startswith('knowledge-') and f.endswith('.snap'))
+    for stale in old[:-KEEP_SNAPSHOTS]:
+        os.remove(os.path.join(directory, stale))
+    return os.path.join(directory, name)
+
+
+class SnapshotStore:
+    """
+    Hands out the current Snapshot. Every interval seconds it follows the
+    CURRENT pointer to newer versions and, with auto_build, rebuilds the
+    snapshot when a source file has changed.
+    """
+
+    def __init__(self, directory=SNAPSHOT_DIR, sources=SOURCES, interval=SNAPSHOT_CHECK_INTERVAL, auto_build=True):
+        self.directory = directory
+        self.sources = sources
+        self.interval = interval
+        self.auto_build = auto_build
+        self._snapshot = None
+        self._checked = 0.0
+        self._failed_signatures = None
+        self._lock = threading.Lock()
+
+    def _rebuild(self, signatures):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            # Only one process builds; the others wait and then find it up to date.
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                build_snapshot(self.directory, self.sources)
+            except (OSError, ValueError) as e:
+                print(f"Failed to rebuild the knowledge snapshot, keeping the previous one: {e}")
+                if self._snapshot is None and _read_pointer(self.directory) is None:
+                    raise
+                # Do not retry until the files change again.
+                self._failed_signatures = signatures
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        name = _read_pointer(self.directory)
+        if self.auto_build:
+            snapshot = self._snapshot
+            if snapshot is None or os.path.basename(snapshot.path) != name:
+                snapshot = Snapshot(os.path.join(self.directory, name)) if name else None
+            signatures = _source_signatures(self.sources)
+            if (snapshot is None or snapshot.meta.get('sources') != signatures) and signatures != self._failed_signatures:
+                self._rebuild(signatures)
+                name = _read_pointer(self.directory)
+        if name and (self._snapshot is None or os.path.basename(self._snapshot.path) != name):
+            self._snapshot = Snapshot(os.path.join(self.directory, name))
+
+    def current(self):
+        """Returns the current Snapshot, checking for a newer one at most once per interval."""
+        if self._snapshot is None or time.monotonic() - self._checked >= self.interval:
+            with self._lock:
+                if self._snapshot is None or time.monotonic() - self._checked >= self.interval:
+                    self._refresh()
+                    self._checked = time.monotonic()
+        return self._snapshot
+
+
+_store = None
+
+
+def get_snapshot_store():
+    """Returns the process-wide SnapshotStore."""
+    global _store
+    if _store is None:
+        _store = SnapshotStore()
+    return _store
+
+
+class DerivedStore:
+    """
+    Holds an object built from the current snapshot, such as a search index
+    or responses.ResponseTable, and rebuilds it with build(snapshot) when the
+    snapshot changes version. A watcher thread started lazily in each process
+    polls for new versions, so requests never wait for a rebuild and always
+    see one complete object. If a rebuild fails, the previous object is kept
+    and the watcher keeps polling.
+    """
+
+    def __init__(self, build, name='derived data', snapshots=None, interval=SNAPSHOT_CHECK_INTERVAL):
+        self.build = build
+        self.name = name
+        self.snapshots = snapshots or get_snapshot_store()
+        self.interval = interval
+        self._version = None
+        self._value = None
+        self._lock = threading.Lock()
+        self._watcher_pid = None
+        self.reload()
+
+    def reload(self):
+        """Rebuilds the object if the snapshot changed version since the last build. Returns True if it did."""
+        with self._lock:
+            try:
+                snapshot = self.snapshots.current()
+                if snapshot.version == self._version:
+                    return False
+                value = self.build(snapshot)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"Failed to rebuild {self.name}, keeping the previous one: {e}")
+                if self._value is None:
+                    raise
+                return False
+            self._value = value
+            self._version = snapshot.version
+            return True
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.reload()
+            except Exception as e:
+                # An unexpected error must not end the thread, or hot reload stops for good.
+                print(f"Unexpected error while rebuilding {self.name}, keeping the previous one: {e!r}")
+
+    def current(self):
+        """Returns the object for the latest version seen, starting the watcher in this process if needed."""
+        if self.interval > 0 and self._watcher_pid != os.getpid():
+            with self._lock:
+                if self._watcher_pid != os.getpid():
+                    self._watcher_pid = os.getpid()
+                    threading.Thread(target=self._watch, name='snapshot-watcher', daemon=True).start()
+        return self._value
+
+
+def main():
+    path = build_snapshot()
+    snapshot = Snapshot(path)
+    print(f"Knowledge snapshot version {snapshot.version}: {path} ({os.path.getsize(path) / 1024:.0f} KB)")
+
+
+if __name__ == "__main__":
+    main()
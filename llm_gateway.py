@@ -0,0 +1,349 @@
+# llm_gateway.py
+#
+# Gateway between app1.py and the Gemini API.
+#
+# Model calls used to run with no deadline and no limit on how many were in
+# flight, so when the model slowed down every worker thread hung on it and
+# the whole bot stalled. Every call now goes through this gateway:
+#
+#   - one long-lived genai client per process, so HTTP connections are reused;
+#   - at most LLM_MAX_CONCURRENCY calls in flight, with a bounded wait queue
+#     (LLM_MAX_QUEUE callers, each waiting at most LLM_QUEUE_TIMEOUT seconds);
+#   - a per-call deadline (LLM_TIMEOUT), enforced by the HTTP client on each
+#     request and read, and by stream() on the stream as a whole;
+#   - a circuit breaker over the last LLM_BREAKER_WINDOW calls. It opens when
+#     too many of them failed or were slow, then rejects calls immediately
+#     for LLM_BREAKER_COOLDOWN seconds. After that it lets one trial call
+#     through: if the trial succeeds the breaker closes, otherwise it opens
+#     again.
+#
+# generate() returns the whole reply; stream() yields it in pieces as the
+# model produces them (app1.py's REPLY_MODE=stream). A call that cannot be
+# made or fails raises LlmUnavailable straight away, so the caller can fall
+# back to a local answer instead of blocking.
+# GEMINI_BASE_URL points the client at another endpoint, such as the fake
+# model server in benchmarks/fake_gemini.py.
+
+import os
+import threading
+import time
+from collections import deque
+
+from metrics import count
+
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')
+GEMINI_BASE_URL = os.getenv('GEMINI_BASE_URL')
+
+# Per-call deadline, in seconds. In app1.py's default sync reply mode the call
+# runs inside the Twilio webhook, which Twilio abandons after 15 seconds, so
+# the deadline plus LLM_QUEUE_TIMEOUT must leave time to send the fallback
+# reply. The background reply modes (async, stream) can wait longer.
+BACKGROUND_REPLIES = os.getenv('REPLY_MODE', 'sync') in ('async', 'stream')
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '20' if BACKGROUND_REPLIES else '10'))
+
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+LLM_MAX_QUEUE = int(os.getenv('LLM_MAX_QUEUE', '16'))
+LLM_QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', '2'))
+
+# The breaker opens when at least LLM_BREAKER_FAILURE_RATE of the last
+# LLM_BREAKER_WINDOW calls failed or took longer than LLM_SLOW_CALL seconds.
+LLM_BREAKER_WINDOW = int(os.getenv('LLM_BREAKER_WINDOW', '20'))
+LLM_BREAKER_MIN_CALLS = int(os.getenv('LLM_BREAKER_MIN_CALLS', '5'))
+LLM_BREAKER_FAILURE_RATE = float(os.getenv('LLM_BREAKER_FAILURE_RATE', '0.5'))
+LLM_SLOW_CALL = float(os.getenv('LLM_SLOW_CALL', '10'))
+LLM_BREAKER_COOLDOWN = float(os.getenv('LLM_BREAKER_COOLDOWN', '30'))
+
+# How many recent latencies are kept for percentile metrics.
+SAMPLE_WINDOW = 1000
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class LlmUnavailable(Exception):
+    """Raised when a model call is rejected or fails. reason is a short machine-readable code."""
+
+    def __init__(self, reason, detail=''):
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+
+
+def _percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def create_genai_client(api_key, base_url=GEMINI_BASE_URL, timeout=LLM_TIMEOUT):
+    """Builds a genai client with the gateway's deadline, pointed at base_url if given."""
+    from google import genai
+    from google.genai import types
+
+    options = {'timeout': int(timeout * 1000)}
+    if base_url:
+        options['base_url'] = base_url
+    return genai.Client(api_key=api_key, http_options=types.HttpOptions(**options))
+
+
+class CircuitBreaker:
+    """Tracks recent call outcomes and decides whether calls may be made."""
+
+    def __init__(self, window=LLM_BREAKER_WINDOW, min_calls=LLM_BREAKER_MIN_CALLS,
+                 failure_rate=LLM_BREAKER_FAILURE_RATE, slow_call=LLM_SLOW_CALL, cooldown=LLM_BREAKER_COOLDOWN):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.opened = 0
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Returns True if a call may go ahead. In the half-open state only one trial call is allowed."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    return False
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN:
+                if self._trial_running:
+                    return False
+                self._trial_running = True
+            return True
+
+    def record(self, ok, latency):
+        """Records a call's outcome; a slow success counts against the breaker like a failure."""
+        bad = not ok or latency > self.slow_call
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._trial_running = False
+                if bad:
+                    self._open()
+                else:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                return
+            self._outcomes.append(bad)
+            if (self.state == CLOSED and len(self._outcomes) >= self.min_calls
+                    and sum(self._outcomes) / len(self._outcomes) >= self.failure_rate):
+                self._open()
+
+    def cancel(self):
+        """Gives back a half-open trial slot for a call that was allowed but never made."""
+        with self._lock:
+            self._trial_running = False
+
+    def _open(self):
+        self.state = OPEN
+        self.opened += 1
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+
+
+class LlmGateway:
+    """
+    Bounded, deadline-limited access to the Gemini API with a circuit breaker.
+    Without a client_factory (no API key) every call raises LlmUnavailable('not_configured').
+    """
+
+    def __init__(self, client_factory, model=GEMINI_MODEL, max_concurrency=LLM_MAX_CONCURRENCY,
+                 max_queue=LLM_MAX_QUEUE, queue_timeout=LLM_QUEUE_TIMEOUT, breaker=None, timeout=LLM_TIMEOUT):
+        self.client_factory = client_factory
+        self.model = model
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._client = None
+        self._pid = None
+        self._client_lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+        self._counters = {'calls': 0, 'succeeded': 0, 'failed': 0, 'timed_out': 0,
+                          'queue_full': 0, 'queue_timeout': 0, 'circuit_open': 0, 'not_configured': 0}
+        self._latencies = deque(maxlen=SAMPLE_WINDOW)
+
+    def client(self):
+        """Returns this process's long-lived genai client."""
+        # HTTP connection pools do not survive a fork, so each process builds its own client.
+        if self._client is None or self._pid != os.getpid():
+            with self._client_lock:
+                # Only one thread builds it: a discarded genai client closes its HTTP client when collected,
+                # failing any call still using it.
+                if self._client is None or self._pid != os.getpid():
+                    self._client = self.client_factory()
+                    self._pid = os.getpid()
+        return self._client
+
+    def _count(self, counter):
+        with self._condition:
+            self._counters[counter] += 1
+        count('llm', result=counter)
+
+    # --- Admission ---
+
+    def _acquire(self):
+        with self._condition:
+            if self._in_flight < self.max_concurrency:
+                self._in_flight += 1
+                return
+            if self._waiting >= self.max_queue:
+                self._counters['queue_full'] += 1
+                count('llm', result='queue_full')
+                raise LlmUnavailable('queue_full')
+            self._waiting += 1
+            try:
+                admitted = self._condition.wait_for(lambda: self._in_flight < self.max_concurrency,
+                                                    timeout=self.queue_timeout)
+            finally:
+                self._waiting -= 1
+            if not admitted:
+                self._counters['queue_timeout'] += 1
+                count('llm', result='queue_timeout')
+                raise LlmUnavailable('queue_timeout')
+            self._in_flight += 1
+
+    def _release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+
+    # --- Calls ---
+
+    def _begin(self):
+        """Admits a call: checks the configuration and the breaker, then takes a concurrency slot."""
+        if self.client_factory is None:
+            self._count('not_configured')
+            raise LlmUnavailable('not_configured')
+        if not self.breaker.allow():
+            self._count('circuit_open')
+            raise LlmUnavailable('circuit_open')
+        try:
+            self._acquire()
+        except LlmUnavailable:
+            self.breaker.cancel()
+            raise
+        self._count('calls')
+
+    def _end(self, ok, latency):
+        self._release()
+        self.breaker.record(ok, latency)
+        with self._condition:
+            self._latencies.append(latency)
+
+    def _failure(self, error):
+        """Counts a failed call and returns the LlmUnavailable to raise for it."""
+        if _is_timeout(error):
+            self._count('timed_out')
+            return LlmUnavailable('timeout', str(error))
+        self._count('failed')
+        return LlmUnavailable('error', str(error))
+
+    def _request(self, system_instruction, history, message):
+        contents = list(history) + [{'role': 'user', 'parts': [{'text': message}]}]
+        return {'model': self.model, 'contents': contents, 'config': {'system_instruction': system_instruction}}
+
+    def generate(self, system_instruction, history, message):
+        """
+        Returns the model's reply to message, given the conversation history.
+        Raises LlmUnavailable if the call is rejected, times out or fails.
+        """
+        self._begin()
+        start = time.monotonic()
+        ok = False
+        try:
+            response = self.client().models.generate_content(**self._request(system_instruction, history, message))
+            _count_tokens(getattr(response, 'usage_metadata', None))
+            text = response.text
+            if not text:
+                raise LlmUnavailable('empty_response')
+            ok = True
+            self._count('succeeded')
+            return text
+        except LlmUnavailable:
+            self._count('failed')
+            raise
+        except Exception as e:
+            raise self._failure(e) from e
+        finally:
+            self._end(ok, time.monotonic() - start)
+
+    def stream(self, system_instruction, history, message):
+        """
+        Yields the model's reply to message in pieces as they are generated.
+        Raises LlmUnavailable if the call is rejected, or if it fails before
+        or during the stream. The HTTP client's timeout only bounds each
+        read, so a stream still running timeout seconds (LLM_TIMEOUT) after
+        the call started is ended here and counted as timed out. The call
+        holds its concurrency slot until the stream ends or the generator is
+        closed. The breaker and the latency percentiles see the time to the
+        first piece, since the length of a long answer says nothing about the
+        model's health.
+        """
+        self._begin()
+        start = time.monotonic()
+        first_piece = None
+        ok = False
+        try:
+            usage = None
+            for chunk in self.client().models.generate_content_stream(
+                    **self._request(system_instruction, history, message)):
+                if time.monotonic() - start > self.timeout:
+                    raise TimeoutError(f"stream still running after {self.timeout:g}s")
+                usage = getattr(chunk, 'usage_metadata', None) or usage
+                text = chunk.text
+                if text:
+                    if first_piece is None:
+                        first_piece = time.monotonic() - start
+                    yield text
+            if first_piece is None:
+                raise LlmUnavailable('empty_response')
+            _count_tokens(usage)
+            ok = True
+            self._count('succeeded')
+        except GeneratorExit:
+            # The caller stopped reading; that says nothing about the model.
+            ok = True
+            raise
+        except LlmUnavailable:
+            self._count('failed')
+            raise
+        except Exception as e:
+            raise self._failure(e) from e
+        finally:
+            self._end(ok, first_piece if first_piece is not None else time.monotonic() - start)
+
+    def stats(self):
+        """Returns counters, admission state, breaker state and latency percentiles in milliseconds."""
+        with self._condition:
+            stats = dict(self._counters)
+            stats.update({'in_flight': self._in_flight, 'waiting': self._waiting})
+            latencies = list(self._latencies)
+        stats.update({
+            'breaker': self.breaker.state,
+            'breaker_opened': self.breaker.opened,
+            'latency_ms_p50': round(_percentile(latencies, 0.50) * 1e3, 1),
+            'latency_ms_p99': round(_percentile(latencies, 0.99) * 1e3, 1),
+        })
+        return stats
+
+
+def _count_tokens(usage):
+    if usage is not None:
+        count('llm_tokens', usage.prompt_token_count or 0, kind='prompt')
+        count('llm_tokens', usage.candidates_token_count or 0, kind='output')
+
+
+def _is_timeout(error):
+    """True for the timeout exceptions raised by httpx (used by genai) or the standard library."""
+    while error is not None:
+        if isinstance(error, TimeoutError) or type(error).__name__.endswith('Timeout') \
+                or type(error).__name__.endswith('TimeoutException'):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
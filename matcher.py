@@ -0,0 +1,125 @@
+# matcher.py
+#
+# Compiled keyword matcher for the keyword-based webhook in app.py.
+#
+# Every keyword, synonym, disease name and first-aid condition is compiled once
+# into a token trie. A message is then resolved in a single left-to-right pass
+# over its tokens, so routing cost depends on the length of the message and
+# not on how many diseases or conditions are in the knowledge files. Matching
+# is done on whole tokens, which means 'hi' no longer matches "this" or "which".
+
+import re
+from collections import namedtuple
+
+# Words are runs of letters/digits, plus the Indic script blocks so that
+# combining vowel signs (e.g. Devanagari matras) stay inside their word.
+TOKEN_RE = re.compile(r"[\w\u0900-\u0dff]+")
+
+# Intent keywords, in the same priority order as the original elif chain.
+INTENT_KEYWORDS = {
+    'greet': ['hi', 'hello', 'hey', 'menu'],
+    'hospital': ['hospital', 'hospitals', 'clinic', 'clinics',
+                 'health center', 'health centre', 'health centers', 'health centres'],
+    'vaccination': ['vaccine', 'vaccines', 'vaccination', 'vaccinations',
+                    'immunization', 'immunisation'],
+    'first_aid': ['first aid', 'firstaid', 'first-aid'],
+    'emergency': ['emergency', 'emergencies', 'emergency contacts', 'ambulance'],
+}
+
+INTENT_PRIORITY = {
+    'greet': 60,
+    'hospital': 50,
+    'vaccination': 40,
+    'first_aid': 30,
+    'emergency': 20,
+    'disease': 10,
+}
+
+Hit = namedtuple('Hit', ['intent', 'entity', 'priority', 'start', 'end'])
+
+_TERMINAL = object()
+
+
+def tokenize(text):
+    """Lower-cases text and splits it into word tokens."""
+    return TOKEN_RE.findall(text.lower())
+
+
+class KeywordMatcher:
+    """A token trie mapping keyword phrases to (intent, entity) pairs."""
+
+    def __init__(self):
+        self._root = {}
+        self._max_depth = 0
+
+    def add(self, phrase, intent, entity=None):
+        """Registers a phrase. Phrases that tokenize to nothing are ignored."""
+        tokens = tokenize(phrase)
+        if not tokens:
+            return
+        node = self._root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        targets = node.setdefault(_TERMINAL, [])
+        if (intent, entity) not in targets:
+            targets.append((intent, entity))
+        self._max_depth = max(self._max_depth, len(tokens))
+
+    def match(self, text):
+        """
+        Returns every keyword hit in text, ranked best first.
+        Hits are ordered by intent priority, then hits carrying an entity,
+        then longer phrases, then earlier position in the message.
+        """
+        tokens = tokenize(text)
+        hits = []
+        for start in range(len(tokens)):
+            node = self._root
+            for end in range(start, min(len(tokens), start + self._max_depth)):
+                node = node.get(tokens[end])
+                if node is None:
+                    break
+                for intent, entity in node.get(_TERMINAL, ()):
+                    hits.append(Hit(intent, entity, INTENT_PRIORITY.get(intent, 0), start, end + 1))
+        hits.sort(key=lambda h: (-h.priority, h.entity is None, h.start - h.end, h.start))
+        return hits
+
+    def resolve(self, text):
+        """
+        Returns the best (intent, entity) pair for text, or (None, None).
+        The entity is taken from the best hit of the winning intent that has one.
+        """
+        hits = self.match(text)
+        if not hits:
+            return None, None
+        intent = hits[0].intent
+        entity = next((h.entity for h in hits if h.intent == intent and h.entity is not None), None)
+        return intent, entity
+
+
+def _condition_aliases(condition):
+    """Yields the full condition name plus its individual nouns ('Minor Cuts and Scrapes' -> 'cuts', 'scrapes')."""
+    yield condition
+    for word in tokenize(condition):
+        if word not in ('minor', 'and', 'or', 'of', 'the'):
+            yield word
+
+
+def build_matcher(diseases_data, first_aid_data):
+    """Compiles a KeywordMatcher from the diseases and first-aid knowledge files."""
+    matcher = KeywordMatcher()
+    for intent, phrases in INTENT_KEYWORDS.items():
+        for phrase in phrases:
+            matcher.add(phrase, intent)
+
+    for condition in first_aid_data.get('first_aid', []):
+        for alias in _condition_aliases(condition['condition']):
+            matcher.add(alias, 'first_aid', condition['condition'])
+
+    for disease in diseases_data.get('disease_symptoms', []):
+        name = disease['disease_name']
+        matcher.add(name, 'disease', name)
+        for synonym in disease.get('synonyms', []):
+            matcher.add(synonym, 'disease', name)
+
+    return matcher
@@ -0,0 +1,265 @@
+# message_dedup.py
+#
+# Idempotent webhook handling for app.py and app1.py, keyed on Twilio's
+# MessageSid.
+#
+# When a reply is slow, Twilio retries the webhook POST with the same
+# MessageSid. Without de-duplication each retry started the same work again,
+# including another model call in app1.py, exactly when the system was
+# already overloaded. Each webhook's TwiML is now recorded against its
+# MessageSid:
+#
+#   - a duplicate that arrives while the original is still being handled
+#     waits for the original's result instead of starting new work;
+#   - a duplicate that arrives after it finished gets the cached TwiML.
+#
+# Results are kept in a bounded in-memory LRU with a TTL. Setting DEDUP_DB
+# also records them in SQLite, so a retry routed to a different gunicorn
+# worker is recognised too. The first worker to insert the MessageSid owns the
+# message, and the others poll for its result. A claim older than
+# DEDUP_CLAIM_TIMEOUT is treated as abandoned (its worker died) and taken over.
+#
+# A handler that could not really handle the message (admission.py's busy and
+# throttle replies) raises Uncached with its reply instead of returning it.
+# That reply is sent but not recorded, so Twilio's retry of the message, once
+# the load has dropped, is handled afresh and gets a real answer.
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEDUP_DB = os.getenv('DEDUP_DB')
+
+# How long a handled MessageSid is remembered, and how many are kept in memory.
+DEDUP_TTL = float(os.getenv('DEDUP_TTL', '900'))
+DEDUP_MAX_ENTRIES = int(os.getenv('DEDUP_MAX_ENTRIES', '10000'))
+
+# How long a duplicate waits for the original's result. Twilio gives up on a
+# webhook after 15 seconds, so waiting longer than that gains nothing.
+DEDUP_WAIT_TIMEOUT = float(os.getenv('DEDUP_WAIT_TIMEOUT', '14'))
+
+# A claim older than this is assumed to belong to a worker that died.
+DEDUP_CLAIM_TIMEOUT = float(os.getenv('DEDUP_CLAIM_TIMEOUT', '60'))
+
+# Returned to a duplicate whose original did not finish in time: an empty reply,
+# so the user is not answered twice.
+EMPTY_TWIML = '<?xml version="1.0" encoding="UTF-8"?><Response />'
+
+# How often a worker polls SQLite for another worker's result.
+POLL_INTERVAL = 0.05
+
+# Expired rows are purged from SQLite once every this many writes.
+PURGE_EVERY = 500
+
+
+class Uncached(Exception):
+    """Raised by a handler to reply with response without recording it for retries of the message."""
+
+    def __init__(self, response):
+        super().__init__('reply not recorded')
+        self.response = response
+
+
+class _InFlight:
+    __slots__ = ('done', 'response')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+
+
+class MessageDeduplicator:
+    """Runs a webhook handler at most once per MessageSid and replays its result for retries."""
+
+    def __init__(self, db_path=DEDUP_DB, ttl=DEDUP_TTL, max_entries=DEDUP_MAX_ENTRIES,
+                 wait_timeout=DEDUP_WAIT_TIMEOUT, claim_timeout=DEDUP_CLAIM_TIMEOUT):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.wait_timeout = wait_timeout
+        self.claim_timeout = claim_timeout
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self._writes = 0
+        self._pid = os.getpid()
+        self._counters = {'handled': 0, 'replayed': 0, 'coalesced': 0, 'timed_out': 0, 'uncached': 0}
+        if db_path:
+            self._connect().execute(
+                'CREATE TABLE IF NOT EXISTS processed_messages ('
+                ' sid TEXT PRIMARY KEY,'
+                ' response TEXT,'
+                ' claimed_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # --- Cache ---
+
+    def _cached(self, sid):
+        entry = self._cache.get(sid)
+        if entry is None:
+            return None
+        expires_at, response = entry
+        if time.time() > expires_at:
+            del self._cache[sid]
+            return None
+        return response
+
+    def _remember(self, sid, response):
+        self._cache[sid] = (time.time() + self.ttl, response)
+        self._cache.move_to_end(sid)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    # --- Shared claims ---
+
+    def _claim(self, sid):
+        """
+        Claims sid in SQLite. Returns (True, None) if this worker should handle
+        the message, or (False, response) with another worker's finished
+        result, or (False, None) if another worker is still handling it.
+        """
+        conn = self._connect()
+        now = time.time()
+        inserted = conn.execute(
+            'INSERT OR IGNORE INTO processed_messages (sid, response, claimed_at) VALUES (?, NULL, ?)', (sid, now)
+        ).rowcount
+        if inserted:
+            return True, None
+        row = conn.execute('SELECT response, claimed_at FROM processed_messages WHERE sid = ?', (sid,)).fetchone()
+        if row is None:
+            return self._claim(sid)
+        response, claimed_at = row
+        if response is not None and now - claimed_at <= self.ttl:
+            return False, response
+        if response is not None or now - claimed_at > self.claim_timeout:
+            # An expired result or an abandoned claim: take it over unless someone else just did.
+            taken = conn.execute(
+                'UPDATE processed_messages SET response = NULL, claimed_at = ? WHERE sid = ? AND claimed_at = ?',
+                (now, sid, claimed_at)
+            ).rowcount
+            if taken:
+                return True, None
+        return False, None
+
+    def _wait_for_worker(self, sid):
+        """Polls SQLite for another worker's result until wait_timeout. Returns None on timeout."""
+        conn = self._connect()
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            row = conn.execute('SELECT response FROM processed_messages WHERE sid = ?', (sid,)).fetchone()
+            if row is None:
+                return None
+            if row[0] is not None:
+                return row[0]
+            time.sleep(POLL_INTERVAL)
+        return None
+
+    def _store(self, sid, response):
+        conn = self._connect()
+        conn.execute('UPDATE processed_messages SET response = ? WHERE sid = ?', (response, sid))
+        self._writes += 1
+        if self._writes % PURGE_EVERY == 0:
+            conn.execute('DELETE FROM processed_messages WHERE claimed_at < ?', (time.time() - self.ttl,))
+
+    def _release(self, sid):
+        self._connect().execute('DELETE FROM processed_messages WHERE sid = ? AND response IS NULL', (sid,))
+
+    def _finish_duplicate(self, sid, response, counter):
+        with self._lock:
+            if response:
+                self._counters[counter] += 1
+                self._remember(sid, response)
+                return response
+            self._counters['timed_out'] += 1
+        return EMPTY_TWIML
+
+    # --- Public API ---
+
+    def handle(self, sid, handler):
+        """
+        Returns handler()'s TwiML for a new MessageSid, or the original's TwiML
+        for a retry. Messages without a MessageSid are always handled.
+        """
+        if not sid:
+            try:
+                return handler()
+            except Uncached as e:
+                return e.response
+
+        with self._lock:
+            if self._pid != os.getpid():
+                # Requests in flight do not survive a fork, so a forked child starts clean.
+                self._pid = os.getpid()
+                self._cache.clear()
+                self._inflight.clear()
+            response = self._cached(sid)
+            if response is not None:
+                self._counters['replayed'] += 1
+                return response
+            pending = self._inflight.get(sid)
+            if pending is None:
+                pending = self._inflight[sid] = _InFlight()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            # Same worker, still in flight: wait for the original request's result.
+            finished = pending.done.wait(self.wait_timeout)
+            return self._finish_duplicate(sid, finished and pending.response, 'coalesced')
+
+        try:
+            if self.db_path:
+                owned, response = self._claim(sid)
+                if not owned:
+                    counter = 'replayed' if response is not None else 'coalesced'
+                    if response is None:
+                        response = self._wait_for_worker(sid)
+                    pending.response = response
+                    return self._finish_duplicate(sid, response, counter)
+
+            try:
+                response = handler()
+            except Uncached as e:
+                # Released, not stored: a retry of this message is handled again.
+                if self.db_path:
+                    self._release(sid)
+                with self._lock:
+                    self._counters['uncached'] += 1
+                return e.response
+            except Exception:
+                if self.db_path:
+                    self._release(sid)
+                raise
+            if self.db_path:
+                self._store(sid, response)
+            pending.response = response
+            with self._lock:
+                self._counters['handled'] += 1
+                self._remember(sid, response)
+            return response
+        finally:
+            with self._lock:
+                self._inflight.pop(sid, None)
+            pending.done.set()
+
+    def stats(self):
+        """Returns counters for handled, replayed, coalesced, timed-out and uncached messages in this process."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['cached'] = len(self._cache)
+            stats['in_flight'] = len(self._inflight)
+            return stats
@@ -0,0 +1,321 @@
+# metrics.py
+#
+# Low-overhead instrumentation shared by app.py, app1.py and the broadcast
+# engine, exported in the Prometheus text format at /metrics.
+#
+# Code records two things:
+#
+#   - stage timings, with `with stage('llm'):`, which go into fixed-bucket
+#     latency histograms (healthbot_stage_seconds{stage="llm"});
+#   - counters, with count('fast_path', result='hit').
+#
+# instrument(app) also times every Flask request by endpoint. While a request
+# runs, its stage timings are collected and returned in a Server-Timing
+# header, so a slow request can be broken down from the client side.
+#
+# Recording only updates in-memory dicts under a lock. Under gunicorn each
+# worker has its own memory, so a background thread in each process writes
+# its totals to METRICS_DIR/metrics-<pid>-<start>.json every
+# METRICS_FLUSH_INTERVAL seconds. /metrics, answered by whichever worker
+# gets the scrape, flushes its own totals and sums every file. Totals from
+# workers that have exited are folded into metrics-archive.json, so counters
+# never go backwards when a worker is replaced. Deleting METRICS_DIR before
+# starting the server resets everything.
+
+import bisect
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+
+METRICS_DIR = os.getenv('METRICS_DIR', 'metrics')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+# Histogram bucket upper bounds, in seconds, from a dictionary lookup up to a slow model call.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PREFIX = 'healthbot_'
+
+ARCHIVE_FILE = 'metrics-archive.json'
+
+
+def _empty():
+    return {'counters': {}, 'histograms': {}}
+
+
+def _merge(into, data):
+    """Adds the counters and histograms of data (in file form) to into."""
+    for key, value in data['counters'].items():
+        into['counters'][key] = into['counters'].get(key, 0) + value
+    for key, (counts, total) in data['histograms'].items():
+        current = into['histograms'].get(key)
+        if current is None:
+            into['histograms'][key] = [list(counts), total]
+        else:
+            current[0] = [a + b for a, b in zip(current[0], counts)]
+            current[1] += total
+
+
+def _series_key(key):
+    """Encodes a (name, labels) key as one string for the metrics files, e.g. 'stage_seconds|stage=llm'."""
+    name, labels = key
+    return "|".join([name] + [f"{k}={v}" for k, v in labels])
+
+
+def _parse_series_key(key):
+    name, *pairs = key.split("|")
+    return name, [pair.split("=", 1) for pair in pairs]
+
+
+class Registry:
+    """This process's counters and histograms, plus the files that share them with other workers."""
+
+    def __init__(self, directory=METRICS_DIR, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._reset()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # The lock may have been held by the parent's flusher at the moment of the fork.
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._counters = {}
+        self._histograms = {}
+        self._path = os.path.join(self.directory, f"metrics-{self._pid}-{int(time.time() * 1000)}.json")
+        self._flusher = None
+
+    def _check_fork(self):
+        # Totals recorded before a fork belong to the parent; the child starts from zero.
+        if self._pid != os.getpid():
+            self._reset()
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+            self._flusher.start()
+
+    # --- Recording ---
+
+    def count(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._check_fork()
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        self._observe((name, tuple(sorted(labels.items()))), seconds)
+
+    def _observe(self, key, seconds):
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self._check_fork()
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0]
+            histogram[0][index] += 1
+            histogram[1] += seconds
+
+    def stage(self, name):
+        """Returns a context manager timing the enclosed block as a stage of the current request."""
+        return _Stage(self, name)
+
+    def begin_request(self):
+        self._local.timings = []
+
+    def end_request(self):
+        timings, self._local.timings = getattr(self._local, 'timings', None) or [], None
+        return timings
+
+    # --- Sharing between workers ---
+
+    def _snapshot(self):
+        with self._lock:
+            return {'counters': {_series_key(k): v for k, v in self._counters.items()},
+                    'histograms': {_series_key(k): [list(c), s] for k, (c, s) in self._histograms.items()}}
+
+    def flush(self):
+        """Writes this process's totals to its file in METRICS_DIR."""
+        if self._pid != os.getpid():
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{self._path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self._snapshot(), f)
+        os.replace(tmp, self._path)
+
+    def _flush_loop(self):
+        while self._pid == os.getpid():
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Could not write metrics: {e}")
+
+    def _collect(self):
+        """Sums the totals of every worker, archiving the files of workers that have exited."""
+        os.makedirs(self.directory, exist_ok=True)
+        totals = _empty()
+        archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive = _load(archive_path) or _empty()
+            archived = False
+            for path in glob.glob(os.path.join(self.directory, 'metrics-*-*.json')):
+                data = _load(path)
+                if data is None:
+                    continue
+                pid = int(os.path.basename(path).split('-')[1])
+                if _alive(pid):
+                    _merge(totals, data)
+                else:
+                    _merge(archive, data)
+                    os.remove(path)
+                    archived = True
+            if archived:
+                tmp = f"{archive_path}.tmp"
+                with open(tmp, 'w') as f:
+                    json.dump(archive, f)
+                os.replace(tmp, archive_path)
+        _merge(totals, archive)
+        return totals
+
+    def render(self):
+        """Returns the totals of all workers in the Prometheus text exposition format."""
+        self.flush()
+        totals = self._collect()
+        lines = []
+        for name, series in _group(totals['counters']).items():
+            lines.append(f"# TYPE {PREFIX}{name}_total counter")
+            for labels, value in series:
+                lines.append(f"{PREFIX}{name}_total{_labels(labels)} {_number(value)}")
+        for name, series in _group(totals['histograms']).items():
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for labels, (counts, total) in series:
+                cumulative = 0
+                for bound, n in zip(BUCKETS + ('+Inf',), counts):
+                    cumulative += n
+                    lines.append(f"{PREFIX}{name}_bucket{_labels(labels + [['le', str(bound)]])} {cumulative}")
+                lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {_number(total)}")
+                lines.append(f"{PREFIX}{name}_count{_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+class _Stage:
+    """A stage timer. A plain class rather than @contextmanager, which costs several times more per use."""
+
+    __slots__ = ('registry', 'name', 'start')
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        registry = self.registry
+        registry._observe(('stage_seconds', (('stage', self.name),)), elapsed)
+        timings = getattr(registry._local, 'timings', None)
+        if timings is not None:
+            timings.append((self.name, elapsed))
+        return False
+
+
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _group(series):
+    grouped = {}
+    for key in sorted(series):
+        name, labels = _parse_series_key(key)
+        grouped.setdefault(name, []).append((labels, series[key]))
+    return grouped
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    escaped = (k + '="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+               for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# --- Process-wide registry ---
+
+REGISTRY = Registry()
+
+
+def count(name, amount=1, **labels):
+    """Adds amount to the counter healthbot_<name>_total with the given labels."""
+    REGISTRY.count(name, amount, **labels)
+
+
+def observe(name, seconds, **labels):
+    """Records seconds in the histogram healthbot_<name>."""
+    REGISTRY.observe(name, seconds, **labels)
+
+
+def stage(name):
+    """Context manager timing a stage into healthbot_stage_seconds{stage=name}."""
+    return REGISTRY.stage(name)
+
+
+def instrument(app):
+    """
+    Times every request of a Flask app by endpoint, adds a Server-Timing
+    header with its stages, and serves the totals of all workers at /metrics.
+    """
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+        REGISTRY.begin_request()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('metrics_start', None)
+        timings = REGISTRY.end_request()
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        endpoint = request.endpoint or 'unknown'
+        REGISTRY.observe('request_seconds', elapsed, endpoint=endpoint)
+        REGISTRY.count('requests', endpoint=endpoint, status=response.status_code)
+        response.headers['Server-Timing'] = ", ".join(
+            [f"{name};dur={seconds * 1e3:.2f}" for name, seconds in timings] + [f"total;dur={elapsed * 1e3:.2f}"]
+        )
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+    return app
@@ -0,0 +1,92 @@
+# reply_chunker.py
+#
+# Splits model answers into WhatsApp-sized messages for app1.py.
+#
+# In REPLY_MODE=stream the model's answer is read as it is generated and
+# sent to the user in parts, instead of after the whole completion. The
+# chunker collects the streamed text and cuts it at paragraph breaks, line
+# breaks or sentence ends, including the danda used in Hindi and Odia:
+#
+#   - the first message goes out at the first boundary after
+#     STREAM_FIRST_CHARS characters, so the user sees the start of the answer
+#     quickly;
+#   - later messages go out at the first boundary after STREAM_CHUNK_CHARS,
+#     so a long answer arrives as a few messages rather than one per sentence.
+#
+# Twilio rejects WhatsApp bodies over 1600 characters, so no message is
+# longer than that. Text without a boundary in reach is cut at the last
+# boundary or space that fits. split_message() applies the same rules to a
+# complete answer, such as a cached one.
+
+import os
+import re
+
+WHATSAPP_MAX_CHARS = 1600
+STREAM_FIRST_CHARS = int(os.getenv('STREAM_FIRST_CHARS', '160'))
+STREAM_CHUNK_CHARS = int(os.getenv('STREAM_CHUNK_CHARS', '700'))
+
+# A paragraph break, a line break, or a sentence end followed by whitespace
+# (so "3.5" and "e.g" mid-stream are not cut before the next piece arrives).
+BOUNDARY = re.compile(r'\n\s*\n|\n|[.!?।](?=\s)')
+
+
+class ReplyChunker:
+    """Turns a stream of text pieces into complete messages."""
+
+    def __init__(self, first_chars=STREAM_FIRST_CHARS, chunk_chars=STREAM_CHUNK_CHARS, max_chars=WHATSAPP_MAX_CHARS):
+        self.first_chars = first_chars
+        self.chunk_chars = chunk_chars
+        self.max_chars = max_chars
+        self.buffer = ''
+        self.emitted = 0
+
+    def feed(self, text):
+        """Adds a streamed piece and returns the messages that are now complete."""
+        self.buffer += text
+        messages = []
+        while True:
+            cut = self._cut()
+            if cut is None:
+                return messages
+            self._emit(cut, messages)
+
+    def finish(self):
+        """Returns the remaining messages at the end of the stream."""
+        messages = []
+        while len(self.buffer) > self.max_chars:
+            self._emit(self._cut(), messages)
+        self._emit(len(self.buffer), messages)
+        return messages
+
+    def _cut(self):
+        """The position to cut the buffer at, or None to wait for more text."""
+        buffer = self.buffer
+        target = self.chunk_chars if self.emitted else self.first_chars
+        if target < len(buffer):
+            match = BOUNDARY.search(buffer, target)
+            if match is not None and match.end() <= self.max_chars:
+                return match.end()
+        if len(buffer) <= self.max_chars:
+            return None
+        # Too long, with no boundary past the target that fits: take the last one that does.
+        window = buffer[:self.max_chars]
+        last = None
+        for last in BOUNDARY.finditer(window):
+            pass
+        if last is not None:
+            return last.end()
+        space = window.rfind(' ')
+        return space if space > 0 else self.max_chars
+
+    def _emit(self, cut, messages):
+        message = self.buffer[:cut].strip()
+        self.buffer = self.buffer[cut:].lstrip()
+        if message:
+            messages.append(message)
+            self.emitted += 1
+
+
+def split_message(text, max_chars=WHATSAPP_MAX_CHARS):
+    """Splits a complete answer into as few messages of at most max_chars as possible."""
+    chunker = ReplyChunker(max_chars, max_chars, max_chars)
+    return chunker.feed(text) + chunker.finish()
@@ -0,0 +1,132 @@
+# reply_queue.py
+#
+# Asynchronous reply queue for the Gemini webhook in app1.py.
+#
+# In async mode the webhook acknowledges Twilio with empty TwiML straight away
+# and hands the model call to this queue. A bounded pool of worker threads
+# generates the answer and delivers it through the Twilio REST messages API,
+# so the webhook's latency no longer depends on the model's.
+#
+# Jobs are queued per key (the sender's number). At most one job per key runs
+# at a time and jobs for a key run in the order they were submitted, so a
+# user's replies (and their conversation history) never overtake each other.
+# Ordering holds within one process; Twilio routes a sender to whichever
+# gunicorn worker accepts the request.
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+REPLY_WORKERS = int(os.getenv('REPLY_WORKERS', '8'))
+REPLY_MAX_PENDING = int(os.getenv('REPLY_MAX_PENDING', '500'))
+
+# How many recent wait/run times are kept for percentile metrics.
+SAMPLE_WINDOW = 1000
+
+
+def _percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class KeyedReplyQueue:
+    """A bounded worker pool that runs jobs in order per key."""
+
+    def __init__(self, workers=REPLY_WORKERS, max_pending=REPLY_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._queues = {}
+        self._pending = 0
+        self._running = 0
+        self._counters = {'submitted': 0, 'rejected': 0, 'completed': 0, 'failed': 0}
+        self._waits = deque(maxlen=SAMPLE_WINDOW)
+        self._runs = deque(maxlen=SAMPLE_WINDOW)
+
+    def _pool(self):
+        # Threads do not survive a fork, so each process builds its own pool.
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='reply')
+            self._pid = os.getpid()
+            self._queues = {}
+            self._pending = 0
+            self._running = 0
+        return self._executor
+
+    def submit(self, key, fn, *args):
+        """
+        Queues fn(*args) behind any earlier jobs for key.
+        Returns False without queueing when the queue is full.
+        """
+        with self._lock:
+            pool = self._pool()
+            if self._pending >= self.max_pending:
+                self._counters['rejected'] += 1
+                return False
+            self._pending += 1
+            self._counters['submitted'] += 1
+            queue = self._queues.get(key)
+            if queue is not None:
+                # A job for this key is already scheduled; it will pick this one up.
+                queue.append((time.monotonic(), fn, args))
+                return True
+            self._queues[key] = deque([(time.monotonic(), fn, args)])
+        pool.submit(self._run_next, key)
+        return True
+
+    def has_pending(self, key):
+        """True if a job for key is queued or running in this process."""
+        with self._lock:
+            return key in self._queues and self._pid == os.getpid()
+
+    def _run_next(self, key):
+        with self._lock:
+            enqueued_at, fn, args = self._queues[key].popleft()
+            self._pending -= 1
+            self._running += 1
+            started = time.monotonic()
+            self._waits.append(started - enqueued_at)
+        try:
+            fn(*args)
+            outcome = 'completed'
+        except Exception as e:
+            print(f"Async reply for {key} failed: {e}")
+            outcome = 'failed'
+        with self._lock:
+            self._running -= 1
+            self._counters[outcome] += 1
+            self._runs.append(time.monotonic() - started)
+            if self._queues[key]:
+                more = True
+            else:
+                del self._queues[key]
+                more = False
+        if more:
+            # Re-submit rather than loop, so one chatty sender cannot hold a worker.
+            self._executor.submit(self._run_next, key)
+
+    def stats(self):
+        """Returns queue depth, counters, and wait/run time percentiles in milliseconds."""
+        with self._lock:
+            waits = list(self._waits)
+            runs = list(self._runs)
+            stats = dict(self._counters)
+            stats.update({
+                'queue_depth': self._pending,
+                'running': self._running,
+                'active_senders': len(self._queues),
+            })
+        stats.update({
+            'wait_ms_p50': round(_percentile(waits, 0.50) * 1e3, 2),
+            'wait_ms_p99': round(_percentile(waits, 0.99) * 1e3, 2),
+            'wait_ms_max': round(max(waits, default=0.0) * 1e3, 2),
+            'run_ms_p50': round(_percentile(runs, 0.50) * 1e3, 2),
+            'run_ms_p99': round(_percentile(runs, 0.99) * 1e3, 2),
+        })
+        return stats
@@ -0,0 +1,158 @@
+# responses.py
+#
+# Precomputed reply table for the keyword-based webhook in app.py.
+#
+# Every canned reply is fully determined by diseases.json, vaccination.json and
+# basic-first-aid-emergency.json, so the replies are rendered once into an
+# immutable lookup table together with the keyword matcher built from the same
+# data. The data is read from the shared knowledge snapshot
+# (knowledge_snapshot.py). A background watcher polls the snapshot store and,
+# when a new version appears, builds a fresh table and swaps it in with a
+# single reference assignment. Requests always see either the old or the new
+# table, never a half-built one, and content editors can update the data
+# without restarting the gunicorn workers.
+
+import os
+from types import MappingProxyType
+
+from disease_index import build_disease_index, disease_key
+from knowledge_snapshot import DerivedStore
+from matcher import build_matcher
+from symptom_ranker import MIN_SYMPTOMS, SymptomRanker, load_symptom_profiles
+
+# How often (in seconds) the watcher checks for a new snapshot version.
+RELOAD_INTERVAL = float(os.getenv('RESPONSES_RELOAD_INTERVAL', '2'))
+
+HOSPITAL_MESSAGE = (
+    "To find a hospital or health center near you, open this link on your phone:\n\n"
+    "https://www.google.com/maps/search/?api=1&query=hospital+near+me"
+)
+
+FALLBACK_MESSAGE = "I'm sorry, I don't understand. Say 'hi' for the main menu. You can also ask for 'nearby hospitals'."
+
+# --- Renderers ---
+
+def render_welcome():
+    """Generates the welcome message text with the menu."""
+    return "\n".join([
+        "Welcome to the Health Chatbot!",
+        "You can ask me about:",
+        "- A specific disease (e.g., 'malaria')",
+        "- Vaccination information",
+        "- First aid for a condition",
+        "- Emergency contacts",
+        "- Nearby hospitals or clinics",
+    ])
+
+def render_vaccination(vaccination_data):
+    lines = ["Here is the vaccination information:", ""]
+    for vaccine in vaccination_data['vaccination_schedule']:
+        lines.append(f"*Vaccine:* {vaccine['vaccine_name']}")
+        lines.append(f"*Prevents:* {vaccine['disease_prevented']}")
+        lines.append(f"*Schedule:* {vaccine['schedule']}")
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+def render_first_aid_menu(first_aid_data):
+    lines = ["What first aid information do you need?"]
+    lines.extend(f"- {condition['condition']}" for condition in first_aid_data['first_aid'])
+    return "\n".join(lines) + "\n"
+
+def render_first_aid(condition):
+    lines = [f"First aid for {condition['condition']}:"]
+    lines.extend(f"- {step}" for step in condition['steps'])
+    text = "\n".join(lines) + "\n"
+    if 'warning' in condition:
+        text += f"\n*Warning:* {condition['warning']}"
+    return text
+
+def render_emergency(first_aid_data):
+    lines = ["*Emergency Contacts:*"]
+    lines.extend(f"- {contact['service']}: {contact['number']}" for contact in first_aid_data['emergency_contacts'])
+    return "\n".join(lines) + "\n"
+
+def render_disease(disease):
+    lines = [f"*About {disease['disease_name']}:*", "", "*Common Symptoms:*"]
+    lines.extend(f"- {symptom}" for symptom in disease['common_symptoms'])
+    lines.extend(["", "*Prevention Methods:*"])
+    for category in disease['prevention_methods']:
+        lines.append(f"  *{category['category']}:*")
+        lines.extend(f"  - {method}" for method in category['methods'])
+    return "\n".join(lines) + "\n"
+
+def render_symptom_matches(candidates):
+    lines = ["*Conditions that match your symptoms:*"]
+    lines.extend(f"- {c.name} ({', '.join(c.matched)})" for c in candidates)
+    lines.extend(["", "This is not a diagnosis. Please see a doctor, or say 'emergency' for emergency contacts."])
+    return "\n".join(lines) + "\n"
+
+# --- Reply Table ---
+
+class ResponseTable:
+    """An immutable snapshot of every canned reply plus the matcher that routes to them."""
+
+    def __init__(self, diseases_data, first_aid_data, vaccination_data):
+        replies = {
+            ('greet', None): render_welcome(),
+            ('hospital', None): HOSPITAL_MESSAGE,
+            ('vaccination', None): render_vaccination(vaccination_data),
+            ('first_aid', None): render_first_aid_menu(first_aid_data),
+            ('emergency', None): render_emergency(first_aid_data),
+            (None, None): FALLBACK_MESSAGE,
+        }
+        for condition in first_aid_data['first_aid']:
+            replies[('first_aid', condition['condition'])] = render_first_aid(condition)
+        for disease in diseases_data['disease_symptoms']:
+            replies[('disease', disease['disease_name'])] = render_disease(disease)
+
+        self.replies = MappingProxyType(replies)
+        self.matcher = build_matcher(diseases_data, first_aid_data)
+
+        # Misspelled or transliterated disease names are resolved through the fuzzy index.
+        names = [disease['disease_name'] for disease in diseases_data['disease_symptoms']]
+        self.disease_names = {disease_key(name): name for name in names}
+        self.disease_index = build_disease_index(names)
+        for disease in diseases_data['disease_symptoms']:
+            for synonym in disease.get('synonyms', []):
+                self.disease_index.add(synonym, disease_key(disease['disease_name']))
+
+        self.symptoms = SymptomRanker(load_symptom_profiles(diseases_data))
+
+    def reply(self, intent, entity=None):
+        """Returns the reply for (intent, entity), falling back to the intent's generic reply."""
+        text = self.replies.get((intent, entity))
+        if text is None:
+            text = self.replies.get((intent, None), self.replies[(None, None)])
+        return text
+
+    def respond(self, message):
+        """Routes a message and returns its reply."""
+        intent, entity = self.matcher.resolve(message)
+        if intent is None:
+            for match in self.disease_index.find(message):
+                if match.key in self.disease_names:
+                    intent, entity = 'disease', self.disease_names[match.key]
+                    break
+        if intent is None:
+            # Lists of symptoms ("fever, joint pain and rash") get the best-matching diseases.
+            candidates = self.symptoms.rank(message, k=3, min_symptoms=MIN_SYMPTOMS)
+            if candidates:
+                return render_symptom_matches(candidates)
+        return self.reply(intent, entity)
+
+
+def build_response_table(snapshot):
+    """Builds the ResponseTable for a knowledge snapshot."""
+    return ResponseTable(snapshot['diseases'], snapshot['first_aid'], snapshot['vaccination'])
+
+
+class ResponseStore(DerivedStore):
+    """
+    Holds the current ResponseTable and rebuilds it when the knowledge
+    snapshot changes version (see knowledge_snapshot.DerivedStore). The
+    watcher thread is started lazily in each process, so it also runs in
+    gunicorn workers forked after the store was created.
+    """
+
+    def __init__(self, snapshots=None, interval=RELOAD_INTERVAL):
+        super().__init__(build_response_table, name='response table', snapshots=snapshots, interval=interval)
@@ -0,0 +1,196 @@
+# retrieval.py
+#
+# Retrieval layer for the Gemini chatbot in app1.py.
+#
+# Instead of serialising all of finalData.json into every system instruction,
+# the data is split into small chunks (one per disease, section and language,
+# one per vaccine, first-aid condition, and so on) and indexed with BM25. Each
+# prompt then carries only the top-k chunks relevant to the user's message.
+#
+# Scoring is vectorised with NumPy: the document-side part of the BM25 weight
+# is precomputed for every (term, chunk) posting at build time, so answering a
+# query is a handful of array scatter-adds, one per query term.
+
+import json
+import math
+import os
+from collections import Counter, defaultdict, namedtuple
+
+import numpy as np
+
+from matcher import tokenize
+
+# Resolved from this file, so the aliases load whatever the working directory is.
+ALIASES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'disease_aliases.json')
+
+LANGUAGES = ('en', 'hi', 'or')
+
+# Words that name a language in a request like "symptoms of dengue in hindi".
+LANGUAGE_WORDS = {
+    'english': 'en',
+    'hindi': 'hi',
+    'odia': 'or',
+    'oriya': 'or',
+}
+
+# Extra words indexed with each section so that common phrasings find it.
+SECTION_ALIASES = {
+    'symptoms': 'symptoms signs symptom feel लक्षण ଲକ୍ଷଣ',
+    'preventions': 'prevention prevent avoid protect precautions बचाव रोकथाम ବଚାଉ ପ୍ରତିରୋଧ',
+    'general_instructions': 'advice instruction',
+    'vaccinations': 'vaccine vaccination schedule immunization टीका टीकाकरण ଟୀକା ଟୀକାକରଣ',
+    'first_aid': 'first aid',
+    'emergency_contacts': 'emergency contact number helpline ambulance',
+    'health_advisories': 'advisory advice',
+}
+
+STOPWORDS = frozenset(
+    'a an and are about as at be can do does for from how i in is it me my of on or '
+    'please tell the to what when which who why with you your'.split()
+)
+
+Chunk = namedtuple('Chunk', ['id', 'topic', 'section', 'language', 'text'])
+
+
+def detect_language(text):
+    """Returns 'hi', 'or' or 'en' from an explicit language name or the script of the text."""
+    for token in tokenize(text):
+        if token in LANGUAGE_WORDS:
+            return LANGUAGE_WORDS[token]
+    for char in text:
+        if '\u0900' <= char <= '\u097f':
+            return 'hi'
+        if '\u0b00' <= char <= '\u0b7f':
+            return 'or'
+    return 'en'
+
+
+def _title(key):
+    return key.replace('_', ' ').title()
+
+
+def _bullets(items):
+    return "\n".join(f"- {item}" for item in items)
+
+
+def chunk_health_data(health_data):
+    """Splits finalData.json into one Chunk per topic, section and language."""
+    chunks = []
+
+    def add(topic, section, language, body):
+        chunk_id = f"{section}/{topic}/{language}"
+        chunks.append(Chunk(chunk_id, topic, section, language, body))
+
+    for key, texts in health_data.get('general_instructions', {}).items():
+        for language, text in texts.items():
+            add(key, 'general_instructions', language, f"General instruction ({_title(key)}, {language}): {text}")
+
+    for disease, sections in health_data.get('diseases', {}).items():
+        for section, by_language in sections.items():
+            for language, items in by_language.items():
+                add(disease, section, language,
+                    f"{_title(disease)} - {section} ({language}):\n{_bullets(items)}")
+
+    for vaccine in health_data.get('vaccinations', {}).get('schedule', []):
+        for language in vaccine['vaccine_name']:
+            add(vaccine['vaccine_name']['en'], 'vaccinations', language,
+                f"Vaccine ({language}): {vaccine['vaccine_name'][language]}. "
+                f"Prevents: {vaccine['disease_prevented'].get(language, '')}. "
+                f"Schedule: {vaccine['schedule'].get(language, '')}")
+
+    other = health_data.get('other_health_info', {})
+    for key, condition in other.get('first_aid', {}).items():
+        for language, name in condition['condition'].items():
+            text = f"First aid for {name} ({language}):\n{_bullets(condition['steps'].get(language, []))}"
+            if 'warning' in condition:
+                text += f"\nWarning: {condition['warning'].get(language, '')}"
+            add(key, 'first_aid', language, text)
+
+    contacts = other.get('emergency_contacts', [])
+    for language in LANGUAGES:
+        lines = [f"{c['service'].get(language, c['service'].get('en'))}: {c['number']}" for c in contacts]
+        if lines:
+            add('emergency_contacts', 'emergency_contacts', language,
+                f"Emergency contacts ({language}):\n{_bullets(lines)}")
+
+    for key, advisory in other.get('health_advisories', {}).items():
+        for language, title in advisory.get('advisory_title', {}).items():
+            text = f"Health advisory ({language}): {title}\n{advisory.get('advisory_details', {}).get(language, '')}"
+            recommendations = advisory.get('key_recommendations', {}).get(language)
+            if recommendations:
+                text += "\n" + _bullets(recommendations)
+            add(key, 'health_advisories', language, text)
+
+    return chunks
+
+
+def load_topic_aliases(path=ALIASES_FILE):
+    """Reads disease_aliases.json (topic key -> alternative and native names), or {} if it is missing."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _index_terms(chunk, topic_aliases):
+    """
+    Tokens indexed for a chunk: its text plus topic and section aliases, so a
+    question in any script or spelling can find any language's chunk.
+    """
+    aliases = " ".join(topic_aliases.get(chunk.topic, ()))
+    header = f"{chunk.topic.replace('_', ' ')} {aliases} {SECTION_ALIASES.get(chunk.section, '')}"
+    return [t for t in tokenize(header + " " + chunk.text) if t not in STOPWORDS]
+
+
+class Bm25Index:
+    """A BM25 index over chunks with vectorised scoring."""
+
+    def __init__(self, chunks, topic_aliases=None, k1=1.5, b=0.75):
+        self.chunks = list(chunks)
+        self.languages = np.array([c.language for c in self.chunks])
+
+        topic_aliases = load_topic_aliases() if topic_aliases is None else topic_aliases
+        doc_terms = [Counter(_index_terms(c, topic_aliases)) for c in self.chunks]
+        lengths = np.array([sum(tf.values()) for tf in doc_terms], dtype=np.float64)
+        avg_length = lengths.mean() if len(lengths) else 1.0
+
+        postings = defaultdict(lambda: ([], []))
+        for doc, tf in enumerate(doc_terms):
+            for term, count in tf.items():
+                docs, weights = postings[term]
+                docs.append(doc)
+                norm = k1 * (1 - b + b * lengths[doc] / avg_length)
+                weights.append(count * (k1 + 1) / (count + norm))
+
+        n_docs = len(self.chunks)
+        self._postings = {}
+        for term, (docs, weights) in postings.items():
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            self._postings[term] = (np.array(docs, dtype=np.int32), np.array(weights) * idf)
+
+    def search(self, query, k=4, language=None):
+        """
+        Returns up to k (chunk, score) pairs for query, best first. With a
+        language, only chunks in that language are returned.
+        """
+        scores = np.zeros(len(self.chunks))
+        for term in set(tokenize(query)) - STOPWORDS:
+            posting = self._postings.get(term)
+            if posting is not None:
+                np.add.at(scores, posting[0], posting[1])
+        if language is not None:
+            scores[self.languages != language] = 0.0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k)[:k]]
+        ranked = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(self.chunks[i], float(scores[i])) for i in ranked]
+
+
+def render_context(results):
+    """Formats search results as the dataset section of a system prompt."""
+    if not results:
+        return "(No entries in the trusted dataset matched this question.)"
+    return "\n\n".join(chunk.text for chunk, _ in results)
@@ -0,0 +1,170 @@
+# subscribers.py
+#
+# Indexed, concurrency-safe subscriber store shared by app.py, app1.py and
+# broadcast.py.
+#
+# Subscribers live in a SQLite database in WAL mode instead of a JSON list that
+# was re-read and re-written on every inbound message. Membership checks hit an
+# in-process set first and the primary-key index second, inserts are atomic
+# across gunicorn workers, and broadcasts iterate the table in keyset-paginated
+# batches instead of loading every number into memory. The first process to
+# open the database imports the legacy broadcast_subscribers.json once.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import stage
+
+SUBSCRIBERS_DB = os.getenv('SUBSCRIBERS_DB', 'subscribers.db')
+SUBSCRIBERS_FILE = 'broadcast_subscribers.json'
+
+# Number of rows fetched per query when streaming subscribers.
+ITER_BATCH_SIZE = 1000
+
+
+class SubscriberStore:
+    """A SQLite-backed set of subscriber numbers."""
+
+    def __init__(self, path=SUBSCRIBERS_DB, legacy_file=SUBSCRIBERS_FILE):
+        self.path = path
+        self.legacy_file = legacy_file
+        self._local = threading.local()
+        self._known = set()
+        self._pid = os.getpid()
+        self._setup()
+
+    def _connect(self):
+        """Returns this thread's connection, opening a new one after a fork."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        if self._pid != os.getpid():
+            # The in-process cache is only a hint, so a forked child starts clean.
+            self._pid = os.getpid()
+            self._known = set()
+        return conn
+
+    def _setup(self):
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS subscribers ('
+            ' number TEXT PRIMARY KEY,'
+            ' created_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self._migrate_legacy_file(conn)
+
+    def _migrate_legacy_file(self, conn):
+        """Imports the old JSON subscriber list exactly once, even with several workers starting together."""
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            done = conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_json_migrated'").fetchone()
+            if not done:
+                numbers = []
+                if self.legacy_file and os.path.exists(self.legacy_file):
+                    try:
+                        with open(self.legacy_file, 'r') as f:
+                            numbers = json.load(f)
+                    except json.JSONDecodeError as e:
+                        print(f"Could not migrate {self.legacy_file}: {e}")
+                now = time.time()
+                conn.executemany(
+                    'INSERT OR IGNORE INTO subscribers (number, created_at) VALUES (?, ?)',
+                    ((number, now) for number in numbers if number)
+                )
+                conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('legacy_json_migrated', ?)",
+                    (str(len(numbers)),)
+                )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def add(self, number):
+        """
+        Adds a subscriber, avoiding duplicates.
+        Returns True if the subscriber is new, False otherwise.
+        """
+        conn = self._connect()
+        if number in self._known:
+            return False
+        # Check with a plain read first so repeat senders never take the write lock.
+        if conn.execute('SELECT 1 FROM subscribers WHERE number = ?', (number,)).fetchone():
+            self._known.add(number)
+            return False
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO subscribers (number, created_at) VALUES (?, ?)',
+            (number, time.time())
+        )
+        self._known.add(number)
+        return cursor.rowcount == 1
+
+    def __contains__(self, number):
+        if number in self._known:
+            return True
+        row = self._connect().execute('SELECT 1 FROM subscribers WHERE number = ?', (number,)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM subscribers').fetchone()[0]
+
+    def __iter__(self):
+        """Streams subscriber numbers in insertion order, one batch at a time."""
+        conn = self._connect()
+        last_rowid = 0
+        while True:
+            rows = conn.execute(
+                'SELECT rowid, number FROM subscribers WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                (last_rowid, ITER_BATCH_SIZE)
+            ).fetchall()
+            if not rows:
+                return
+            for rowid, number in rows:
+                yield number
+            last_rowid = rows[-1][0]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Returns the process-wide SubscriberStore, creating it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SubscriberStore()
+    return _store
+
+
+def get_subscribers():
+    """Returns the list of subscribers. Prefer iter_subscribers() for large lists."""
+    return list(get_store())
+
+
+def iter_subscribers():
+    """Streams subscriber numbers without loading them all into memory."""
+    return iter(get_store())
+
+
+def count_subscribers():
+    """Returns the number of subscribers."""
+    return len(get_store())
+
+
+def add_subscriber(number):
+    """
+    Adds a new subscriber, avoiding duplicates.
+    Returns True if the subscriber is new, False otherwise.
+    """
+    with stage('add_subscriber'):
+        return get_store().add(number)
@@ -0,0 +1,198 @@
+# symptom_ranker.py
+#
+# Local symptom-to-disease ranking for both webhooks.
+#
+# The symptom lists in diseases.json and finalData.json (every language) are
+# normalised into a vocabulary of symptom terms: single words with a light
+# plural strip, common lay synonyms folded onto one term ("temperature",
+# "bukhar" -> "fever"), and adjacent word pairs so that "joint pain" counts for
+# more than "pain". The knowledge base becomes a sparse disease x term matrix,
+# stored column-wise as one array of disease rows per term.
+#
+# A message is ranked with a single vectorised pass: the postings of the
+# message's terms are concatenated and summed per disease with np.bincount,
+# weighted by IDF and normalised by each disease's symptom-vector length
+# (cosine similarity). The cost depends on how many diseases share the
+# message's terms, not on the size of the knowledge base.
+#
+# How many symptoms a message names is counted in phrases, not words: two
+# adjacent words that form a known pair ("chest pain", "night sweats") are
+# one symptom, so a single symptom is not mistaken for a list of two.
+
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from disease_index import disease_key
+from matcher import tokenize
+from retrieval import STOPWORDS
+
+# Candidates returned by /rank-symptoms by default, and at most.
+DEFAULT_CANDIDATES = 5
+MAX_CANDIDATES = 20
+
+# Fewest distinct symptom phrases for a message to be treated as a list of symptoms.
+MIN_SYMPTOMS = 2
+
+# Words in the symptom descriptions that say nothing about the symptom itself.
+SYMPTOM_STOPWORDS = STOPWORDS | frozenset(
+    'also by can especially even has have often or other some such than that there these this '
+    'usually very which while lasting weeks week days sudden suddenly mild severe'.split()
+)
+
+# Lay and romanised words folded onto the term used in the knowledge base.
+SYMPTOM_SYNONYMS = {
+    'temperature': 'fever',
+    'feverish': 'fever',
+    'bukhar': 'fever',
+    'tired': 'fatigue',
+    'tiredness': 'fatigue',
+    'weakness': 'fatigue',
+    'exhaustion': 'fatigue',
+    'throwing': 'vomiting',
+    'vomit': 'vomiting',
+    'puking': 'vomiting',
+    'rashes': 'rash',
+    'loose': 'diarrhoea',
+    'diarrhea': 'diarrhoea',
+    'breathless': 'breath',
+    'breathlessness': 'breath',
+    'coughing': 'cough',
+    'khansi': 'cough',
+    'sweating': 'sweat',
+    'shivering': 'chill',
+    'headaches': 'headache',
+    'sardard': 'headache',
+}
+
+Candidate = namedtuple('Candidate', ['disease', 'name', 'score', 'matched'])
+
+
+def _normalize_word(word):
+    word = SYMPTOM_SYNONYMS.get(word, word)
+    if word.isascii() and len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        word = word[:-1]
+    return SYMPTOM_SYNONYMS.get(word, word)
+
+
+def symptom_terms(text):
+    """Normalised symptom words of text plus each pair of adjacent ones ('joint pain')."""
+    words = [_normalize_word(t) for t in tokenize(text) if t not in SYMPTOM_STOPWORDS and not t.isdigit()]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def candidate_count(value):
+    """Parses a requested number of candidates (?k=), falling back to the default and clamping it to 1..MAX_CANDIDATES."""
+    try:
+        k = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_CANDIDATES
+    return min(max(k, 1), MAX_CANDIDATES)
+
+
+def load_symptom_profiles(diseases_data=None, health_data=None):
+    """
+    Merges the symptom lists of diseases.json and finalData.json into
+    {disease key: (display name, [symptom descriptions])}.
+    """
+    profiles = {}
+    for disease in (diseases_data or {}).get('disease_symptoms', []):
+        key = disease_key(disease['disease_name'])
+        profiles[key] = (disease['disease_name'], list(disease.get('common_symptoms', [])))
+    for key, sections in (health_data or {}).get('diseases', {}).items():
+        name, symptoms = profiles.get(key, (key.replace('_', ' ').title(), []))
+        for items in sections.get('symptoms', {}).values():
+            symptoms.extend(items)
+        profiles[key] = (name, symptoms)
+    return profiles
+
+
+class SymptomRanker:
+    """Ranks diseases by IDF-weighted cosine similarity between a message's symptoms and their symptom lists."""
+
+    def __init__(self, profiles):
+        self.keys = list(profiles)
+        self.names = [profiles[key][0] for key in self.keys]
+
+        # One row per disease, as the sorted term ids of its symptom list.
+        self.vocabulary = {}
+        rows = []
+        for key in self.keys:
+            terms = set()
+            for symptom in profiles[key][1]:
+                terms.update(symptom_terms(symptom))
+            rows.append(sorted(self.vocabulary.setdefault(term, len(self.vocabulary)) for term in terms))
+        self.terms = sorted(self.vocabulary, key=self.vocabulary.get)
+
+        # Column-wise storage: the diseases that list each term, contiguous per term.
+        lengths = np.array([len(row) for row in rows], dtype=np.int64)
+        term_ids = np.concatenate([np.array(row, dtype=np.int64) for row in rows]) if rows else np.zeros(0, np.int64)
+        disease_ids = np.repeat(np.arange(len(rows), dtype=np.int32), lengths)
+        order = np.argsort(term_ids, kind='stable')
+        self._rows = disease_ids[order]
+        self._offsets = np.searchsorted(term_ids[order], np.arange(len(self.vocabulary) + 1))
+
+        document_frequency = np.diff(self._offsets)
+        self.idf = np.log(1 + len(rows) / np.maximum(document_frequency, 1))
+        weights = self.idf[term_ids] ** 2 if len(term_ids) else np.zeros(0)
+        self._norms = np.sqrt(np.bincount(disease_ids, weights, minlength=len(rows)))
+        self._norms[self._norms == 0] = 1.0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def extract(self, message):
+        """Returns the known symptom terms mentioned in message."""
+        return [term for term in dict.fromkeys(symptom_terms(message)) if term in self.vocabulary]
+
+    def symptoms(self, message):
+        """
+        Returns the distinct symptom phrases in message, in order. A known pair
+        of adjacent words ('chest pain') is one phrase and absorbs its words.
+        """
+        words = [None if t in SYMPTOM_STOPWORDS or t.isdigit() else _normalize_word(t) for t in tokenize(message)]
+        phrases = []
+        i = 0
+        while i < len(words):
+            if words[i] is None:
+                i += 1
+                continue
+            pair = f"{words[i]} {words[i + 1]}" if i + 1 < len(words) and words[i + 1] is not None else None
+            if pair in self.vocabulary:
+                phrases.append(pair)
+                i += 2
+                continue
+            if words[i] in self.vocabulary:
+                phrases.append(words[i])
+            i += 1
+        return list(dict.fromkeys(phrases))
+
+    def rank(self, message, k=5, min_symptoms=1):
+        """Returns up to k Candidates for the symptoms in message, best first, or [] below min_symptoms phrases."""
+        phrases = self.symptoms(message)
+        if len(phrases) < max(min_symptoms, 1):
+            return []
+        terms = self.extract(message)
+        ids = np.array([self.vocabulary[term] for term in terms])
+        starts, ends = self._offsets[ids], self._offsets[ids + 1]
+        counts = ends - starts
+        rows = np.concatenate([self._rows[s:e] for s, e in zip(starts, ends)])
+        weights = np.repeat(self.idf[ids] ** 2, counts)
+        query_norm = math.sqrt(float(np.sum(self.idf[ids] ** 2)))
+        scores = np.bincount(rows, weights, minlength=len(self.keys)) / (self._norms * query_norm)
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k)[:k]]
+        ranked = candidates[np.argsort(-scores[candidates], kind='stable')]
+
+        postings = {term: self._rows[s:e] for term, s, e in zip(terms, starts, ends)}
+        results = []
+        for i in ranked:
+            # A phrase counts as matched if the disease lists it or any of its words.
+            matched = [phrase for phrase in phrases
+                       if any(i in postings.get(term, ()) for term in [phrase, *phrase.split()])]
+            results.append(Candidate(self.keys[i], self.names[i], round(float(scores[i]), 4), matched))
+        return results
+